@@ -0,0 +1,202 @@
+import math
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from dateutil.tz import tzlocal
+from market_hours import IST, MarketCalendar
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+# One fixed-size record per bar. Timestamps are IST wall-clock bar times, stored
+# as seconds since the epoch as if they were UTC, whatever the host's time zone.
+BAR_DTYPE = np.dtype([
+    ("ts", "<i8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<f8"),
+])
+
+# Bar length in seconds, keyed by TvDatafeed Interval value
+INTERVAL_SECONDS = {
+    "1": 60, "3": 180, "5": 300, "15": 900, "30": 1800, "45": 2700,
+    "1H": 3600, "2H": 7200, "3H": 10800, "4H": 14400,
+    "1D": 86400, "1W": 604800, "1M": 2592000,
+}
+
+BAR_STORE_DIR = "bars"
+
+# Seconds IST is ahead of UTC
+IST_OFFSET = int(IST.utcoffset(None).total_seconds())
+
+
+def exchange_seconds(epoch):
+    """A true epoch time (e.g. a streamed quote's) in the stored convention, IST wall-clock"""
+    return int(epoch) + IST_OFFSET
+
+
+def frame_to_bars(df):
+    """Convert a TvDatafeed get_hist DataFrame into a structured bar array.
+
+    TvDatafeed gives naive times in the host's local time zone; they are
+    converted to IST so stored times mean the same on every host.
+    """
+    index = pd.DatetimeIndex(df.index)
+    if index.tz is None:
+        index = index.tz_localize(tzlocal(), ambiguous=np.zeros(len(index), dtype=bool), nonexistent="shift_forward")
+    index = index.tz_convert(IST).tz_localize(None)
+    bars = np.empty(len(df), dtype=BAR_DTYPE)
+    bars["ts"] = index.values.astype("datetime64[s]").astype("i8")
+    for field in ("open", "high", "low", "close", "volume"):
+        bars[field] = df[field].to_numpy(dtype="f8")
+    return bars
+
+
+def bars_to_frame(bars):
+    """Convert a structured bar array back into a get_hist-style DataFrame"""
+    index = pd.DatetimeIndex(bars["ts"].astype("datetime64[s]"), name="datetime")
+    return pd.DataFrame({field: bars[field] for field in ("open", "high", "low", "close", "volume")}, index=index)
+
+
+@contextmanager
+def _file_lock(path):
+    """Hold an exclusive lock on path + ".lock", across threads and processes"""
+    with open(path + ".lock", "a+b") as f:
+        if os.name == "nt":
+            f.seek(0)
+            while True:
+                try:
+                    # Retries for about 10 seconds before giving up
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class BarStore:
+    """Append-only on-disk OHLCV store, one memory-mapped file per (symbol, exchange, interval).
+
+    Files hold packed BAR_DTYPE records sorted by timestamp. New bars are appended;
+    only the trailing bar, which may still have been forming when it was stored,
+    is ever rewritten. Writes hold a lock file next to the data, so shard workers
+    and the dashboard can share one store.
+    """
+
+    def __init__(self, root=BAR_STORE_DIR, calendar=None):
+        self.root = root
+        self.lock = threading.Lock()
+        # Sessions and holidays, so tail fetches only count trading time
+        self.calendar = calendar or MarketCalendar()
+
+    def path(self, symbol, exchange, interval):
+        return os.path.join(self.root, exchange, symbol, f"{interval.name}.bars")
+
+    def read(self, symbol, exchange, interval):
+        """Return every stored bar as a read-only memory map (empty array if none)"""
+        path = self.path(symbol, exchange, interval)
+        if not os.path.exists(path) or os.path.getsize(path) < BAR_DTYPE.itemsize:
+            return np.empty(0, dtype=BAR_DTYPE)
+        count = os.path.getsize(path) // BAR_DTYPE.itemsize
+        return np.memmap(path, dtype=BAR_DTYPE, mode="r", shape=(count,))
+
+    def last_bar(self, symbol, exchange, interval):
+        """Return the newest stored bar without mapping the whole file, or None"""
+        path = self.path(symbol, exchange, interval)
+        if not os.path.exists(path) or os.path.getsize(path) < BAR_DTYPE.itemsize:
+            return None
+        with open(path, "rb") as f:
+            f.seek(-BAR_DTYPE.itemsize, os.SEEK_END)
+            return np.frombuffer(f.read(BAR_DTYPE.itemsize), dtype=BAR_DTYPE)[0]
+
+    def append(self, symbol, exchange, interval, bars):
+        """Append bars newer than the stored tail, replacing the tail bar if it was re-sent"""
+        if len(bars) == 0:
+            return 0
+        bars = np.sort(bars, order="ts")
+        path = self.path(symbol, exchange, interval)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.lock, _file_lock(path):
+            last = self.last_bar(symbol, exchange, interval)
+            if last is not None:
+                bars = bars[bars["ts"] >= last["ts"]]
+                if len(bars) == 0:
+                    return 0
+            # The file may be memory-mapped by readers, and Windows refuses to
+            # truncate a mapped file, so a re-sent tail bar is overwritten in place
+            if last is not None and bars[0]["ts"] == last["ts"]:
+                with open(path, "r+b") as f:
+                    f.seek(-BAR_DTYPE.itemsize, os.SEEK_END)
+                    f.write(bars.tobytes())
+            else:
+                with open(path, "ab") as f:
+                    f.write(bars.tobytes())
+        return len(bars)
+
+    def query(self, symbol, exchange, interval, start=None, end=None):
+        """Return stored bars with start <= time <= end (datetimes or epoch seconds)"""
+        bars = self.read(symbol, exchange, interval)
+        ts = bars["ts"]
+        lo = 0 if start is None else np.searchsorted(ts, _to_seconds(start), side="left")
+        hi = len(bars) if end is None else np.searchsorted(ts, _to_seconds(end), side="right")
+        return bars[lo:hi]
+
+    def query_frame(self, symbol, exchange, interval, start=None, end=None):
+        """Same as query(), as a get_hist-style DataFrame"""
+        return bars_to_frame(self.query(symbol, exchange, interval, start, end))
+
+    def fetch_tail(self, tv, symbol, exchange, interval, initial_bars=100, max_bars=5000):
+        """Fetch only the bars missing since the stored tail, store them and return them.
+
+        Only trading time counts, so the first fetch after a night, weekend or
+        holiday is still a small delta. The tail bar is always re-fetched so a bar
+        that was still forming is completed.
+        """
+        last = self.last_bar(symbol, exchange, interval)
+        if last is None:
+            n_bars = initial_bars
+        else:
+            # Stored times are IST wall-clock times
+            since = datetime.fromtimestamp(int(last["ts"]), timezone.utc).replace(tzinfo=IST)
+            now = datetime.now(IST)
+            seconds = INTERVAL_SECONDS[interval.value]
+            if seconds < 86400:
+                elapsed = self.calendar.trading_seconds(since, now)
+            else:
+                elapsed = self.calendar.sessions_between(since, now) * 86400
+            n_bars = math.ceil(elapsed / seconds) + 1
+            n_bars = min(max(n_bars, 2), max_bars)
+        data = tv.get_hist(symbol=symbol, exchange=exchange, interval=interval, n_bars=n_bars)
+        if data is None or data.empty:
+            return np.empty(0, dtype=BAR_DTYPE)
+        bars = frame_to_bars(data)
+        self.append(symbol, exchange, interval, bars)
+        return bars
+
+
+def _to_seconds(value):
+    """Naive datetimes are treated the same way stored bar times are"""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp())
+    if isinstance(value, np.datetime64):
+        return int(value.astype("datetime64[s]").astype("i8"))
+    return int(value)
@@ -0,0 +1,470 @@
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import pandas as pd
+import requests
+from tradingview_ta import TradingView
+from bar_store import INTERVAL_SECONDS
+from stock_service import StockPipeline, BAR_HISTORY
+from watchlist import updated_now
+from nse import OITracker
+from nse_client import NSEClient
+
+# Watchlist sizes and cycles per scenario when none are given
+BENCH_SIZES = (10, 100, 1000)
+BENCH_CYCLES = 2
+# The manual (Fetch Data) path runs one stock at a time; at most this many are timed per cycle
+MANUAL_SAMPLE = 100
+SCENARIOS = ("update_excel", "auto_update_excel", "fetch_nse_oi")
+
+# Recorded responses: option_chain/<SYMBOL>.json and bars/<SYMBOL>.csv (see --record)
+FIXTURES_DIR = "bench_fixtures"
+
+
+def _seed(*parts):
+    return zlib.crc32("|".join(str(p) for p in parts).encode("utf-8"))
+
+
+def _base_price(symbol):
+    return 100 + _seed(symbol) % 4900
+
+
+def synthetic_bars(symbol, interval_seconds, n_bars):
+    """Random-walk bars for a symbol ending at the current bar"""
+    rng = np.random.default_rng(_seed(symbol, interval_seconds))
+    now = int(time.time())
+    ts = (now - now % interval_seconds) - interval_seconds * np.arange(n_bars)[::-1]
+    close = _base_price(symbol) * np.exp(np.cumsum(rng.normal(0, 0.002, n_bars)))
+    spread = close * rng.uniform(0, 0.003, n_bars)
+    return {
+        "datetime": ts.tolist(),
+        "open": (close + rng.uniform(-1, 1, n_bars) * spread).tolist(),
+        "high": (close + spread).tolist(),
+        "low": (close - spread).tolist(),
+        "close": close.tolist(),
+        "volume": rng.integers(1000, 100000, n_bars).astype(float).tolist(),
+    }
+
+
+def synthetic_option_chain(symbol, poll):
+    """An NSE-shaped option chain whose OI moves a little on every poll"""
+    rng = random.Random(_seed(symbol, poll))
+    underlying = float(_base_price(symbol) * 10)
+    step = 50 if underlying < 20000 else 100
+    atm = round(underlying / step) * step
+    today = datetime.now()
+    expiries = [(today + timedelta(days=7 * i)).strftime("%d-%b-%Y") for i in range(1, 4)]
+    records = []
+    for expiry in expiries:
+        for k in range(-20, 21):
+            strike = atm + k * step
+            record = {"expiryDate": expiry, "strikePrice": strike}
+            for side in ("CE", "PE"):
+                oi = float(rng.randint(100, 50000))
+                record[side] = {
+                    "openInterest": oi, "changeinOpenInterest": float(rng.randint(-2000, 2000)),
+                    "totalTradedVolume": float(rng.randint(0, 100000)), "impliedVolatility": rng.uniform(8, 40),
+                    "lastPrice": max(0.05, abs(underlying - strike) * 0.1 + rng.uniform(0, 50)),
+                    "change": rng.uniform(-20, 20),
+                }
+            records.append(record)
+    return {"records": {"data": records, "underlyingValue": underlying,
+                        "timestamp": today.strftime("%d-%b-%Y %H:%M:%S")}}
+
+
+def synthetic_scan(tickers, columns):
+    """A scanner response with plausible values for every requested column"""
+    data = []
+    for ticker in tickers:
+        rng = random.Random(_seed(ticker, int(time.time()) // 60))
+        base = _base_price(ticker.split(":")[-1])
+        values = []
+        for column in columns:
+            if column.startswith("Recommend."):
+                values.append(rng.uniform(-1, 1))
+            elif column.startswith("Rec."):
+                values.append(rng.choice([-1, 0, 1]))
+            else:
+                values.append(base * rng.uniform(0.9, 1.1))
+        data.append({"s": ticker, "d": values})
+    return {"data": data}
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _fault(self, endpoint):
+        """Apply latency and maybe answer with an injected failure; True if a response was sent"""
+        status = self.server.mock.fault(endpoint)
+        if status == 429:
+            self._send(429, {"error": "rate limited"}, headers={"Retry-After": "1"})
+        elif status is not None:
+            self._send(status, {"error": "injected failure"})
+        return status is not None
+
+    def do_GET(self):
+        mock = self.server.mock
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == "/option-chain":
+            mock.count("nse_cookie", 200)
+            self._send(200, b"<html></html>", "text/html", {"Set-Cookie": "nsit=bench; Path=/"})
+        elif url.path.startswith("/api/option-chain-"):
+            if not self._fault("nse_option_chain"):
+                self._send(200, mock.option_chain(query.get("symbol", "")))
+        elif url.path == "/history":
+            if not self._fault("tv_history"):
+                self._send(200, mock.bars(query.get("symbol", ""), int(query.get("interval_seconds", 60)),
+                                          int(query.get("n_bars", 1))))
+        else:
+            self._send(404, {"error": f"Unknown path {url.path}"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if urlparse(self.path).path.startswith("/scanner/"):
+            if not self._fault("tv_scanner"):
+                self._send(200, synthetic_scan(payload["symbols"]["tickers"], payload["columns"]))
+        else:
+            self._send(404, {"error": f"Unknown path {self.path}"})
+
+
+class MockServer:
+    """Local stand-in for the TradingView scanner, bar history and NSE option-chain APIs.
+
+    Recorded responses from the fixtures directory are replayed, cycling through
+    them for symbols that have none; without fixtures the data is synthetic.
+    Every request can be delayed and failed with a 5xx or a 429 at set rates, and
+    is counted per endpoint and status.
+    """
+
+    def __init__(self, fixtures_dir=FIXTURES_DIR, latency_ms=0, jitter_ms=0, error_rate=0.0, rate_429=0.0, seed=0):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        self.polls = Counter()
+        self.chain_fixtures = {}
+        for path in sorted(glob.glob(os.path.join(fixtures_dir, "option_chain", "*.json"))):
+            with open(path, encoding="utf-8") as f:
+                self.chain_fixtures[os.path.splitext(os.path.basename(path))[0]] = json.load(f)
+        self.bar_fixtures = {}
+        for path in sorted(glob.glob(os.path.join(fixtures_dir, "bars", "*.csv"))):
+            df = pd.read_csv(path, index_col=0, parse_dates=True)
+            self.bar_fixtures[os.path.splitext(os.path.basename(path))[0]] = df
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _MockHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def count(self, endpoint, status):
+        with self.lock:
+            self.counts[(endpoint, status)] += 1
+
+    def fault(self, endpoint):
+        """Sleep for the configured latency, then pick 429, 503 or None (serve normally)"""
+        with self.lock:
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            roll = self.random.random()
+        time.sleep(delay)
+        status = 429 if roll < self.rate_429 else 503 if roll < self.rate_429 + self.error_rate else None
+        self.count(endpoint, status or 200)
+        return status
+
+    def snapshot_counts(self):
+        with self.lock:
+            return Counter(self.counts)
+
+    def option_chain(self, symbol):
+        with self.lock:
+            self.polls[symbol] += 1
+            poll = self.polls[symbol]
+        if symbol in self.chain_fixtures:
+            return self.chain_fixtures[symbol]
+        if self.chain_fixtures:
+            names = sorted(self.chain_fixtures)
+            return self.chain_fixtures[names[_seed(symbol) % len(names)]]
+        return synthetic_option_chain(symbol, poll)
+
+    def bars(self, symbol, interval_seconds, n_bars):
+        if not self.bar_fixtures:
+            return synthetic_bars(symbol, interval_seconds, n_bars)
+        names = sorted(self.bar_fixtures)
+        df = self.bar_fixtures.get(symbol, self.bar_fixtures[names[_seed(symbol) % len(names)]]).tail(n_bars)
+        # Shift the recording so its last bar is the current one
+        ts = df.index.values.astype("datetime64[s]").astype("i8")
+        now = int(time.time())
+        ts = ts - ts[-1] + (now - now % interval_seconds) if len(ts) else ts
+        return {"datetime": ts.tolist(), **{field: df[field].astype(float).tolist()
+                                             for field in ("open", "high", "low", "close", "volume")}}
+
+
+class MockDatafeed:
+    """TvDatafeed-compatible get_hist() reading bars from the mock server"""
+
+    def __init__(self, url):
+        self.url = url
+        self.session = requests.Session()
+
+    def get_hist(self, symbol, exchange="NSE", interval=None, n_bars=10, **kwargs):
+        params = {"symbol": symbol, "interval_seconds": INTERVAL_SECONDS[interval.value], "n_bars": n_bars}
+        try:
+            response = self.session.get(self.url + "/history", params=params, timeout=30)
+        except requests.RequestException:
+            return None
+        if response.status_code != 200:
+            # TvDatafeed logs failures and returns None
+            return None
+        data = response.json()
+        index = pd.DatetimeIndex([datetime.fromtimestamp(t) for t in data["datetime"]], name="datetime")
+        df = pd.DataFrame({field: data[field] for field in ("open", "high", "low", "close", "volume")}, index=index)
+        df.insert(0, "symbol", f"{exchange}:{symbol}")
+        return df
+
+
+def mock_datafeed_factory(url):
+    """One MockDatafeed per thread, like get_datafeed()"""
+    local = threading.local()
+
+    def factory():
+        if not hasattr(local, "feed"):
+            local.feed = MockDatafeed(url)
+        return local.feed
+    return factory
+
+
+# Scenarios
+
+def make_pipeline(server, stocks, workdir):
+    pipeline = StockPipeline(stocks, excel_file=os.path.join(workdir, "bench.xlsx"),
+                             datafeed_factory=mock_datafeed_factory(server.url))
+    pipeline.bar_store.root = os.path.join(workdir, "bars")
+    return pipeline
+
+
+def bench_update_excel(server, stocks, cycles, workdir, warm_cache=False):
+    """The Fetch Data path: one stock at a time, bar plus a TA request per interval"""
+    pipeline = make_pipeline(server, stocks, workdir)
+    sample = stocks[:MANUAL_SAMPLE]
+    cycle_times, latencies, failed = [], [], 0
+    for _ in range(cycles):
+        if not warm_cache:
+            pipeline.cache.clear()
+        started = time.perf_counter()
+        for stock in sample:
+            t0 = time.perf_counter()
+            if pipeline.update_stock(stock) is None:
+                failed += 1
+            latencies.append(time.perf_counter() - t0)
+        cycle_times.append(time.perf_counter() - started)
+    pipeline.stop()
+    return cycle_times, latencies, failed, len(sample), pipeline.excel_store.stats()
+
+
+def bench_auto_update_excel(server, stocks, cycles, workdir, warm_cache=False):
+    """The background refresh cycle at its busiest: bars and batched TA for the whole watchlist,
+    as when every stock is due"""
+    pipeline = make_pipeline(server, stocks, workdir)
+    published = {}
+    since = [None]
+
+    def on_row(row):
+        # Rows served from the previous cycle after a failure keep their older "Updated" time
+        if row["Updated"] and row["Updated"] >= since[0]:
+            published.setdefault(row["stock"], time.perf_counter())
+    pipeline.subscribe(on_row)
+    cycle_times, latencies, failed = [], [], 0
+    for _ in range(cycles):
+        if not warm_cache:
+            pipeline.cache.clear()
+        published.clear()
+        since[0] = updated_now()
+        started = time.perf_counter()
+        pipeline.refresh_cycle(pipeline.plan_all())
+        cycle_times.append(time.perf_counter() - started)
+        # A stock's latency is how long into the cycle its row was published
+        latencies += [t - started for t in published.values()]
+        failed += len(stocks) - len(published)
+    pipeline.stop()
+    return cycle_times, latencies, failed, len(stocks), pipeline.excel_store.stats()
+
+
+def bench_fetch_nse_oi(server, symbols, cycles, workdir, warm_cache=False):
+    """Option-chain polling: parallel fetches over the pooled client, then parse and diff"""
+    client = NSEClient(base_url=server.url)
+    timings = {}
+    fetch = client.fetch_option_chain
+
+    def timed_fetch(symbol):
+        t0 = time.perf_counter()
+        try:
+            return fetch(symbol)
+        finally:
+            timings[symbol] = time.perf_counter() - t0
+    client.fetch_option_chain = timed_fetch
+
+    tracker = OITracker(symbols, client=client)
+    cycle_times, latencies, failed = [], [], 0
+    for _ in range(cycles):
+        timings.clear()
+        started = time.perf_counter()
+        chains = tracker.fetch_nse_oi()
+        tracker.update(chains)
+        cycle_times.append(time.perf_counter() - started)
+        latencies += list(timings.values())
+        failed += len(symbols) - len(chains)
+    return cycle_times, latencies, failed, len(symbols), None
+
+
+SCENARIO_FUNCTIONS = {
+    "update_excel": bench_update_excel,
+    "auto_update_excel": bench_auto_update_excel,
+    "fetch_nse_oi": bench_fetch_nse_oi,
+}
+
+
+def run_scenario(server, name, size, cycles, warm_cache=False):
+    """Run one scenario at one watchlist size and summarize it"""
+    symbols = [f"SYM{i:04d}" for i in range(size)]
+    before = server.snapshot_counts()
+    tracemalloc.start()
+    with tempfile.TemporaryDirectory(prefix="bench_") as workdir:
+        cycle_times, latencies, failed, timed, write_stats = SCENARIO_FUNCTIONS[name](
+            server, symbols, cycles, workdir, warm_cache)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    counts = server.snapshot_counts() - before
+
+    requests_per_cycle = Counter()
+    for (endpoint, _), n in counts.items():
+        requests_per_cycle[endpoint] += n / cycles
+    result = {
+        "scenario": name,
+        "symbols": size,
+        "symbols_timed": timed,
+        "cycles": cycles,
+        "cycle_seconds": [round(t, 4) for t in cycle_times],
+        "cycle_seconds_mean": round(float(np.mean(cycle_times)), 4),
+        "symbol_latency_p50": round(float(np.percentile(latencies, 50)), 4) if latencies else None,
+        "symbol_latency_p99": round(float(np.percentile(latencies, 99)), 4) if latencies else None,
+        "symbols_failed_per_cycle": failed / cycles,
+        "requests_per_cycle": {endpoint: round(n, 1) for endpoint, n in sorted(requests_per_cycle.items())},
+        "responses_429": sum(n for (_, status), n in counts.items() if status == 429),
+        "responses_5xx": sum(n for (_, status), n in counts.items() if status >= 500),
+        "peak_python_memory_bytes": peak_memory,
+    }
+    if write_stats is not None:
+        result["workbook_writes"] = write_stats["writes"]
+        result["workbook_write_seconds_total"] = round(write_stats["write_time_total"], 4)
+        result["workbook_write_seconds_max"] = round(write_stats["write_time_max"], 4)
+    return result
+
+
+def record_fixtures(symbols, nse_symbols, fixtures_dir=FIXTURES_DIR):
+    """Save live bar and option-chain responses for the mock server to replay"""
+    from stock_service import get_datafeed, INTERVALS
+    from nse_client import get_client
+
+    os.makedirs(os.path.join(fixtures_dir, "bars"), exist_ok=True)
+    os.makedirs(os.path.join(fixtures_dir, "option_chain"), exist_ok=True)
+    for symbol in symbols:
+        try:
+            df = get_datafeed().get_hist(symbol=symbol, exchange="NSE", interval=INTERVALS["1 Minute"][0],
+                                         n_bars=BAR_HISTORY)
+            if df is not None and not df.empty:
+                df.to_csv(os.path.join(fixtures_dir, "bars", f"{symbol}.csv"))
+        except Exception as e:
+            print(f"Error recording bars for {symbol}: {e}")
+    for symbol in nse_symbols:
+        try:
+            with open(os.path.join(fixtures_dir, "option_chain", f"{symbol}.json"), "w", encoding="utf-8") as f:
+                json.dump(get_client().fetch_option_chain(symbol), f)
+        except Exception as e:
+            print(f"Error recording option chain for {symbol}: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the stock and NSE pipelines against a local mock server")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(BENCH_SIZES), help="watchlist sizes")
+    parser.add_argument("--cycles", type=int, default=BENCH_CYCLES)
+    parser.add_argument("--latency-ms", type=float, default=20, help="mean mock response latency")
+    parser.add_argument("--jitter-ms", type=float, default=10, help="+/- latency jitter")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 503")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of requests answered 429")
+    parser.add_argument("--warm-cache", action="store_true", help="keep the response cache between cycles")
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="directory of recorded responses")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--record", action="store_true",
+                        help="record live responses for --symbols/--nse-symbols into --fixtures and exit")
+    parser.add_argument("--symbols", nargs="*", default=["RELIANCE", "TCS", "INFY"])
+    parser.add_argument("--nse-symbols", nargs="*", default=["NIFTY", "BANKNIFTY"])
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixtures(args.symbols, args.nse_symbols, args.fixtures)
+        return
+
+    server = MockServer(args.fixtures, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                        error_rate=args.error_rate, rate_429=args.rate_429)
+    server.start()
+    # Point the TradingView scanner client at the mock
+    TradingView.scan_url = server.url + "/scanner/"
+    report = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "config": {key: value for key, value in vars(args).items() if key not in ("record", "output")},
+        "results": [],
+    }
+    try:
+        for name in args.scenarios:
+            for size in args.sizes:
+                print(f"Running {name} with {size} symbols...", file=sys.stderr, flush=True)
+                report["results"].append(run_scenario(server, name, size, args.cycles, args.warm_cache))
+    finally:
+        server.stop()
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+if __name__ == "__main__":
+    main()
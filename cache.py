@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class TTLCache:
+    """Thread-safe LRU cache with a TTL per entry and de-duplication of in-flight loads.
+
+    When several threads ask for the same missing key, only one of them runs the
+    loader; the others wait for its result. None results are handed to every
+    waiter but never cached.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "deduplicated": 0, "load_errors": 0}
+
+    def _lookup(self, key, now):
+        """Cached value and True, or (None, False); caller holds the lock"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None, False
+        expires_at, value = entry
+        if expires_at <= now:
+            del self.entries[key]
+            self.counters["expired"] += 1
+            return None, False
+        self.entries.move_to_end(key)
+        return value, True
+
+    def _store(self, key, value, ttl, now):
+        self.entries[key] = (now + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def get_many_or_load(self, keys, ttl, loader):
+        """Return {key: value} for keys, calling loader(missing_keys) -> {key: value} once for the misses.
+
+        Keys another thread is already loading are waited on instead of loaded again.
+        """
+        results, waiting, owned = {}, {}, {}
+        now = time.monotonic()
+        with self.lock:
+            for key in keys:
+                value, hit = self._lookup(key, now)
+                if hit:
+                    self.counters["hits"] += 1
+                    results[key] = value
+                elif key in self.in_flight:
+                    self.counters["deduplicated"] += 1
+                    waiting[key] = self.in_flight[key]
+                elif key not in owned:
+                    self.counters["misses"] += 1
+                    owned[key] = self.in_flight[key] = Future()
+
+        if owned:
+            try:
+                loaded = loader(list(owned))
+            except Exception as e:
+                with self.lock:
+                    self.counters["load_errors"] += 1
+                    for key, future in owned.items():
+                        self.in_flight.pop(key, None)
+                for future in owned.values():
+                    future.set_exception(e)
+                raise
+            now = time.monotonic()
+            with self.lock:
+                for key in owned:
+                    value = loaded.get(key)
+                    if value is not None:
+                        self._store(key, value, ttl, now)
+                    self.in_flight.pop(key, None)
+            for key, future in owned.items():
+                results[key] = loaded.get(key)
+                future.set_result(results[key])
+
+        for key, future in waiting.items():
+            results[key] = future.result()
+        return results
+
+    def get_or_load(self, key, ttl, loader):
+        """Single-key form of get_many_or_load; loader() takes no arguments"""
+        return self.get_many_or_load([key], ttl, lambda missing: {key: loader()})[key]
+
+    def put(self, key, value, ttl):
+        """Store a value loaded outside get_or_load, e.g. by a hedged fetch"""
+        with self.lock:
+            self._store(key, value, ttl, time.monotonic())
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """Counters plus the current size and hit ratio"""
+        with self.lock:
+            stats = dict(self.counters)
+            stats["size"] = len(self.entries)
+        lookups = stats["hits"] + stats["misses"] + stats["deduplicated"]
+        stats["hit_ratio"] = (stats["hits"] + stats["deduplicated"]) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,125 @@
+import os
+import tempfile
+import time
+from openpyxl import Workbook, load_workbook
+from sinks import BatchWriter
+from watchlist import load_rows, write_sidecar
+from watchlist_model import WatchlistModel
+
+
+class ExcelStore(BatchWriter):
+    """Keeps the stock sheet in step with a WatchlistModel, writing changed rows in batches.
+
+    Rows are only ever updated in the model. A background writer picks up the rows
+    changed since its last successful write, applies them to the cached workbook
+    cell by cell and swaps the file in atomically, at most once every
+    flush_interval seconds. If the file is locked (e.g. open in Excel) nothing is
+    marked written and the flush is simply retried on the next interval. Each
+    write also refreshes the JSON sidecar, so the next start does not have to
+    parse the workbook.
+    """
+
+    name = "excel"
+
+    def __init__(self, path, columns, model=None, flush_interval=5, on_locked=None):
+        super().__init__(flush_interval)
+        self.path = path
+        self.columns = list(columns)
+        self.model = model if model is not None else WatchlistModel()
+        self.on_locked = on_locked
+        # Model version of the last successful write
+        self.written_version = 0
+        self.workbook = None
+        self.row_numbers = {}
+        self.loaded_mtime = None
+        self.locked = False
+        self.load()
+        self.start()
+
+    def load(self):
+        """Read the sheet's rows into the model unless it already holds them; the workbook
+        itself is only opened for the first write"""
+        if not len(self.model):
+            self.model.load(load_rows(self.path))
+        self.written_version = self.model.version
+
+    def _flush(self):
+        """Write all dirty rows in one atomic file replace. Returns False if the file was locked."""
+        slots, version = self.model.changed_since(self.written_version)
+        if not len(slots):
+            return True
+        dirty = {row["stock"]: row for row in self.model.rows(slots, self.columns)}
+        # The sheet as it will be once these rows are written
+        written = self.model.rows(columns=self.columns)
+        started = time.perf_counter()
+        try:
+            self._write(dirty)
+        except PermissionError:
+            if not self.locked and self.on_locked:
+                self.on_locked()
+            self.locked = True
+            return False
+        except Exception as e:
+            print(f"Error writing {self.path}: {e}")
+            return False
+        # Rows updated while this write ran have newer versions and stay pending
+        self.written_version = version
+        self.record(len(dirty), time.perf_counter() - started)
+        self.locked = False
+        try:
+            write_sidecar(self.path, written)
+        except Exception as e:
+            print(f"Error writing the sidecar of {self.path}: {e}")
+        return True
+
+    def pending(self):
+        return len(self.model.changed_since(self.written_version)[0])
+
+    def _workbook_for_write(self):
+        """Return the cached workbook, reloading it if someone else changed the file"""
+        if os.path.exists(self.path):
+            if self.workbook is None or os.path.getmtime(self.path) != self.loaded_mtime:
+                self.workbook = load_workbook(self.path)
+                ws = self.workbook.active
+                stock_col = [cell.value for cell in ws[1]].index("stock") + 1
+                self.row_numbers = {
+                    ws.cell(row=r, column=stock_col).value: r for r in range(2, ws.max_row + 1)
+                }
+        elif self.workbook is None:
+            self.workbook = Workbook()
+            self.workbook.active.append(self.columns)
+            self.row_numbers = {}
+        return self.workbook
+
+    def _write(self, dirty):
+        wb = self._workbook_for_write()
+        ws = wb.active
+        header = [cell.value for cell in ws[1]]
+        for col in self.columns:
+            if col not in header:
+                header.append(col)
+                ws.cell(row=1, column=len(header), value=col)
+        col_numbers = {col: header.index(col) + 1 for col in self.columns}
+
+        # Only cells whose value actually changed are touched
+        for stock, row in dirty.items():
+            row_number = self.row_numbers.get(stock)
+            if row_number is None:
+                row_number = ws.max_row + 1
+                self.row_numbers[stock] = row_number
+            for col, value in row.items():
+                cell = ws.cell(row=row_number, column=col_numbers[col])
+                if cell.value != value:
+                    cell.value = value
+
+        # Save next to the target so the final replace is atomic
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(suffix=".xlsx", dir=directory)
+        os.close(fd)
+        try:
+            wb.save(temp_path)
+            os.replace(temp_path, self.path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self.loaded_mtime = os.path.getmtime(self.path)
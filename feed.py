@@ -0,0 +1,256 @@
+import json
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, quote
+from metrics import METRICS
+
+FEED_HOST = "127.0.0.1"
+FEED_PORT = 8765
+
+# Idle streams get a comment line this often (seconds) so both ends notice dead connections
+HEARTBEAT_INTERVAL = 15
+# Events buffered per subscriber; a viewer further behind than this is disconnected
+CLIENT_QUEUE_SIZE = 1000
+# Viewer reconnect backoff (seconds)
+RECONNECT_DELAY = 1
+MAX_RECONNECT_DELAY = 30
+
+
+def _json_default(value):
+    # NumPy scalars and the like
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def encode_event(event, data):
+    """One Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, default=_json_default)}\n\n".encode("utf-8")
+
+
+class _Subscriber:
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self.closed = threading.Event()
+
+
+class _FeedHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, default=_json_default).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        feed = self.server.feed
+        path = urlparse(self.path).path
+        if path == "/stream":
+            self._stream(feed)
+        elif path == "/snapshot":
+            self._send_json(200, feed.pipeline.snapshot())
+        elif path == "/metrics":
+            body = METRICS.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, {"error": f"Unknown path {path}"})
+
+    def do_POST(self):
+        feed = self.server.feed
+        url = urlparse(self.path)
+        if url.path != "/fetch":
+            self._send_json(404, {"error": f"Unknown path {url.path}"})
+            return
+        stock = parse_qs(url.query).get("stock", [None])[0]
+        if not stock:
+            self._send_json(400, {"error": "stock is required"})
+            return
+        # The refreshed row also goes out on every stream
+        row = feed.pipeline.update_stock(stock)
+        if row is None:
+            self._send_json(502, {"error": f"No data fetched for {stock}"})
+        else:
+            self._send_json(200, row)
+
+    def _stream(self, feed):
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        # Register before taking the snapshot so no update falls between the two
+        subscriber = feed.add_subscriber()
+        try:
+            self.wfile.write(encode_event("snapshot", feed.pipeline.snapshot()))
+            self.wfile.flush()
+            while not subscriber.closed.is_set():
+                try:
+                    payload = subscriber.queue.get(timeout=HEARTBEAT_INTERVAL)
+                except queue.Empty:
+                    payload = b": keepalive\n\n"
+                self.wfile.write(payload)
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError, OSError):
+            pass
+        finally:
+            feed.remove_subscriber(subscriber)
+
+
+class FeedServer:
+    """Streams a StockPipeline's rows to any number of viewers over HTTP.
+
+    GET /stream is a Server-Sent Events stream: a "snapshot" event with every
+    current row, then a "row" event per update. GET /snapshot returns the rows as
+    JSON, GET /metrics the pipeline metrics in Prometheus text format, and POST
+    /fetch?stock=X refreshes one stock on demand. Each viewer has
+    its own bounded queue, so a slow one is dropped instead of holding up the
+    pipeline; it reconnects to a fresh snapshot.
+    """
+
+    def __init__(self, pipeline, host=FEED_HOST, port=FEED_PORT):
+        self.pipeline = pipeline
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), _FeedHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.feed = self
+        self.port = self.httpd.server_address[1]
+        self.thread = None
+        pipeline.subscribe(self.broadcast)
+        METRICS.add_collector("feed", lambda: {"viewers": len(self.subscribers)})
+
+    def add_subscriber(self):
+        subscriber = _Subscriber()
+        with self.lock:
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def remove_subscriber(self, subscriber):
+        subscriber.closed.set()
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def broadcast(self, row):
+        """Queue a row for every connected viewer; called from pipeline threads"""
+        payload = encode_event("row", row)
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait(payload)
+            except queue.Full:
+                print("Feed viewer fell behind; disconnecting it")
+                METRICS.inc("feed_viewers_dropped_total")
+                self.remove_subscriber(subscriber)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.pipeline.unsubscribe(self.broadcast)
+        METRICS.remove_collector("feed")
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            self.remove_subscriber(subscriber)
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FeedClient:
+    """Subscribes to a FeedServer and calls on_row(row) for every row it streams.
+
+    The stream runs on a background thread and reconnects with backoff whenever
+    the connection drops; each reconnect starts with a full snapshot.
+    """
+
+    def __init__(self, url, on_row, timeout=HEARTBEAT_INTERVAL * 2 + 5):
+        self.url = url.rstrip("/")
+        self.on_row = on_row
+        self.timeout = timeout
+        self.connected = False
+        self.received = 0
+        self.running = False
+        self.thread = None
+
+    def snapshot(self):
+        """Current rows from the server"""
+        with urllib.request.urlopen(self.url + "/snapshot", timeout=self.timeout) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+    def fetch(self, stock):
+        """Ask the server to refresh one stock now; returns its row, or None if it could not be fetched"""
+        request = urllib.request.Request(f"{self.url}/fetch?stock={quote(stock)}", data=b"", method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            if e.code == 502:
+                return None
+            raise
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def _run(self):
+        delay = RECONNECT_DELAY
+        while self.running:
+            try:
+                with urllib.request.urlopen(self.url + "/stream", timeout=self.timeout) as response:
+                    self.connected = True
+                    delay = RECONNECT_DELAY
+                    self._read_events(response)
+            except Exception as e:
+                if self.running:
+                    print(f"Error reading feed {self.url}: {e}")
+            self.connected = False
+            if self.running:
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    def _read_events(self, response):
+        event, data = "message", []
+        for raw in response:
+            if not self.running:
+                return
+            line = raw.decode("utf-8").rstrip("\r\n")
+            if not line:
+                if data:
+                    self._dispatch(event, "\n".join(data))
+                event, data = "message", []
+            elif line.startswith(":"):
+                continue
+            else:
+                field, _, value = line.partition(":")
+                value = value[1:] if value.startswith(" ") else value
+                if field == "event":
+                    event = value
+                elif field == "data":
+                    data.append(value)
+
+    def _dispatch(self, event, data):
+        payload = json.loads(data)
+        rows = payload if event == "snapshot" else [payload]
+        for row in rows:
+            self.received += 1
+            self.on_row(row)
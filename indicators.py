@@ -0,0 +1,301 @@
+import threading
+import warnings
+import numpy as np
+
+# Ring buffer length per symbol; must cover the longest window (SMA 200)
+WINDOW = 210
+
+MA_PERIODS = (10, 20, 30, 50, 100, 200)
+OSCILLATORS = ("RSI", "STOCH.K", "CCI", "MOM", "MACD", "W.R", "AO")
+MOVING_AVERAGES = tuple(f"EMA{p}" for p in MA_PERIODS) + tuple(f"SMA{p}" for p in MA_PERIODS)
+
+# Signal codes, and thresholds on the averaged rating (-1..1) TradingView uses
+BUY, NEUTRAL, SELL = 1, 0, -1
+RECOMMENDATIONS = np.array(["STRONG_SELL", "SELL", "NEUTRAL", "BUY", "STRONG_BUY"], dtype=object)
+RATING_EDGES = np.array([-0.5, -0.1, 0.1, 0.5])
+
+
+def rating_to_recommendation(rating):
+    """Map ratings in [-1, 1] to TradingView recommendation strings (None where NaN)"""
+    rating = np.asarray(rating, dtype="f8")
+    # Edges belong to the bucket nearer zero: -0.5 is SELL, 0.1 NEUTRAL, 0.5 BUY
+    buckets = np.where(rating < 0,
+                       np.searchsorted(RATING_EDGES, rating, side="right"),
+                       np.searchsorted(RATING_EDGES, rating, side="left"))
+    result = RECOMMENDATIONS[np.clip(buckets, 0, 4)]
+    result[np.isnan(rating)] = None
+    return result
+
+
+class IndicatorEngine:
+    """Incremental TradingView-style indicators for many symbols at once.
+
+    Each row of the state arrays is one symbol. push() commits one closed bar per
+    symbol (NaN or a False mask entry skips a symbol) in O(symbols x window) work,
+    and evaluate() scores a still-forming bar against the committed state without
+    changing it. Rules follow tradingview_ta's Compute helpers.
+    """
+
+    SERIES = ("high", "low", "close", "tp", "hl2")
+
+    def __init__(self, symbols, window=WINDOW):
+        self.symbols = list(symbols)
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.window = window
+        n = len(self.symbols)
+        self.buffers = {name: np.zeros((n, window)) for name in self.SERIES}
+        self.pos = np.zeros(n, dtype=np.int64)
+        self.count = np.zeros(n, dtype=np.int64)
+        self.state = {name: np.full(n, np.nan) for name in self._state_names()}
+
+    @staticmethod
+    def _state_names():
+        names = [f"ema{p}" for p in MA_PERIODS]
+        names += ["ema12", "ema26", "macd_signal", "rsi_gain", "rsi_loss",
+                  "raw_k1", "raw_k2", "k1", "k2", "d1", "rsi1", "cci1", "wr1", "mom1", "ao1", "ao2"]
+        return names
+
+    def _last(self, name, k):
+        """Last k committed values of a series per symbol, oldest first, shape (n, k)"""
+        idx = (self.pos[:, None] - k + np.arange(k)) % self.window
+        return np.take_along_axis(self.buffers[name], idx, axis=1)
+
+    def _window(self, name, k, new):
+        """Window of k values ending with the candidate bar"""
+        if k == 1:
+            return new[:, None]
+        return np.concatenate([self._last(name, k - 1), new[:, None]], axis=1)
+
+    def _compute(self, high, low, close):
+        """Indicator values and next state for a candidate bar, without committing it"""
+        s = self.state
+        count = self.count
+        seen = count + 1
+        tp = (high + low + close) / 3
+        hl2 = (high + low) / 2
+        prev_close = self._last("close", 1)[:, 0]
+        values, nxt = {}, {}
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # Moving averages
+            for p in MA_PERIODS:
+                alpha = 2 / (p + 1)
+                prev = s[f"ema{p}"]
+                nxt[f"ema{p}"] = np.where(count == 0, close, prev + alpha * (close - prev))
+                values[f"EMA{p}"] = np.where(seen >= p, nxt[f"ema{p}"], np.nan)
+                values[f"SMA{p}"] = np.where(seen >= p, self._window("close", p, close).mean(axis=1), np.nan)
+
+            # MACD (12, 26, 9)
+            for p in (12, 26):
+                prev = s[f"ema{p}"]
+                nxt[f"ema{p}"] = np.where(count == 0, close, prev + 2 / (p + 1) * (close - prev))
+            macd = nxt["ema12"] - nxt["ema26"]
+            prev = s["macd_signal"]
+            nxt["macd_signal"] = np.where(count == 0, macd, prev + 0.2 * (macd - prev))
+            ready = seen >= 26 + 9
+            values["MACD.macd"] = np.where(ready, macd, np.nan)
+            values["MACD.signal"] = np.where(ready, nxt["macd_signal"], np.nan)
+
+            # RSI (14), simple average for the first 14 changes then Wilder smoothing
+            delta = np.where(count > 0, close - prev_close, 0.0)
+            n_eff = np.clip(count, 1, 14)
+            for name, move in (("rsi_gain", np.maximum(delta, 0)), ("rsi_loss", np.maximum(-delta, 0))):
+                prev = np.nan_to_num(s[name])
+                nxt[name] = np.where(count > 0, prev + (move - prev) / n_eff, 0.0)
+            rs = nxt["rsi_gain"] / nxt["rsi_loss"]
+            rsi = np.where(nxt["rsi_loss"] == 0, 100.0, 100 - 100 / (1 + rs))
+            values["RSI"] = np.where(count >= 14, rsi, np.nan)
+
+            # Stochastic (14, 3, 3) and Williams %R (14)
+            hh = self._window("high", 14, high).max(axis=1)
+            ll = self._window("low", 14, low).min(axis=1)
+            raw_k = np.where(hh == ll, 50.0, 100 * (close - ll) / (hh - ll))
+            k = (s["raw_k2"] + s["raw_k1"] + raw_k) / 3
+            d = (s["k2"] + s["k1"] + k) / 3
+            nxt.update(raw_k2=s["raw_k1"], raw_k1=raw_k, k2=s["k1"], k1=k, d1=d)
+            values["STOCH.K"] = np.where(seen >= 14 + 4, k, np.nan)
+            values["STOCH.D"] = np.where(seen >= 14 + 4, d, np.nan)
+            wr = np.where(hh == ll, -50.0, -100 * (hh - close) / (hh - ll))
+            values["W.R"] = np.where(seen >= 14, wr, np.nan)
+
+            # CCI (20)
+            tp_window = self._window("tp", 20, tp)
+            tp_mean = tp_window.mean(axis=1)
+            mean_dev = np.abs(tp_window - tp_mean[:, None]).mean(axis=1)
+            cci = np.where(mean_dev == 0, 0.0, (tp - tp_mean) / (0.015 * mean_dev))
+            values["CCI"] = np.where(seen >= 20, cci, np.nan)
+
+            # Momentum (10) and Awesome Oscillator (5, 34)
+            mom = close - self._last("close", 10)[:, 0]
+            values["MOM"] = np.where(seen > 10, mom, np.nan)
+            ao = self._window("hl2", 5, hl2).mean(axis=1) - self._window("hl2", 34, hl2).mean(axis=1)
+            values["AO"] = np.where(seen >= 34, ao, np.nan)
+
+        nxt.update(rsi1=values["RSI"], cci1=values["CCI"], wr1=values["W.R"], mom1=values["MOM"],
+                   ao1=values["AO"], ao2=s["ao1"])
+        values["close"] = close
+        return values, nxt, {"high": high, "low": low, "close": close, "tp": tp, "hl2": hl2}
+
+    def _signals(self, values):
+        """Per-indicator BUY/SELL/NEUTRAL codes, NaN where an indicator is not ready yet"""
+        s = self.state
+        close = values["close"]
+        signals = {}
+        with np.errstate(invalid="ignore"):
+            for name in MOVING_AVERAGES:
+                ma = values[name]
+                signals[name] = np.where(ma < close, BUY, np.where(ma > close, SELL, NEUTRAL))
+
+            rsi, rsi1 = values["RSI"], s["rsi1"]
+            signals["RSI"] = np.select([(rsi < 30) & (rsi1 < rsi), (rsi > 70) & (rsi1 > rsi)], [BUY, SELL], NEUTRAL)
+
+            k, d, k1, d1 = values["STOCH.K"], values["STOCH.D"], s["k1"], s["d1"]
+            signals["STOCH.K"] = np.select(
+                [(k < 20) & (d < 20) & (k > d) & (k1 < d1), (k > 80) & (d > 80) & (k < d) & (k1 > d1)],
+                [BUY, SELL], NEUTRAL)
+
+            cci, cci1 = values["CCI"], s["cci1"]
+            signals["CCI"] = np.select([(cci < -100) & (cci > cci1), (cci > 100) & (cci < cci1)], [BUY, SELL], NEUTRAL)
+
+            mom, mom1 = values["MOM"], s["mom1"]
+            signals["MOM"] = np.select([mom > mom1, mom < mom1], [BUY, SELL], NEUTRAL)
+
+            macd, signal = values["MACD.macd"], values["MACD.signal"]
+            signals["MACD"] = np.select([macd > signal, macd < signal], [BUY, SELL], NEUTRAL)
+
+            wr, wr1 = values["W.R"], s["wr1"]
+            signals["W.R"] = np.select([(wr < -80) & (wr > wr1), (wr > -20) & (wr < wr1)], [BUY, SELL], NEUTRAL)
+
+            ao, ao1, ao2 = values["AO"], s["ao1"], s["ao2"]
+            signals["AO"] = np.select(
+                [((ao > 0) & (ao1 < 0)) | ((ao > 0) & (ao1 > 0) & (ao > ao1) & (ao2 > ao1)),
+                 ((ao < 0) & (ao1 > 0)) | ((ao < 0) & (ao1 < 0) & (ao < ao1) & (ao2 < ao1))],
+                [BUY, SELL], NEUTRAL)
+
+        # Indicators that are still warming up, or symbols without a bar, do not vote
+        ready_key = {"MACD": "MACD.macd"}
+        for name in signals:
+            missing = np.isnan(values[ready_key.get(name, name)]) | np.isnan(close)
+            signals[name] = np.where(missing, np.nan, signals[name])
+        return signals
+
+    def summarize(self, signals):
+        """Summary dict like TA_Handler's: RECOMMENDATION array plus BUY/SELL/NEUTRAL counts"""
+        osc = np.stack([signals[name] for name in OSCILLATORS], axis=1)
+        ma = np.stack([signals[name] for name in MOVING_AVERAGES], axis=1)
+        votes = np.concatenate([osc, ma], axis=1)
+        with warnings.catch_warnings():
+            # nanmean warns on symbols with no ready indicators; those rate as NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+            rating = (np.nanmean(osc, axis=1) + np.nanmean(ma, axis=1)) / 2
+        return {
+            "RECOMMENDATION": rating_to_recommendation(rating),
+            "BUY": (votes == BUY).sum(axis=1),
+            "SELL": (votes == SELL).sum(axis=1),
+            "NEUTRAL": (votes == NEUTRAL).sum(axis=1),
+        }
+
+    def push(self, high, low, close, mask=None):
+        """Commit one closed bar per symbol and return the summary for it"""
+        high, low, close = (np.asarray(a, dtype="f8") for a in (high, low, close))
+        if mask is None:
+            mask = ~np.isnan(close)
+        values, nxt, series = self._compute(high, low, close)
+        summary = self.summarize(self._signals(values))
+
+        for name, new in nxt.items():
+            self.state[name] = np.where(mask, new, self.state[name])
+        rows = np.nonzero(mask)[0]
+        for name, new in series.items():
+            self.buffers[name][rows, self.pos[rows]] = new[rows]
+        self.pos[rows] = (self.pos[rows] + 1) % self.window
+        self.count[rows] += 1
+        return summary
+
+    def evaluate(self, high, low, close):
+        """Summary for a forming bar per symbol; committed state is left untouched"""
+        high, low, close = (np.asarray(a, dtype="f8") for a in (high, low, close))
+        values, _, _ = self._compute(high, low, close)
+        return self.summarize(self._signals(values))
+
+    def seed(self, high, low, close):
+        """Warm up from 2-D (symbols x bars) history, right-aligned with NaN padding on the left"""
+        high, low, close = (np.asarray(a, dtype="f8") for a in (high, low, close))
+        for t in range(close.shape[1]):
+            self.push(high[:, t], low[:, t], close[:, t])
+
+
+def stack_bars(bar_arrays, field, length=None):
+    """Right-align per-symbol bar arrays into one (symbols x bars) matrix padded with NaN"""
+    length = length if length is not None else max((len(b) for b in bar_arrays), default=0)
+    matrix = np.full((len(bar_arrays), length), np.nan)
+    for row, bars in enumerate(bar_arrays):
+        values = np.asarray(bars[field][-length:], dtype="f8") if length else np.empty(0)
+        if len(values):
+            matrix[row, -len(values):] = values
+    return matrix
+
+
+class LocalTA:
+    """Keeps one IndicatorEngine per interval in sync with the bar store.
+
+    Every stored bar except the newest is treated as closed and committed once;
+    the newest bar is still forming and is only evaluated.
+    """
+
+    def __init__(self, bar_store, symbols, exchange="NSE"):
+        self.bar_store = bar_store
+        self.symbols = list(symbols)
+        self.exchange = exchange
+        self.engines = {}
+        self.committed_ts = {}
+        self.lock = threading.Lock()
+
+    def recommendations(self, interval):
+        """Return {symbol: recommendation} for one TvDatafeed interval from stored bars"""
+        with self.lock:
+            engine = self.engines.get(interval)
+            committed = self.committed_ts.setdefault(interval, {})
+            if engine is None:
+                engine = self.engines[interval] = IndicatorEngine(self.symbols)
+                start = {symbol: None for symbol in self.symbols}
+            else:
+                start = {symbol: committed.get(symbol) for symbol in self.symbols}
+
+            new_bars = []
+            for symbol in self.symbols:
+                after = start[symbol]
+                bars = self.bar_store.query(symbol, self.exchange, interval,
+                                            start=None if after is None else after + 1)
+                if after is None:
+                    bars = bars[-(engine.window + 1):]
+                new_bars.append(bars)
+
+            # Commit newly closed bars, one column per step across all symbols
+            closed = [bars[:-1] for bars in new_bars]
+            if any(len(bars) for bars in closed):
+                engine.seed(*(stack_bars(closed, field) for field in ("high", "low", "close")))
+            for symbol, bars in zip(self.symbols, closed):
+                if len(bars):
+                    committed[symbol] = int(bars["ts"][-1])
+
+            forming = [bars[-1:] for bars in new_bars]
+            summary = engine.evaluate(*(stack_bars(forming, field, 1)[:, 0] for field in ("high", "low", "close")))
+            return {symbol: summary["RECOMMENDATION"][i] for i, symbol in enumerate(self.symbols)}
+
+
+def compare_recommendations(local, remote):
+    """Agreement between local and remote {symbol: recommendation} maps.
+
+    Returns (exact agreement ratio, direction agreement ratio, mismatches), where
+    direction only compares the BUY/SELL/NEUTRAL side of each recommendation.
+    """
+    def side(rec):
+        return rec.replace("STRONG_", "") if rec else rec
+
+    common = [s for s in remote if remote[s] is not None and local.get(s) is not None]
+    if not common:
+        return None, None, {}
+    mismatches = {s: (local[s], remote[s]) for s in common if local[s] != remote[s]}
+    direction = sum(side(local[s]) == side(remote[s]) for s in common)
+    return 1 - len(mismatches) / len(common), direction / len(common), mismatches
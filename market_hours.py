@@ -0,0 +1,224 @@
+import math
+import os
+import threading
+import time
+from datetime import date, datetime, time as dtime, timedelta, timezone
+
+# NSE trades in IST, which has no daylight saving time
+IST = timezone(timedelta(hours=5, minutes=30), "IST")
+# Normal equity session
+SESSION_OPEN = dtime(9, 15)
+SESSION_CLOSE = dtime(15, 30)
+# Exchange holidays: one YYYY-MM-DD per line, anything after the date is ignored
+HOLIDAYS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nse_holidays.txt")
+
+# Bar length per interval (seconds); None is one bar per session
+BAR_SECONDS = {"1 Minute": 60, "15 Minute": 900, "1 Hour": 3600, "1 Day": None}
+
+# Seconds to wait after a bar closes before fetching it, so the data source has it
+BAR_CLOSE_DELAY = 2
+# Longest sleep between cycles outside sessions (seconds), so a changed clock or a
+# machine waking from suspend is noticed; cycles with nothing due fetch nothing
+IDLE_RECHECK = 300
+# Stocks neither on screen nor moving are polled at most this often (seconds)
+QUIET_REFRESH = 300
+# Relative price change since a stock's last poll that makes it count as moving
+MOVING_THRESHOLD = 0.001
+
+
+def load_holidays(path=HOLIDAYS_FILE):
+    """Dates listed in a holidays file; a missing file means weekends are the only closures"""
+    holidays = set()
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                text = line.split("#", 1)[0].strip()
+                if not text:
+                    continue
+                try:
+                    holidays.add(date.fromisoformat(text.split()[0]))
+                except ValueError:
+                    print(f"Ignoring bad line in {path}: {line.strip()}")
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"Error reading holidays from {path}: {e}")
+    return holidays
+
+
+class MarketCalendar:
+    """NSE sessions: weekdays that are not listed holidays, SESSION_OPEN to SESSION_CLOSE IST"""
+
+    def __init__(self, holidays=None, open_time=SESSION_OPEN, close_time=SESSION_CLOSE):
+        self.holidays = load_holidays() if holidays is None else set(holidays)
+        self.open_time = open_time
+        self.close_time = close_time
+
+    def is_trading_day(self, day):
+        return day.weekday() < 5 and day not in self.holidays
+
+    def session(self, day):
+        """(open, close) datetimes of a day's session"""
+        return datetime.combine(day, self.open_time, IST), datetime.combine(day, self.close_time, IST)
+
+    def is_open(self, now=None):
+        now = now or datetime.now(IST)
+        day = now.astimezone(IST).date()
+        if not self.is_trading_day(day):
+            return False
+        start, end = self.session(day)
+        return start <= now < end
+
+    def last_session_day(self, now=None):
+        """The trading day whose session most recently opened"""
+        now = now or datetime.now(IST)
+        day = now.astimezone(IST).date()
+        if not (self.is_trading_day(day) and now >= self.session(day)[0]):
+            day -= timedelta(days=1)
+            while not self.is_trading_day(day):
+                day -= timedelta(days=1)
+        return day
+
+    def next_open(self, now=None):
+        """When the next session opens (strictly after now)"""
+        now = now or datetime.now(IST)
+        day = now.astimezone(IST).date()
+        while not (self.is_trading_day(day) and self.session(day)[0] > now):
+            day += timedelta(days=1)
+        return self.session(day)[0]
+
+    def trading_seconds(self, start, end):
+        """Seconds of session time between two datetimes"""
+        total = 0.0
+        day = start.astimezone(IST).date()
+        while day <= end.astimezone(IST).date():
+            if self.is_trading_day(day):
+                session_open, session_close = self.session(day)
+                total += max(0.0, (min(session_close, end) - max(session_open, start)).total_seconds())
+            day += timedelta(days=1)
+        return total
+
+    def sessions_between(self, start, end):
+        """Sessions that opened after start's day and no later than end"""
+        count = 0
+        day = start.astimezone(IST).date() + timedelta(days=1)
+        while day <= end.astimezone(IST).date():
+            if self.is_trading_day(day) and self.session(day)[0] <= end:
+                count += 1
+            day += timedelta(days=1)
+        return count
+
+    def bar_key(self, interval_name, now=None):
+        """Identifies the latest closed bar of an interval: (session day, bars closed in that session).
+
+        The key only changes when a bar closes, so it stays the same all night and
+        over weekends and holidays.
+        """
+        now = now or datetime.now(IST)
+        day = self.last_session_day(now)
+        start, end = self.session(day)
+        length = (end - start).total_seconds()
+        elapsed = (now - start).total_seconds()
+        seconds = BAR_SECONDS[interval_name]
+        if elapsed >= length:
+            closed = 1 if seconds is None else math.ceil(length / seconds)
+        else:
+            closed = 0 if seconds is None else int(elapsed // seconds)
+        return day, closed
+
+
+class RefreshScheduler:
+    """Decides when refresh cycles run and what each one fetches.
+
+    While NSE is open, cycles start just after every `period` boundary (each
+    1-minute bar close by default); outside sessions they are suspended until
+    the next open. A stock's TA for an interval is only refetched once a new bar
+    of that interval has closed, so "1 Day" is fetched once per session, right
+    after the close. During sessions, stocks on screen or moving are polled every
+    cycle and first; quiet ones at most every quiet_refresh seconds.
+    """
+
+    def __init__(self, calendar=None, period=60, quiet_refresh=QUIET_REFRESH):
+        self.calendar = calendar or MarketCalendar()
+        self.period = period
+        self.quiet_refresh = quiet_refresh
+        self.lock = threading.Lock()
+        # (stock, part) -> bar key of the last published fetch
+        self.fetched = {}
+        # stock -> monotonic time it was last polled, and its price then
+        self.polled = {}
+        self.poll_price = {}
+        self.price = {}
+        self.visible = set()
+
+    def set_visible(self, stocks):
+        """Stocks currently on screen; they are polled every cycle"""
+        with self.lock:
+            self.visible = set(stocks)
+
+    def observe(self, row):
+        """Track the latest price of a published row"""
+        try:
+            price = float(row["CMP"])
+        except (KeyError, TypeError, ValueError):
+            return
+        with self.lock:
+            self.price[row["stock"]] = price
+
+    def move(self, stock):
+        """Relative price change since the stock was last polled (infinite if unknown)"""
+        reference, price = self.poll_price.get(stock), self.price.get(stock)
+        if not reference or price is None:
+            return math.inf
+        return abs(price / reference - 1)
+
+    def keys(self, parts, now=None):
+        """Current bar key of each part ("bar" follows the 1-minute bars)"""
+        now = now or datetime.now(IST)
+        return {part: self.calendar.bar_key("1 Minute" if part == "bar" else part, now) for part in parts}
+
+    def plan(self, stocks, parts, now=None):
+        """Choose this cycle's work.
+
+        Returns (keys, due): the current bar key per part, and {stock: [parts due]}
+        for the stocks to poll, highest priority first (on screen, then by how far
+        they moved). A polled stock always gets its bar; other parts only when a new
+        bar closed since they were last published.
+        """
+        now = now or datetime.now(IST)
+        keys = self.keys(["bar"] + list(parts), now)
+        # Outside sessions nothing moves any more, so everything due is caught up at once
+        throttle = self.calendar.is_open(now)
+        clock = time.monotonic()
+        with self.lock:
+            ranked = sorted(stocks, key=lambda s: (s not in self.visible, -self.move(s)))
+            due = {}
+            for stock in ranked:
+                quiet = stock not in self.visible and self.move(stock) < MOVING_THRESHOLD
+                if throttle and quiet and clock - self.polled.get(stock, -math.inf) < self.quiet_refresh:
+                    continue
+                stale = [part for part in keys if self.fetched.get((stock, part)) != keys[part]]
+                if stale:
+                    due[stock] = ["bar"] + [part for part in stale if part != "bar"]
+                    self.polled[stock] = clock
+                    if stock in self.price:
+                        self.poll_price[stock] = self.price[stock]
+        return keys, due
+
+    def done(self, stock, parts, keys):
+        """Record parts of a stock as published for the given bar keys (None records nothing)"""
+        if keys is None:
+            return
+        with self.lock:
+            for part in parts:
+                self.fetched[(stock, part)] = keys[part]
+
+    def next_run(self, now=None):
+        """Seconds to wait before the next cycle"""
+        now = now or datetime.now(IST)
+        if self.calendar.is_open(now):
+            epoch = now.timestamp()
+            boundary = math.floor(epoch / self.period) * self.period + self.period
+            return boundary + BAR_CLOSE_DELAY - epoch
+        until_open = (self.calendar.next_open(now) - now).total_seconds() + BAR_CLOSE_DELAY
+        return min(until_open, IDLE_RECHECK)
@@ -0,0 +1,268 @@
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds (seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+METRICS_PORT = 9108
+METRICS_FILE = "metrics.prom"
+METRICS_FILE_INTERVAL = 10
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating inside its bucket"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, n in enumerate(self.counts):
+            upper = min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+            if n and seen + n >= rank:
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+            lower = upper
+        return self.max
+
+
+class MetricsRegistry:
+    """Thread-safe counters, gauges and histograms, rendered as Prometheus text.
+
+    Components record into it directly; collectors registered with add_collector()
+    are polled at render time for stats they already keep (cache, Excel writer,
+    Treeview updater) and returned as gauges.
+    """
+
+    def __init__(self, prefix="stock_"):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.help = {}
+        self.collectors = {}
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, _label_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe how long the block took; an exception also counts in {name}_errors_total"""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc(f"{name}_errors_total", **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def add_collector(self, name, collect):
+        """collect() -> {stat: number}; exported as gauges {prefix}{name}_{stat}"""
+        with self.lock:
+            self.collectors[name] = collect
+
+    def remove_collector(self, name):
+        with self.lock:
+            self.collectors.pop(name, None)
+
+    def _collected(self):
+        with self.lock:
+            collectors = dict(self.collectors)
+        gauges = {}
+        for name, collect in collectors.items():
+            try:
+                stats = collect()
+            except Exception as e:
+                print(f"Error collecting {name} metrics: {e}")
+                continue
+            for stat, value in stats.items():
+                if isinstance(value, (int, float)):
+                    gauges[(f"{name}_{stat}", ())] = value
+        return gauges
+
+    def summary(self):
+        """Plain data for display: counters, gauges and per-histogram count/mean/p50/p99/max"""
+        collected = self._collected()
+        with self.lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            histograms = {key: {"count": h.count, "mean": h.sum / h.count if h.count else None,
+                                "p50": h.quantile(0.5), "p99": h.quantile(0.99), "max": h.max}
+                          for key, h in self.histograms.items()}
+        gauges.update(collected)
+        return counters, gauges, histograms
+
+    def render(self):
+        """Everything in the Prometheus text exposition format"""
+        collected = self._collected()
+        lines = []
+        with self.lock:
+            gauges = dict(self.gauges)
+            gauges.update(collected)
+            for kind, metrics in (("counter", self.counters), ("gauge", gauges)):
+                for name in sorted({name for name, _ in metrics}):
+                    full = self.prefix + name
+                    if name in self.help:
+                        lines.append(f"# HELP {full} {self.help[name]}")
+                    lines.append(f"# TYPE {full} {kind}")
+                    for (metric, key), value in sorted(metrics.items()):
+                        if metric == name:
+                            lines.append(f"{full}{_format_labels(key)} {value:g}")
+            for name in sorted({name for name, _ in self.histograms}):
+                full = self.prefix + name
+                if name in self.help:
+                    lines.append(f"# HELP {full} {self.help[name]}")
+                lines.append(f"# TYPE {full} histogram")
+                for (metric, key), h in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, n in zip(h.buckets + ("+Inf",), h.counts):
+                        cumulative += n
+                        lines.append(f"{full}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+                    lines.append(f"{full}_sum{_format_labels(key)} {h.sum:g}")
+                    lines.append(f"{full}_count{_format_labels(key)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry shared by every component
+METRICS = MetricsRegistry()
+METRICS.describe("stage_seconds", "Time spent per pipeline stage")
+METRICS.describe("stage_seconds_errors_total", "Pipeline stage calls that raised")
+METRICS.describe("symbol_latency_seconds", "Time from a stock's first fetch starting until its row was published")
+METRICS.describe("symbol_last_latency_seconds", "symbol_latency_seconds of each stock's latest refresh, by stock")
+METRICS.describe("cycle_seconds", "Duration of full refresh cycles")
+METRICS.describe("cycle_overruns_total", "Refresh cycles that took longer than the refresh period")
+METRICS.describe("errors_total", "Parts of a row that failed to fetch in a cycle, by part")
+METRICS.describe("stale_parts_total", "Failed parts served from the stock's previous row instead, by part")
+METRICS.describe("retries_total", "Requests retried, by stage")
+METRICS.describe("hedges_total", "Duplicate requests sent for slow fetches, by endpoint")
+METRICS.describe("breaker_rejections_total", "Calls refused because the endpoint's circuit breaker was open")
+METRICS.describe("stream_bars_rejected_total", "Closed streamed bars not stored because the store already had newer bars")
+METRICS.describe("jobs_abandoned_total", "Fetches still pending when a cycle ran out of time, by endpoint")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsServer:
+    """Serves a registry at http://host:port/metrics for Prometheus to scrape"""
+
+    def __init__(self, registry=METRICS, host="127.0.0.1", port=METRICS_PORT):
+        self.httpd = ThreadingHTTPServer((host, port), _MetricsHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.registry = registry
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class MetricsFileWriter:
+    """Rewrites a registry's text to a file every few seconds (e.g. for node_exporter's textfile collector)"""
+
+    def __init__(self, registry=METRICS, path=METRICS_FILE, interval=METRICS_FILE_INTERVAL):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.stop_event = threading.Event()
+
+    def write(self):
+        # Replace atomically so readers never see a half-written file
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(suffix=".prom", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(self.registry.render())
+            os.replace(temp_path, self.path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.write()
+            except Exception as e:
+                print(f"Error writing metrics to {self.path}: {e}")
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self.stop_event.set()
+        try:
+            self.write()
+        except Exception as e:
+            print(f"Error writing metrics to {self.path}: {e}")
@@ -1,60 +1,221 @@
 import tkinter as tk
 from tkinter import ttk
-import requests
-import pandas as pd
 from threading import Thread
+from datetime import datetime
+import argparse
+import heapq
+import queue
+import random
 import time
+from nse_client import get_client
+from option_chain import OptionChain, SIDES, BUILDUP_LABELS
+from oi_history import OIHistory, OI_HISTORY_DB
+
+# Poll cadence in seconds, with +/- jitter so several trackers don't hit NSE in lockstep
+POLL_INTERVAL = 60
+POLL_JITTER = 5
+
+# One row per (expiry, strike): OI, change since the previous poll and buildup per side
+COLUMNS = ("Symbol", "Expiry", "Strike", "CE OI", "CE Chg (%)", "CE Buildup", "PE OI", "PE Chg (%)", "PE Buildup")
+
+# How often the Tk loop applies diffs handed over by the fetch thread (ms)
+DRAIN_MS = 200
+
+class OITracker:
+    """Fetches, parses and diffs option chains for a set of symbols, with no GUI.
+
+    Holds the previous chain, rows and summary per symbol plus the rows last
+    handed out, so every update() returns only what changed.
+    """
+
+    def __init__(self, symbols, client=None):
+        self.symbols = list(symbols)
+        self.client = client or get_client()
+        self.prev_chains = {}
+        self.symbol_rows = {}
+        self.symbol_summary = {}
+        self.rows = {}
+
+    def fetch_nse_oi(self):
+        """Fetch every tracked symbol's option chain as {symbol: OptionChain}"""
+        chains = {}
+        # All symbols are fetched in parallel over the shared connection pool
+        for symbol, data in self.client.fetch_many(self.symbols).items():
+            if isinstance(data, Exception):
+                print(f"Error fetching {symbol}:", data)
+                continue
+            chains[symbol] = OptionChain.from_json(symbol, data)
+        return chains
+
+    def build_rows(self, chains):
+        """Rebuild the rows of the given symbols' chains; returns all {row id: values} and a summary line"""
+        for symbol, chain in chains.items():
+            rows = {}
+            prev = self.prev_chains.get(symbol)
+            changes = chain.diff(prev) if prev is not None else None
+            buildup = {side: BUILDUP_LABELS[chain.buildup(side)] for side in SIDES}
+
+            for e, s in chain.contracts():
+                expiry, strike = chain.expiries[e], chain.strikes[s]
+                values = [symbol, expiry, f"{strike:.10g}"]
+                for side in SIDES:
+                    oi = chain[(side, "oi")][e, s]
+                    pct = changes[side][1][e, s] if changes else float("nan")
+                    values += ["-" if oi != oi else int(oi),
+                               "-" if pct != pct else f"{pct:.2f}%",
+                               buildup[side][e, s]]
+                rows[f"{symbol}|{expiry}|{strike:.10g}"] = tuple(values)
+            self.symbol_rows[symbol] = rows
+
+            if chain.expiries:
+                pcr, max_pain = chain.pcr()[0], chain.max_pain()[0]
+                self.symbol_summary[symbol] = f"{symbol} {chain.expiries[0]}: PCR {pcr:.2f}, Max Pain {max_pain:g}"
+            self.prev_chains[symbol] = chain
+
+        # Symbols missing from this batch keep their last rows
+        all_rows = {}
+        for symbol in self.symbols:
+            all_rows.update(self.symbol_rows.get(symbol, {}))
+        summary = "    ".join(self.symbol_summary[s] for s in self.symbols if s in self.symbol_summary)
+        return all_rows, summary
+
+    def diff_rows(self, rows):
+        """Rows that changed or appeared, and row ids that disappeared, since the last update"""
+        changed = {row_id: values for row_id, values in rows.items() if self.rows.get(row_id) != values}
+        removed = [row_id for row_id in self.rows if row_id not in rows]
+        self.rows = rows
+        return changed, removed
+
+    def update(self, chains, label=None):
+        """Fold new chains for some symbols in; returns (changed rows, removed row ids, summary)"""
+        rows, summary = self.build_rows(chains)
+        if label:
+            summary = f"{label}    {summary}"
+        changed, removed = self.diff_rows(rows)
+        return changed, removed, summary
 
 class NSEOpenInterestApp:
-    def __init__(self, root):
+    def __init__(self, root, symbols=("BANKNIFTY",), title="NSE Futures Open Interest Tracker",
+                 poll_interval=POLL_INTERVAL, jitter=POLL_JITTER, history=None, replay=None):
         self.root = root
-        self.root.title("NSE Futures Open Interest Tracker")
-        self.root.geometry("600x400")
+        self.symbols = list(symbols)
+        self.tracker = OITracker(self.symbols)
+        self.poll_interval = poll_interval
+        self.jitter = jitter
+        # history: OIHistory every poll is recorded into; replay: (start, end, speed) to
+        # play recorded snapshots back from it instead of polling NSE
+        self.history = history
+        self.replay = replay
+        self.root.title(f"{title} (replay)" if replay else title)
+        self.root.geometry("1000x500")
         
-        self.tree = ttk.Treeview(root, columns=("Symbol", "OI", "Change"), show="headings")
-        self.tree.heading("Symbol", text="Symbol")
-        self.tree.heading("OI", text="Open Interest")
-        self.tree.heading("Change", text="Change (%)")
+        # Chain summary per symbol: PCR and max pain for the nearest expiry
+        self.summary_var = tk.StringVar(value="Waiting for data...")
+        tk.Label(root, textvariable=self.summary_var, anchor="w", font=("Arial", 10, "bold")).pack(fill=tk.X, padx=5, pady=5)
+
+        self.tree = ttk.Treeview(root, columns=COLUMNS, show="headings")
+        for col in COLUMNS:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=90, anchor="center")
+        scrollbar = ttk.Scrollbar(root, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.tree.pack(fill=tk.BOTH, expand=True)
         
-        self.prev_data = {}
-        self.update_data()
+        # The tracker is owned by the fetch thread, which hands Tk only its diffs
+        self.updates = queue.Queue()
+
+        self.running = True
+        self.worker = Thread(target=self.replay_loop if replay else self.poll_loop, daemon=True)
+        self.worker.start()
+        self.root.after(DRAIN_MS, self.apply_updates)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
         
-    def fetch_nse_oi(self):
-        url = "https://www.nseindia.com/api/option-chain-equities?symbol=BANKNIFTY"
-        headers = {
-            "User-Agent": "Mozilla/5.0"
-        }
-        try:
-            response = requests.get(url, headers=headers, timeout=10)
-            data = response.json()
-            oi_data = []
-            
-            for record in data.get("records", {}).get("data", []):
-                symbol = record.get("CE", {}).get("underlying", "Unknown")
-                oi = record.get("CE", {}).get("openInterest", 0)
-                oi_data.append((symbol, oi))
-            
-            return oi_data
-        except Exception as e:
-            print("Error fetching data:", e)
-            return []
+    def publish(self, chains, label=None):
+        """Hand Tk the row diff produced by new chains for some symbols"""
+        self.updates.put(self.tracker.update(chains, label))
+
+    def poll_loop(self):
+        """Fetch and parse on a background thread, handing Tk only the diff"""
+        time.sleep(random.uniform(0, self.jitter))  # Stagger trackers started together
+        while self.running:
+            started = time.monotonic()
+            try:
+                chains = self.tracker.fetch_nse_oi()
+                if chains:
+                    self.publish(chains)
+                    if self.history is not None:
+                        for chain in chains.values():
+                            self.history.record(chain)
+            except Exception as e:
+                print("Error fetching data:", e)
+            delay = self.poll_interval + random.uniform(-self.jitter, self.jitter)
+            time.sleep(max(0, delay - (time.monotonic() - started)))
     
-    def update_data(self):
-        data = self.fetch_nse_oi()
-        
-        for row in self.tree.get_children():
-            self.tree.delete(row)
-        
-        for symbol, oi in data:
-            prev_oi = self.prev_data.get(symbol, 0)
-            change = ((oi - prev_oi) / prev_oi * 100) if prev_oi else 0
-            self.tree.insert("", tk.END, values=(symbol, oi, f"{change:.2f}%"))
-            self.prev_data[symbol] = oi
+    def replay_loop(self):
+        """Play recorded snapshots of all symbols through the live diff/UI path"""
+        start, end, speed = self.replay
+
+        def snapshots(symbol):
+            for ts, chain in self.history.replay(symbol, start, end, speed=None):
+                yield ts, symbol, chain
+
+        previous_ts = None
+        for ts, symbol, chain in heapq.merge(*(snapshots(s) for s in self.symbols), key=lambda item: item[0]):
+            if not self.running:
+                return
+            if speed and previous_ts is not None:
+                time.sleep(max(0, (ts - previous_ts) / speed))
+            previous_ts = ts
+            self.publish({symbol: chain}, label=f"Replay {datetime.fromtimestamp(ts):%Y-%m-%d %H:%M:%S}")
+        print("Replay finished")
+
+    def apply_updates(self):
+        """Apply queued diffs on the Tk thread"""
+        while True:
+            try:
+                changed, removed, summary = self.updates.get_nowait()
+            except queue.Empty:
+                break
+            self.summary_var.set(summary)
+            for row_id in removed:
+                if self.tree.exists(row_id):
+                    self.tree.delete(row_id)
+            for row_id, values in changed.items():
+                if self.tree.exists(row_id):
+                    self.tree.item(row_id, values=values)
+                else:
+                    self.tree.insert("", tk.END, iid=row_id, values=values)
         
-        self.root.after(60000, self.update_data)  # Update every 60 seconds
+        if self.running:
+            self.root.after(DRAIN_MS, self.apply_updates)
 
-if __name__ == "__main__":
+    def on_closing(self):
+        self.running = False
+        self.root.destroy()
+
+def parse_time(value):
+    """Local "YYYY-MM-DD" or "YYYY-MM-DD HH:MM" as an epoch timestamp"""
+    fmt = "%Y-%m-%d %H:%M" if len(value) > 10 else "%Y-%m-%d"
+    return datetime.strptime(value, fmt).timestamp()
+
+def main(default_symbols):
+    """Run a tracker; shared by nse.py and nse_full.py"""
+    parser = argparse.ArgumentParser(description="NSE open interest tracker")
+    parser.add_argument("--symbols", nargs="+", default=default_symbols)
+    parser.add_argument("--db", default=OI_HISTORY_DB, help="snapshot history database")
+    parser.add_argument("--no-history", action="store_true", help="don't record polled snapshots")
+    parser.add_argument("--replay", action="store_true", help="replay recorded snapshots instead of polling")
+    parser.add_argument("--start", type=parse_time, help='replay start, "YYYY-MM-DD" or "YYYY-MM-DD HH:MM"')
+    parser.add_argument("--end", type=parse_time, help="replay end")
+    parser.add_argument("--speed", type=float, default=60, help="replay speed-up over real time")
+    args = parser.parse_args()
+
+    history = None if args.no_history and not args.replay else OIHistory(args.db)
     root = tk.Tk()
-    app = NSEOpenInterestApp(root)
+    NSEOpenInterestApp(root, symbols=args.symbols, history=history,
+                       replay=(args.start, args.end, args.speed) if args.replay else None)
     root.mainloop()
+
+if __name__ == "__main__":
+    main(["BANKNIFTY"])
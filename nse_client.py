@@ -0,0 +1,179 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import METRICS
+
+BASE_URL = "https://www.nseindia.com"
+
+# Option chains for these symbols live under the indices endpoint
+INDEX_SYMBOLS = {"NIFTY", "BANKNIFTY", "FINNIFTY", "MIDCPNIFTY", "NIFTYNXT50"}
+
+# NSE only answers the API once the session carries the cookies set by a page visit
+COOKIE_PRIME_PATH = "/option-chain"
+COOKIE_TTL = 240
+
+# urllib3 only decodes brotli when a brotli package is installed
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        ACCEPT_ENCODING = "gzip, deflate, br"
+    except ImportError:
+        ACCEPT_ENCODING = "gzip, deflate"
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+                  "Chrome/124.0 Safari/537.36",
+    "Accept": "application/json, text/plain, */*",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept-Encoding": ACCEPT_ENCODING,
+    "Referer": BASE_URL + COOKIE_PRIME_PATH,
+}
+
+
+class NSEError(Exception):
+    pass
+
+
+class NSEClient:
+    """Pooled, cookie-aware HTTP client for the nseindia.com JSON API.
+
+    One requests.Session is shared by every caller, so connections are reused
+    across polls and across symbols. Cookies are bootstrapped from a page visit
+    and refreshed when they age out or the API answers 401/403/empty. ETag and
+    Last-Modified validators are replayed, and 429/5xx responses back off
+    exponentially with jitter (or as long as Retry-After asks), never longer than
+    max_backoff seconds.
+    """
+
+    def __init__(self, base_url=BASE_URL, pool_size=10, timeout=10, max_retries=3, backoff=1.0, max_backoff=30):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.primed_at = None
+        self.prime_lock = threading.Lock()
+        self.validators = {}
+        self.cached = {}
+
+    def prime_cookies(self, force=False):
+        """Visit the option-chain page so the session holds fresh NSE cookies"""
+        with self.prime_lock:
+            if not force and self.primed_at and time.monotonic() - self.primed_at < COOKIE_TTL:
+                return
+            response = self.session.get(self.base_url + COOKIE_PRIME_PATH, timeout=self.timeout,
+                                        headers={"Accept": "text/html,application/xhtml+xml,*/*"})
+            response.raise_for_status()
+            self.primed_at = time.monotonic()
+
+    def _sleep_backoff(self, attempt, retry_after=None):
+        """Wait before the next attempt; after the last one there is nothing to wait for"""
+        if attempt >= self.max_retries:
+            return
+        METRICS.inc("retries_total", stage="nse")
+        delay = self.backoff * 2 ** attempt + random.uniform(0, self.backoff)
+        if retry_after:
+            try:
+                delay = max(0.0, float(retry_after))
+            except ValueError:
+                pass  # An HTTP date; use the normal backoff
+        time.sleep(min(delay, self.max_backoff))
+
+    def get_json(self, path, params=None):
+        """GET an API path and return the decoded JSON, handling cookies, 304s and backoff"""
+        url = self.base_url + path
+        cache_key = (url, tuple(sorted((params or {}).items())))
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.prime_cookies()
+                headers = dict(self.validators.get(cache_key, {}))
+                with METRICS.timer("stage_seconds", stage="nse_request"):
+                    response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+            except requests.RequestException as e:
+                last_error = e
+                self._sleep_backoff(attempt)
+                continue
+
+            if response.status_code == 304 and cache_key in self.cached:
+                return self.cached[cache_key]
+            if response.status_code in (401, 403):
+                last_error = NSEError(f"{response.status_code} from {url}; refreshing cookies")
+                self.primed_at = None
+                self._sleep_backoff(attempt)
+                continue
+            if response.status_code == 429 or response.status_code >= 500:
+                last_error = NSEError(f"{response.status_code} from {url}")
+                self._sleep_backoff(attempt, response.headers.get("Retry-After"))
+                continue
+            response.raise_for_status()
+
+            try:
+                data = response.json()
+            except ValueError as e:
+                last_error = e
+                data = None
+            if not data:
+                # NSE answers {} (or HTML) when the cookies have gone stale
+                last_error = last_error or NSEError(f"Empty response from {url}")
+                self.primed_at = None
+                self._sleep_backoff(attempt)
+                continue
+
+            validators = {}
+            if response.headers.get("ETag"):
+                validators["If-None-Match"] = response.headers["ETag"]
+            if response.headers.get("Last-Modified"):
+                validators["If-Modified-Since"] = response.headers["Last-Modified"]
+            self.validators[cache_key] = validators
+            self.cached[cache_key] = data
+            return data
+        METRICS.inc("errors_total", part="nse")
+        raise NSEError(f"Giving up on {url}: {last_error}")
+
+    def fetch_option_chain(self, symbol):
+        """Option chain JSON for an index or equity symbol"""
+        symbol = symbol.upper()
+        kind = "indices" if symbol in INDEX_SYMBOLS else "equities"
+        return self.get_json(f"/api/option-chain-{kind}", params={"symbol": symbol})
+
+    def fetch_many(self, symbols, max_workers=None):
+        """Fetch several option chains in parallel over the shared pool.
+
+        Returns {symbol: data}; a symbol whose fetch failed maps to the exception.
+        """
+        self.prime_cookies()
+        results = {}
+        with ThreadPoolExecutor(max_workers=max_workers or min(self.pool_size, len(symbols) or 1)) as executor:
+            futures = {symbol: executor.submit(self.fetch_option_chain, symbol) for symbol in symbols}
+            for symbol, future in futures.items():
+                try:
+                    results[symbol] = future.result()
+                except Exception as e:
+                    results[symbol] = e
+        return results
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Process-wide shared NSEClient"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = NSEClient()
+        return _client
@@ -0,0 +1,187 @@
+import math
+import sqlite3
+import threading
+import time
+from option_chain import OptionChain, FIELDS, SIDES
+
+OI_HISTORY_DB = "oi_history.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    symbol TEXT NOT NULL,
+    ts REAL NOT NULL,
+    underlying REAL,
+    nse_timestamp TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_snapshots_symbol_ts ON snapshots (symbol, ts);
+
+-- Only contracts that changed since the symbol's previous snapshot get a row
+CREATE TABLE IF NOT EXISTS contract_changes (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (id),
+    symbol TEXT NOT NULL,
+    expiry TEXT NOT NULL,
+    strike REAL NOT NULL,
+    side TEXT NOT NULL,
+    ts REAL NOT NULL,
+    removed INTEGER NOT NULL DEFAULT 0,
+    oi REAL, chg_oi REAL, volume REAL, iv REAL, ltp REAL, chg_ltp REAL
+);
+CREATE INDEX IF NOT EXISTS idx_changes_contract_ts ON contract_changes (symbol, expiry, strike, ts);
+CREATE INDEX IF NOT EXISTS idx_changes_snapshot ON contract_changes (snapshot_id);
+"""
+
+FIELD_NAMES = list(FIELDS)
+
+
+def chain_contracts(chain):
+    """Flatten a chain to {(expiry, strike, side): field values} for listed contracts"""
+    contracts = {}
+    for e, s in chain.contracts():
+        for side in SIDES:
+            values = tuple(chain[(side, field)][e, s] for field in FIELD_NAMES)
+            if not all(v != v for v in values):
+                # NaN -> None so values round-trip through SQLite unchanged
+                contracts[(chain.expiries[e], float(chain.strikes[s]), side)] = tuple(
+                    None if v != v else float(v) for v in values)
+    return contracts
+
+
+def contracts_to_chain(symbol, contracts, underlying=None, timestamp=None):
+    """Rebuild an OptionChain from flattened contracts, through the same JSON path as live data"""
+    records = {}
+    for (expiry, strike, side), values in contracts.items():
+        record = records.setdefault((expiry, strike), {"expiryDate": expiry, "strikePrice": strike})
+        record[side] = {FIELDS[field]: (math.nan if v is None else v) for field, v in zip(FIELD_NAMES, values)}
+    payload = {"records": {"data": list(records.values()), "underlyingValue": underlying, "timestamp": timestamp}}
+    return OptionChain.from_json(symbol, payload)
+
+
+class OIHistory:
+    """SQLite store of every polled option-chain snapshot, delta-encoded per contract.
+
+    Each poll adds one snapshots row, plus contract_changes rows only for contracts
+    whose values differ from the previous snapshot of that symbol (or that were
+    dropped from the chain). The state at any time is the latest change row per
+    contract at or before it.
+    """
+
+    def __init__(self, path=OI_HISTORY_DB):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.last = {}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def record(self, chain, ts=None):
+        """Store one snapshot; returns how many contract rows were written"""
+        ts = time.time() if ts is None else ts
+        contracts = chain_contracts(chain)
+        with self.lock:
+            previous = self.last.get(chain.symbol)
+            if previous is None:
+                previous = self._state_at(chain.symbol, ts)
+            changed = [(key, values) for key, values in contracts.items() if previous.get(key) != values]
+            removed = [key for key in previous if key not in contracts]
+
+            with self.conn:
+                cursor = self.conn.execute(
+                    "INSERT INTO snapshots (symbol, ts, underlying, nse_timestamp) VALUES (?, ?, ?, ?)",
+                    (chain.symbol, ts, chain.underlying, chain.timestamp))
+                snapshot_id = cursor.lastrowid
+                rows = [(snapshot_id, chain.symbol, expiry, strike, side, ts, 0) + values
+                        for (expiry, strike, side), values in changed]
+                rows += [(snapshot_id, chain.symbol, expiry, strike, side, ts, 1) + (None,) * len(FIELD_NAMES)
+                         for expiry, strike, side in removed]
+                self.conn.executemany(
+                    f"INSERT INTO contract_changes (snapshot_id, symbol, expiry, strike, side, ts, removed, "
+                    f"{', '.join(FIELD_NAMES)}) VALUES ({', '.join('?' * (7 + len(FIELD_NAMES)))})", rows)
+            self.last[chain.symbol] = contracts
+        return len(rows)
+
+    def _state_at(self, symbol, ts):
+        # SQLite returns the other columns from the row that holds MAX(ts)
+        rows = self.conn.execute(
+            f"SELECT expiry, strike, side, MAX(ts), removed, {', '.join(FIELD_NAMES)} FROM contract_changes "
+            "WHERE symbol = ? AND ts <= ? GROUP BY expiry, strike, side", (symbol, ts)).fetchall()
+        return {(expiry, strike, side): tuple(values)
+                for expiry, strike, side, _, removed, *values in rows if not removed}
+
+    # Queries
+
+    def state_at(self, symbol, ts):
+        """{(expiry, strike, side): field values} as of ts"""
+        with self.lock:
+            return self._state_at(symbol, ts)
+
+    def chain_at(self, symbol, ts):
+        """The option chain as it was at ts, or None if nothing was recorded before it"""
+        with self.lock:
+            snapshot = self.conn.execute(
+                "SELECT ts, underlying, nse_timestamp FROM snapshots WHERE symbol = ? AND ts <= ? "
+                "ORDER BY ts DESC LIMIT 1", (symbol, ts)).fetchone()
+            if snapshot is None:
+                return None
+            return contracts_to_chain(symbol, self._state_at(symbol, ts), snapshot[1], snapshot[2])
+
+    def snapshot_times(self, symbol, start=None, end=None):
+        with self.lock:
+            return [row[0] for row in self.conn.execute(
+                "SELECT ts FROM snapshots WHERE symbol = ? AND ts >= ? AND ts <= ? ORDER BY ts",
+                (symbol, start if start is not None else float("-inf"), end if end is not None else float("inf")))]
+
+    def oi_series(self, symbol, expiry, strike, side, start=None, end=None, field="oi"):
+        """Step series [(ts, value)] of one contract field: its value at start, then every change"""
+        if field not in FIELD_NAMES:
+            raise ValueError(f"Unknown field {field!r}")
+        start = start if start is not None else float("-inf")
+        end = end if end is not None else float("inf")
+        with self.lock:
+            first = self.conn.execute(
+                f"SELECT ts, {field}, removed FROM contract_changes WHERE symbol = ? AND expiry = ? AND strike = ? "
+                "AND side = ? AND ts <= ? ORDER BY ts DESC LIMIT 1",
+                (symbol, expiry, float(strike), side, start)).fetchone()
+            rows = self.conn.execute(
+                f"SELECT ts, {field}, removed FROM contract_changes WHERE symbol = ? AND expiry = ? AND strike = ? "
+                "AND side = ? AND ts > ? AND ts <= ? ORDER BY ts",
+                (symbol, expiry, float(strike), side, start, end)).fetchall()
+        series = [(max(first[0], start), first[1])] if first and not first[2] else []
+        return series + [(ts, None if removed else value) for ts, value, removed in rows]
+
+    def replay(self, symbol, start=None, end=None, speed=60.0):
+        """Yield (ts, OptionChain) for every recorded snapshot in range, in order.
+
+        Deltas are applied incrementally to a running state. With a speed, the gaps
+        between snapshots are replayed that many times faster than real time.
+        """
+        times = self.snapshot_times(symbol, start, end)
+        if not times:
+            return
+        state = self.state_at(symbol, times[0] - 1e-6)
+        with self.lock:
+            snapshots = self.conn.execute(
+                "SELECT id, ts, underlying, nse_timestamp FROM snapshots WHERE symbol = ? AND ts >= ? AND ts <= ? "
+                "ORDER BY ts", (symbol, times[0], times[-1])).fetchall()
+            changes = self.conn.execute(
+                f"SELECT snapshot_id, expiry, strike, side, removed, {', '.join(FIELD_NAMES)} FROM contract_changes "
+                "WHERE symbol = ? AND ts >= ? AND ts <= ? ORDER BY snapshot_id",
+                (symbol, times[0], times[-1])).fetchall()
+
+        by_snapshot = {}
+        for snapshot_id, expiry, strike, side, removed, *values in changes:
+            by_snapshot.setdefault(snapshot_id, []).append(((expiry, strike, side), removed, tuple(values)))
+
+        previous_ts = None
+        for snapshot_id, ts, underlying, nse_timestamp in snapshots:
+            for key, removed, values in by_snapshot.get(snapshot_id, []):
+                if removed:
+                    state.pop(key, None)
+                else:
+                    state[key] = values
+            if speed and previous_ts is not None:
+                time.sleep(max(0, (ts - previous_ts) / speed))
+            previous_ts = ts
+            yield ts, contracts_to_chain(symbol, state, underlying, nse_timestamp)
@@ -0,0 +1,139 @@
+from datetime import datetime
+import numpy as np
+
+SIDES = ("CE", "PE")
+
+# Per-contract fields kept from records.data, and their NSE JSON keys
+FIELDS = {
+    "oi": "openInterest",
+    "chg_oi": "changeinOpenInterest",
+    "volume": "totalTradedVolume",
+    "iv": "impliedVolatility",
+    "ltp": "lastPrice",
+    "chg_ltp": "change",
+}
+
+BUILDUP_LABELS = np.array(["-", "Long Buildup", "Short Buildup", "Short Covering", "Long Unwinding"], dtype=object)
+
+
+def _expiry_sort_key(expiry):
+    try:
+        return datetime.strptime(expiry, "%d-%b-%Y")
+    except (TypeError, ValueError):
+        return datetime.max
+
+
+class OptionChain:
+    """Option chain as dense (expiry x strike) arrays per side and field.
+
+    data[(side, field)] is a float array shaped (len(expiries), len(strikes)),
+    NaN where NSE lists no contract. Every derived metric is computed over these
+    arrays in bulk.
+    """
+
+    def __init__(self, symbol, expiries, strikes, data, underlying=None, timestamp=None):
+        self.symbol = symbol
+        self.expiries = list(expiries)
+        self.strikes = np.asarray(strikes, dtype="f8")
+        self.data = data
+        self.underlying = underlying
+        self.timestamp = timestamp
+
+    @classmethod
+    def from_json(cls, symbol, payload):
+        """Build the chain from an option-chain API response in one pass over records.data"""
+        records_block = payload.get("records", {}) or {}
+        records = records_block.get("data", []) or []
+        expiries = sorted({r.get("expiryDate") for r in records}, key=_expiry_sort_key)
+        strikes = np.unique(np.array([r.get("strikePrice", np.nan) for r in records], dtype="f8"))
+        shape = (len(expiries), len(strikes))
+
+        expiry_pos = {expiry: i for i, expiry in enumerate(expiries)}
+        e_idx = np.array([expiry_pos[r.get("expiryDate")] for r in records], dtype=np.int64)
+        s_idx = np.searchsorted(strikes, np.array([r.get("strikePrice", np.nan) for r in records], dtype="f8"))
+
+        data = {}
+        for side in SIDES:
+            legs = [r.get(side) or {} for r in records]
+            for field, key in FIELDS.items():
+                values = np.array([leg.get(key, np.nan) if leg else np.nan for leg in legs], dtype="f8")
+                grid = np.full(shape, np.nan)
+                grid[e_idx, s_idx] = values
+                data[(side, field)] = grid
+
+        return cls(symbol, expiries, strikes, data,
+                   underlying=records_block.get("underlyingValue"),
+                   timestamp=records_block.get("timestamp"))
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def reindex(self, expiries, strikes):
+        """Copy of the chain laid out on other expiry/strike axes, NaN where absent"""
+        strikes = np.asarray(strikes, dtype="f8")
+        expiry_pos = {expiry: i for i, expiry in enumerate(expiries)}
+        e_src = [i for i, expiry in enumerate(self.expiries) if expiry in expiry_pos]
+        e_dst = [expiry_pos[self.expiries[i]] for i in e_src]
+        s_dst = np.searchsorted(strikes, self.strikes)
+        if len(strikes):
+            s_ok = (s_dst < len(strikes)) & (strikes[np.minimum(s_dst, len(strikes) - 1)] == self.strikes)
+        else:
+            s_ok = np.zeros(len(self.strikes), dtype=bool)
+        data = {}
+        for key, grid in self.data.items():
+            out = np.full((len(expiries), len(strikes)), np.nan)
+            out[np.ix_(e_dst, s_dst[s_ok])] = grid[np.ix_(e_src, np.nonzero(s_ok)[0])]
+            data[key] = out
+        return OptionChain(self.symbol, expiries, strikes, data, self.underlying, self.timestamp)
+
+    # Derived metrics
+
+    def pcr(self, field="oi"):
+        """Put/call ratio per expiry (OI by default, or e.g. "volume")"""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.nansum(self.data[("PE", field)], axis=1) / np.nansum(self.data[("CE", field)], axis=1)
+
+    def max_pain(self):
+        """Max-pain strike per expiry: the settlement price that minimises writers' payout"""
+        ce = np.nan_to_num(self.data[("CE", "oi")])
+        pe = np.nan_to_num(self.data[("PE", "oi")])
+        # intrinsic[k, s]: payoff per contract at strike s if the expiry settles at strike k
+        diff = self.strikes[:, None] - self.strikes[None, :]
+        call_payout = np.maximum(diff, 0)
+        put_payout = np.maximum(-diff, 0)
+        pain = ce @ call_payout.T + pe @ put_payout.T
+        if pain.size == 0:
+            return np.array([])
+        return self.strikes[np.argmin(pain, axis=1)]
+
+    def buildup(self, side):
+        """OI buildup class per contract, as indexes into BUILDUP_LABELS"""
+        chg_oi = self.data[(side, "chg_oi")]
+        chg_ltp = self.data[(side, "chg_ltp")]
+        with np.errstate(invalid="ignore"):
+            return np.select(
+                [(chg_ltp > 0) & (chg_oi > 0), (chg_ltp < 0) & (chg_oi > 0),
+                 (chg_ltp > 0) & (chg_oi < 0), (chg_ltp < 0) & (chg_oi < 0)],
+                [1, 2, 3, 4], 0)
+
+    def diff(self, prev, field="oi"):
+        """Snapshot-to-snapshot change keyed by (expiry, strike, side).
+
+        Returns {side: (delta, pct)} arrays on this chain's axes; NaN where the
+        contract was not in prev.
+        """
+        if prev.expiries != self.expiries or not np.array_equal(prev.strikes, self.strikes):
+            prev = prev.reindex(self.expiries, self.strikes)
+        result = {}
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for side in SIDES:
+                now, before = self.data[(side, field)], prev.data[(side, field)]
+                delta = now - before
+                pct = np.where(before > 0, delta / before * 100, np.nan)
+                result[side] = (delta, pct)
+        return result
+
+    def contracts(self):
+        """(expiry index, strike index) of every listed strike row, in expiry/strike order"""
+        listed = ~(np.isnan(self.data[("CE", "oi")]) & np.isnan(self.data[("PE", "oi")]))
+        return np.argwhere(listed)
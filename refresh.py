@@ -0,0 +1,310 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from metrics import METRICS
+
+# Hedging switches from the configured delay to the endpoint's own p95 latency
+# once HEDGE_MIN_SAMPLES calls were timed, over the last HEDGE_WINDOW calls only
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW = 200
+HEDGE_QUANTILE = 0.95
+# How often (seconds) the cycle checks whether queued jobs on hedged endpoints have started
+HEDGE_POLL = 0.05
+
+
+class CircuitOpenError(Exception):
+    """The endpoint's circuit breaker is open, so the call was not made"""
+
+
+class CycleBudgetExceeded(Exception):
+    """The job was still queued or running when the cycle ran out of time"""
+
+
+class PartialResult(Exception):
+    """The endpoint answered but left part of the job undone; `result` holds the part that was done.
+
+    The job is retried like a failed one, but the breaker counts it as a success.
+    """
+
+    def __init__(self, message, result):
+        super().__init__(message)
+        self.result = result
+
+
+def backoff_delay(attempt, base, cap):
+    """Exponential backoff with full jitter: a random wait up to base * 2**attempt, at most cap"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Stops calling an endpoint after `failures` failures in a row.
+
+    While open every call fails fast. After reset_timeout seconds a single probe is
+    let through (half open): success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, failures=5, reset_timeout=30):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = "closed"
+        self.consecutive = 0
+        self.opened_at = None
+        self.probing = False
+        self.trips = 0
+
+    def allow(self):
+        """Whether a call may go ahead now"""
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self.probing = False
+            if self.state == "half_open" and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = "closed"
+            self.consecutive = 0
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.consecutive += 1
+            self.probing = False
+            if self.state == "half_open" or (self.state == "closed" and self.consecutive >= self.failures):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.trips += 1
+
+    def is_closed(self):
+        with self.lock:
+            return self.state == "closed"
+
+    def stats(self):
+        with self.lock:
+            return {"open": int(self.state != "closed"), "trips": self.trips,
+                    "consecutive_failures": self.consecutive}
+
+
+class _Job:
+    def __init__(self, endpoint, key, fn, args):
+        self.endpoint = endpoint
+        self.key = key
+        self.fn = fn
+        self.args = args
+        # When the first copy got past the limiter, set from the worker thread
+        self.started = None
+        self.copies = 1
+        self.hedged = False
+        self.finished = False
+
+
+class RateLimiter:
+    """Token bucket limiter with a cap on concurrent in-flight requests"""
+
+    def __init__(self, rate, max_in_flight, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.in_flight = threading.BoundedSemaphore(max_in_flight)
+
+    def acquire(self):
+        """Block until a token and an in-flight slot are available"""
+        self.in_flight.acquire()
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def release(self):
+        self.in_flight.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+class RefreshEngine:
+    """Run a cycle of fetch jobs on a bounded worker pool, one rate limiter per endpoint.
+
+    Every endpoint also has a circuit breaker: once it trips, that endpoint's jobs
+    fail fast instead of each waiting out its timeout. Failed calls are retried
+    with jittered exponential backoff. Jobs on endpoints listed in hedge_after get
+    a duplicate request once they have run longer than the endpoint's p95 latency
+    (or the configured delay until enough calls were timed), and whichever copy
+    answers first wins. Jobs still unfinished at the cycle's deadline are reported
+    as CycleBudgetExceeded.
+    """
+
+    def __init__(self, limiters, max_workers=16, breakers=None, retries=0, retry_backoff=0.5,
+                 retry_backoff_max=5, hedge_after=None):
+        self.limiters = limiters
+        self.breakers = breakers or {endpoint: CircuitBreaker() for endpoint in limiters}
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        # endpoint -> seconds a job runs before it is hedged
+        self.hedge_after = hedge_after or {}
+        self.latency = {endpoint: deque(maxlen=HEDGE_WINDOW) for endpoint in limiters}
+        self.latency_lock = threading.Lock()
+        # A pool of max_workers threads per endpoint, so jobs queued behind one
+        # endpoint's limits (or stuck on it) never hold threads another endpoint needs
+        self.executors = {
+            endpoint: ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"refresh-{endpoint}")
+            for endpoint in limiters
+        }
+        # Hedges get threads of their own rather than queueing behind the cycle's other jobs
+        self.hedge_executors = {
+            endpoint: ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"hedge-{endpoint}")
+            for endpoint in self.hedge_after
+        }
+
+    def hedge_delay(self, endpoint):
+        """Seconds a job on the endpoint runs before a duplicate is sent, or None"""
+        delay = self.hedge_after.get(endpoint)
+        if delay is None:
+            return None
+        with self.latency_lock:
+            latency = sorted(self.latency[endpoint])
+        if len(latency) >= HEDGE_MIN_SAMPLES:
+            delay = max(delay / 2, latency[int(HEDGE_QUANTILE * (len(latency) - 1))])
+        return delay
+
+    def _run_job(self, job, deadline):
+        """One copy of a job: calls through the endpoint's breaker and limiter, retried with backoff"""
+        endpoint = job.endpoint
+        breaker = self.breakers[endpoint]
+        for attempt in range(self.retries + 1):
+            if not breaker.allow():
+                METRICS.inc("breaker_rejections_total", endpoint=endpoint)
+                raise CircuitOpenError(f"{endpoint} circuit breaker is open")
+            queued = time.perf_counter()
+            try:
+                with self.limiters[endpoint]:
+                    # Time spent queued behind the endpoint's rate and in-flight limits
+                    METRICS.observe("limiter_wait_seconds", time.perf_counter() - queued, endpoint=endpoint)
+                    if deadline is not None and time.monotonic() >= deadline:
+                        raise CycleBudgetExceeded(f"{endpoint} job reached the cycle deadline before it started")
+                    if job.started is None:
+                        job.started = time.monotonic()
+                    started = time.perf_counter()
+                    result = job.fn(*job.args)
+            except CycleBudgetExceeded:
+                raise
+            except Exception as e:
+                # An incomplete answer still shows the endpoint is up
+                if isinstance(e, PartialResult):
+                    breaker.record_success()
+                else:
+                    breaker.record_failure()
+                delay = backoff_delay(attempt, self.retry_backoff, self.retry_backoff_max)
+                if attempt == self.retries or (deadline is not None and time.monotonic() + delay >= deadline):
+                    raise
+                METRICS.inc("retries_total", stage=endpoint)
+                time.sleep(delay)
+                continue
+            breaker.record_success()
+            with self.latency_lock:
+                self.latency[endpoint].append(time.perf_counter() - started)
+            return result
+
+    def run_cycle(self, jobs, on_result, deadline=None):
+        """Schedule every (endpoint, key, fn, args) job at once and report each result as it completes.
+
+        on_result(key, result, error) is called from the calling thread, so callers
+        can merge partial results without extra locking. deadline is a
+        time.monotonic() value; by then every job has been reported.
+        """
+        futures = {}
+        for endpoint, key, fn, args in jobs:
+            job = _Job(endpoint, key, fn, args)
+            futures[self.executors[endpoint].submit(self._run_job, job, deadline)] = job
+
+        unfinished = len(futures)
+
+        def finish(job, result, error):
+            nonlocal unfinished
+            job.finished = True
+            unfinished -= 1
+            on_result(job.key, result, error)
+
+        # The copy that lost a hedge is left to finish on its own
+        while unfinished:
+            now = time.monotonic()
+            delays = {endpoint: self.hedge_delay(endpoint) for endpoint in self.hedge_after}
+            # Wake up for the deadline and for the next job due to be hedged. Jobs only
+            # get a start time once their request goes out, so those are polled for.
+            wake = [max(0.0, deadline - now)] if deadline is not None else []
+            for job in futures.values():
+                delay = delays.get(job.endpoint)
+                if delay is None or job.hedged or job.finished:
+                    continue
+                if job.started is None:
+                    wake.append(HEDGE_POLL)
+                else:
+                    wake.append(max(HEDGE_POLL, job.started + delay - now))
+            timeout = min(wake) if wake else None
+            done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                job = futures.pop(future)
+                job.copies -= 1
+                if job.finished:
+                    continue  # The other copy already answered
+                try:
+                    result, error = future.result(), None
+                except Exception as e:
+                    result, error = None, e
+                if error is not None and job.copies:
+                    continue  # The other copy is still running and may yet succeed
+                finish(job, result, error)
+
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                for future, job in futures.items():
+                    future.cancel()
+                    if not job.finished:
+                        METRICS.inc("jobs_abandoned_total", endpoint=job.endpoint)
+                        finish(job, None, CycleBudgetExceeded(f"{job.endpoint} job still pending at the cycle deadline"))
+                break
+
+            for job in list(futures.values()):
+                delay = delays.get(job.endpoint)
+                if delay is None or job.hedged or job.finished or job.started is None:
+                    continue
+                if now - job.started >= delay and self.breakers[job.endpoint].is_closed():
+                    job.hedged = True
+                    job.copies += 1
+                    METRICS.inc("hedges_total", endpoint=job.endpoint)
+                    futures[self.hedge_executors[job.endpoint].submit(self._run_job, job, deadline)] = job
+
+    def stats(self):
+        """Breaker state per endpoint, as {endpoint_stat: number}"""
+        stats = {}
+        for endpoint, breaker in self.breakers.items():
+            for stat, value in breaker.stats().items():
+                stats[f"{endpoint}_{stat}"] = value
+        return stats
+
+    def shutdown(self):
+        for executor in list(self.executors.values()) + list(self.hedge_executors.values()):
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,252 @@
+import operator
+import re
+import threading
+import numpy as np
+from watchlist import INTERVAL_NAMES
+
+# Numeric columns get a sorted index; recommendation columns are matched on the
+# model's codes. "Volume Ratio" is derived: Volume / Avg Volume.
+NUMERIC_COLUMNS = ["Open", "High", "Low", "CMP", "Volume", "Avg Volume", "Volume Ratio"]
+CATEGORICAL_COLUMNS = list(INTERVAL_NAMES)
+
+COMPARISONS = {
+    ">=": operator.ge, "<=": operator.le, "!=": operator.ne,
+    ">": operator.gt, "<": operator.lt, "=": operator.eq,
+}
+
+
+class SortedIndex:
+    """One numeric column's values kept in sorted order, with the slot each belongs to.
+
+    Updates shift the arrays in place (a memmove), so keeping the index current
+    costs far less than re-sorting, and range queries are two binary searches.
+    Missing values (NaN) are not indexed.
+    """
+
+    def __init__(self, capacity=1024):
+        self.values = np.empty(capacity)
+        self.slots = np.empty(capacity, dtype=np.int64)
+        self.size = 0
+
+    def _position(self, value, slot):
+        values = self.values[:self.size]
+        lo = np.searchsorted(values, value, side="left")
+        hi = np.searchsorted(values, value, side="right")
+        return lo + int(np.flatnonzero(self.slots[lo:hi] == slot)[0])
+
+    def remove(self, value, slot):
+        pos = self._position(value, slot)
+        self.values[pos:self.size - 1] = self.values[pos + 1:self.size]
+        self.slots[pos:self.size - 1] = self.slots[pos + 1:self.size]
+        self.size -= 1
+
+    def insert(self, value, slot):
+        if self.size == len(self.values):
+            self.values = np.concatenate([self.values, np.empty(len(self.values))])
+            self.slots = np.concatenate([self.slots, np.empty(len(self.slots), dtype=np.int64)])
+        pos = np.searchsorted(self.values[:self.size], value, side="right")
+        self.values[pos + 1:self.size + 1] = self.values[pos:self.size]
+        self.slots[pos + 1:self.size + 1] = self.slots[pos:self.size]
+        self.values[pos] = value
+        self.slots[pos] = slot
+        self.size += 1
+
+    def range(self, low=-np.inf, high=np.inf, low_inclusive=True, high_inclusive=True):
+        """Slots whose value lies between low and high"""
+        values = self.values[:self.size]
+        lo = np.searchsorted(values, low, side="left" if low_inclusive else "right")
+        hi = np.searchsorted(values, high, side="right" if high_inclusive else "left")
+        return self.slots[lo:hi]
+
+    def ordered(self, descending=False):
+        """Every indexed slot by value"""
+        slots = self.slots[:self.size]
+        return slots[::-1] if descending else slots
+
+
+class Screen:
+    """A saved query whose matches are kept current as rows change"""
+
+    def __init__(self, conditions, on_change=None):
+        self.conditions = conditions
+        self.on_change = on_change
+        self.matches = set()
+
+
+def parse_query(text):
+    """Turn e.g. "15 Minute = STRONG_BUY and 1 Hour in BUY,STRONG_BUY and Volume Ratio > 2"
+    into [(column, op, value)] conditions"""
+    columns = sorted(NUMERIC_COLUMNS + CATEGORICAL_COLUMNS, key=len, reverse=True)
+    conditions = []
+    for clause in re.split(r"\s+and\s+", text.strip(), flags=re.IGNORECASE):
+        if not clause:
+            continue
+        column = next((col for col in columns if clause.lower().startswith(col.lower())), None)
+        if column is None:
+            raise ValueError(f"Unknown column in '{clause}'")
+        rest = clause[len(column):].strip()
+        match = re.match(r"(>=|<=|!=|>|<|=|in\b)\s*(.+)$", rest, flags=re.IGNORECASE)
+        if not match:
+            raise ValueError(f"Expected an operator and a value in '{clause}'")
+        op, value = match.group(1).lower(), match.group(2).strip()
+        if column in CATEGORICAL_COLUMNS:
+            if op not in ("=", "!=", "in"):
+                raise ValueError(f"{column} only supports =, != and in")
+            value = [v.strip().upper() for v in value.split(",")] if op == "in" else value.upper()
+        else:
+            if op == "in":
+                raise ValueError(f"{column} does not support in")
+            value = float(value)
+        conditions.append((column, op, value))
+    return conditions
+
+
+class Screener:
+    """Filter and rank the watchlist in a WatchlistModel.
+
+    Recommendation conditions compare the model's int8 code columns directly.
+    Numeric columns (and the derived Volume Ratio) are kept in sorted indexes, so
+    range conditions and ranking are binary searches. update(stock) re-indexes a
+    single slot: one remove/insert per numeric column that changed. Saved screens
+    are re-checked for just the updated stock and report stocks entering or
+    leaving them.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.lock = threading.Lock()
+        # The value each slot is filed under in each sorted index
+        self.indexed = {col: np.full(len(model.ids), np.nan) for col in NUMERIC_COLUMNS}
+        self.sorted = {col: SortedIndex(len(model.ids)) for col in NUMERIC_COLUMNS}
+        self.screens = {}
+        # Bumped on every update, so views can tell when to redraw
+        self.version = 0
+
+    @property
+    def size(self):
+        return len(self.model)
+
+    def _grow(self, capacity):
+        for col, values in self.indexed.items():
+            grown = np.full(capacity, np.nan)
+            grown[:len(values)] = values
+            self.indexed[col] = grown
+
+    def update(self, stock):
+        """Re-index a stock after its row changed in the model; safe to call from any thread"""
+        model = self.model
+        slot = model.slot(stock)
+        if slot is None:
+            return
+        numbers = {col: model.numbers[col][slot] for col in NUMERIC_COLUMNS if col != "Volume Ratio"}
+        average = numbers["Avg Volume"]
+        numbers["Volume Ratio"] = numbers["Volume"] / average if average > 0 else np.nan
+        changes = []
+        with self.lock:
+            if slot >= len(self.indexed["CMP"]):
+                self._grow(len(model.ids))
+            self.version += 1
+
+            for col, value in numbers.items():
+                old = self.indexed[col][slot]
+                if old == value or (np.isnan(old) and np.isnan(value)):
+                    continue
+                if not np.isnan(old):
+                    self.sorted[col].remove(old, slot)
+                if not np.isnan(value):
+                    self.sorted[col].insert(value, slot)
+                self.indexed[col][slot] = value
+
+            for screen in self.screens.values():
+                matched = self._matches_slot(slot, screen.conditions)
+                if matched != (stock in screen.matches):
+                    (screen.matches.add if matched else screen.matches.discard)(stock)
+                    if screen.on_change:
+                        changes.append((screen.on_change, stock, matched))
+        for on_change, stock, matched in changes:
+            on_change(stock, matched)
+
+    def _codes(self, op, value):
+        values = value if op == "in" else [value]
+        return [code for code in (self.model.code(v) for v in values) if code is not None]
+
+    def _matches_slot(self, slot, conditions):
+        """Evaluate conditions for one slot without touching the indexes"""
+        for col, op, value in conditions:
+            if col in CATEGORICAL_COLUMNS:
+                hit = self.model.codes[col][slot] in self._codes(op, value)
+                ok = not hit if op == "!=" else hit
+            else:
+                number = self.indexed[col][slot]
+                ok = not np.isnan(number) and COMPARISONS[op](number, value)
+            if not ok:
+                return False
+        return True
+
+    def _mask(self, conditions):
+        size = self.size
+        mask = np.ones(size, dtype=bool)
+        for col, op, value in conditions:
+            if col in CATEGORICAL_COLUMNS:
+                hits = np.isin(self.model.column(col)[:size], self._codes(op, value))
+                mask &= ~hits if op == "!=" else hits
+            else:
+                index = self.sorted[col]
+                if op == "!=":
+                    slots = np.concatenate([index.range(high=value, high_inclusive=False),
+                                            index.range(low=value, low_inclusive=False)])
+                else:
+                    bounds = {
+                        ">": dict(low=value, low_inclusive=False), ">=": dict(low=value),
+                        "<": dict(high=value, high_inclusive=False), "<=": dict(high=value),
+                        "=": dict(low=value, high=value),
+                    }[op]
+                    slots = index.range(**bounds)
+                hits = np.zeros(size, dtype=bool)
+                hits[slots[slots < size]] = True
+                mask &= hits
+        return mask
+
+    def query(self, conditions, rank_by=None, descending=True, limit=None):
+        """Stocks matching every (column, op, value) condition (or a query string),
+        ranked by a numeric column if given; stocks without that value rank last"""
+        if isinstance(conditions, str):
+            conditions = parse_query(conditions)
+        with self.lock:
+            mask = self._mask(conditions)
+            if rank_by is None:
+                slots = np.flatnonzero(mask)
+            else:
+                ordered = self.sorted[rank_by].ordered(descending)
+                ordered = ordered[ordered < len(mask)]
+                ranked = ordered[mask[ordered]]
+                mask[ranked] = False
+                slots = np.concatenate([ranked, np.flatnonzero(mask)])
+            if limit is not None:
+                slots = slots[:limit]
+            return [self.model.ids[slot] for slot in slots]
+
+    def add_screen(self, name, conditions, on_change=None):
+        """Keep a query's matches current; on_change(stock, matched) is called as stocks enter or leave it"""
+        if isinstance(conditions, str):
+            conditions = parse_query(conditions)
+        screen = Screen(conditions, on_change)
+        with self.lock:
+            screen.matches = {self.model.ids[slot] for slot in np.flatnonzero(self._mask(conditions))}
+            self.screens[name] = screen
+        return screen
+
+    def remove_screen(self, name):
+        with self.lock:
+            self.screens.pop(name, None)
+
+    def row(self, stock):
+        """The stock's row from the model plus its Volume Ratio, or None if it is unknown"""
+        row = self.model.row(stock)
+        if row is None:
+            return None
+        with self.lock:
+            slot = self.model.slot(stock)
+            ratio = self.indexed["Volume Ratio"][slot] if slot < len(self.indexed["Volume Ratio"]) else np.nan
+        row["Volume Ratio"] = None if np.isnan(ratio) else float(ratio)
+        return row
@@ -0,0 +1,199 @@
+import heapq
+import multiprocessing
+import os
+import time
+from multiprocessing.connection import wait
+
+# Weight of the newest observation in each symbol's fetch latency estimate
+LATENCY_SMOOTHING = 0.3
+# Latency assumed (seconds) for symbols that have not been timed yet
+DEFAULT_LATENCY = 1.0
+# Seconds past the cycle deadline to wait for workers to send what they finished
+RESULT_GRACE = 2
+# Shards are only re-cut when that would cut the slowest shard's expected time by
+# more than this fraction and at least REBALANCE_MIN_SAVING seconds, so workers
+# keep their symbols and local TA state
+REBALANCE_TOLERANCE = 0.2
+REBALANCE_MIN_SAVING = 1.0
+
+
+def _worker_main(index, tasks, results):
+    """Worker process: a persistence-free pipeline refreshing whatever shard it is sent.
+
+    Each task carries the parent's current rows for the shard, so intervals not due
+    and parts served stale come from what the parent shows, not from whatever this
+    worker fetched the last time it had the stock.
+    """
+    # Imported here so the child builds its own TvDatafeed connections, cache and engine
+    from stock_service import StockPipeline
+
+    pipeline = StockPipeline([], excel_file=None)
+    cycle = None
+    pipeline.subscribe(lambda row: results.send(("row", cycle, (row, pipeline.fresh_parts.get(row["stock"], [])))))
+    while True:
+        try:
+            task = tasks.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        # The parent's scheduler already chose what this shard fetches, and its budget
+        cycle, stocks, due, rows, budget = task
+        pipeline.set_watchlist(stocks)
+        pipeline.model.load(rows)
+        pipeline.fetch_latency.clear()
+        pipeline.symbol_latency.clear()
+        pipeline.fresh_parts.clear()
+        try:
+            pipeline.refresh_cycle(due, budget)
+        except Exception as e:
+            print(f"Error in fetch worker {index}: {e}")
+        results.send(("done", cycle, (dict(pipeline.fetch_latency), dict(pipeline.symbol_latency))))
+    pipeline.stop()
+
+
+class ShardedFetcher:
+    """Runs refresh cycles across worker processes, each refreshing one shard of the watchlist.
+
+    Every worker is a separate interpreter with its own TvDatafeed connections and
+    cache, so parsing and DataFrame work scale with cores instead of sharing one
+    GIL. Rows come back over a pipe per worker and are handed to on_row in the
+    parent, which keeps the only Excel writer and the only view. Shards are cut
+    from the observed per-symbol fetch latency so the workers finish together, and
+    re-cut only when they drift out of balance; the parent's rows travel with each
+    task, so only local TA state carries over between cycles.
+    """
+
+    def __init__(self, processes=None):
+        self.processes = processes or os.cpu_count() or 1
+        # spawn everywhere: forking a process that already runs threads is unsafe
+        self.context = multiprocessing.get_context("spawn")
+        # Per worker: (process, task sender, result receiver)
+        self.workers = [None] * self.processes
+        self.latency = {}
+        self.shards = None
+        self.cycle = 0
+
+    def _ensure_workers(self):
+        """Start missing workers and replace dead ones, with fresh pipes"""
+        for index, worker in enumerate(self.workers):
+            if worker is not None and worker[0].is_alive():
+                continue
+            if worker is not None:
+                print(f"Fetch worker {index} exited with code {worker[0].exitcode}; restarting it")
+                worker[1].close()
+                worker[2].close()
+            task_receiver, task_sender = self.context.Pipe(duplex=False)
+            result_receiver, result_sender = self.context.Pipe(duplex=False)
+            process = self.context.Process(target=_worker_main, daemon=True,
+                                           args=(index, task_receiver, result_sender))
+            process.start()
+            # The child holds its own copies of these ends
+            task_receiver.close()
+            result_sender.close()
+            self.workers[index] = (process, task_sender, result_receiver)
+
+    def load(self, shard):
+        """Expected seconds to fetch a shard"""
+        return sum(self.latency.get(stock, DEFAULT_LATENCY) for stock in shard)
+
+    def shard(self, stocks):
+        """Split stocks into one list per worker with about equal total expected latency.
+
+        The previous split is kept for the same stocks unless a new one would finish
+        clearly sooner (see REBALANCE_TOLERANCE).
+        """
+        shards = self.balanced(stocks)
+        previous = self.shards
+        if previous is not None and sorted(sum(previous, [])) == sorted(stocks):
+            slowest = max(map(self.load, shards))
+            saving = max(map(self.load, previous)) - slowest
+            if saving <= max(slowest * REBALANCE_TOLERANCE, REBALANCE_MIN_SAVING):
+                return previous
+        self.shards = shards
+        return shards
+
+    def balanced(self, stocks):
+        """A fresh split: slowest symbols first, each on the currently lightest shard"""
+        shards = [[] for _ in range(self.processes)]
+        loads = [(0.0, index) for index in range(self.processes)]
+        for stock in sorted(stocks, key=lambda s: self.latency.get(s, DEFAULT_LATENCY), reverse=True):
+            load, index = heapq.heappop(loads)
+            shards[index].append(stock)
+            heapq.heappush(loads, (load + self.latency.get(stock, DEFAULT_LATENCY), index))
+        return shards
+
+    def observe(self, latencies):
+        """Fold one cycle's measured per-symbol latencies into the running estimates"""
+        for stock, seconds in latencies.items():
+            previous = self.latency.get(stock)
+            if previous is None:
+                self.latency[stock] = seconds
+            else:
+                self.latency[stock] = previous + LATENCY_SMOOTHING * (seconds - previous)
+
+    def run_cycle(self, stocks, due, rows, on_row, deadline):
+        """Refresh the due parts of each stock ({stock: parts}) across the workers, calling
+        on_row(row, fresh_parts) in this thread as rows arrive.
+
+        stocks is the whole watchlist, which is sharded whether due or not; rows are
+        the due stocks' current rows. Workers get the time left until deadline
+        (time.monotonic()) as their budget; rows still missing a little after it are
+        left for the next cycle. Returns each published stock's latency as timed by
+        its worker.
+        """
+        self._ensure_workers()
+        self.cycle += 1
+        known = set(stocks)
+        stocks = list(stocks) + [stock for stock in due if stock not in known]
+        rows = {row["stock"]: row for row in rows}
+        busy = {}
+        symbol_latency = {}
+        for index, shard in enumerate(self.shard(list(stocks))):
+            shard_due = {stock: due[stock] for stock in shard if stock in due}
+            if shard_due:
+                _, task_sender, result_receiver = self.workers[index]
+                task_sender.send((self.cycle, shard, shard_due,
+                                  [rows[stock] for stock in shard_due if stock in rows],
+                                  max(0, deadline - time.monotonic())))
+                busy[result_receiver] = index
+
+        while busy:
+            ready = wait(list(busy), timeout=max(0, deadline + RESULT_GRACE - time.monotonic()))
+            if not ready:
+                print(f"Fetch workers {sorted(busy.values())} overran the cycle budget; their remaining stocks are skipped")
+                break
+            for receiver in ready:
+                try:
+                    kind, cycle, payload = receiver.recv()
+                except EOFError:
+                    print(f"Fetch worker {busy.pop(receiver)} died during the cycle; its shard is skipped")
+                    continue
+                if cycle != self.cycle:
+                    continue  # Late results of a cycle already given up on
+                if kind == "row":
+                    on_row(*payload)
+                else:
+                    del busy[receiver]
+                    fetch_latency, latency = payload
+                    self.observe(fetch_latency)
+                    symbol_latency.update(latency)
+        return symbol_latency
+
+    def stop(self):
+        """Ask every worker to exit, terminating any that do not within a few seconds"""
+        for worker in self.workers:
+            if worker is not None and worker[0].is_alive():
+                try:
+                    worker[1].send(None)
+                except OSError:
+                    pass
+        deadline = time.monotonic() + 5
+        for worker in self.workers:
+            if worker is not None:
+                worker[0].join(max(0, deadline - time.monotonic()))
+                if worker[0].is_alive():
+                    worker[0].terminate()
+                worker[1].close()
+                worker[2].close()
+        self.workers = [None] * self.processes
@@ -0,0 +1,264 @@
+import csv
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from metrics import METRICS
+from watchlist_model import NUMERIC_COLUMNS, INTEGER_COLUMNS
+
+
+class BatchWriter:
+    """Base for outputs that a background thread writes in batches.
+
+    Subclasses implement _flush(), which writes whatever is pending and returns
+    False if it could not (the batch is then retried on the next interval), and
+    pending(). The thread flushes at most once every flush_interval seconds, or
+    soon after request_flush(); close() makes a final attempt.
+    """
+
+    # Names the output in metrics: stage_seconds{stage="<name>_write"}
+    name = "sink"
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.counters = {"writes": 0, "rows_written": 0, "write_time_total": 0.0, "write_time_max": 0.0}
+        self.running = False
+        self.flush_requested = threading.Event()
+        # Set by close() only, so requests cannot cut the debounce short
+        self.stopping = threading.Event()
+        self.writer_thread = None
+
+    def start(self):
+        self.running = True
+        self.writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self.writer_thread.start()
+
+    def request_flush(self):
+        """Ask the writer thread to flush as soon as possible without waiting for it"""
+        self.flush_requested.set()
+
+    def flush(self):
+        """Write everything pending. Returns False if it could not be written."""
+        with self.write_lock:
+            return self._flush()
+
+    def _flush(self):
+        raise NotImplementedError
+
+    def pending(self):
+        """Rows waiting to be written"""
+        return 0
+
+    def record(self, rows, elapsed):
+        """Count a successful write of `rows` rows that took `elapsed` seconds"""
+        METRICS.observe("stage_seconds", elapsed, stage=f"{self.name}_write")
+        with self.lock:
+            self.counters["writes"] += 1
+            self.counters["rows_written"] += rows
+            self.counters["write_time_total"] += elapsed
+            self.counters["write_time_max"] = max(self.counters["write_time_max"], elapsed)
+
+    def stats(self):
+        """Write counters, plus the average write time in seconds and rows still waiting"""
+        with self.lock:
+            stats = dict(self.counters)
+        stats["pending"] = self.pending()
+        stats["write_time_avg"] = stats["write_time_total"] / stats["writes"] if stats["writes"] else 0.0
+        return stats
+
+    def _writer_loop(self):
+        last_flush = 0
+        while self.running:
+            self.flush_requested.wait(self.flush_interval)
+            if not self.running:
+                break
+            requested = self.flush_requested.is_set()
+            self.flush_requested.clear()
+            # Debounce: explicit requests still wait out the minimum interval
+            wait = self.flush_interval - (time.monotonic() - last_flush)
+            if requested and wait > 0:
+                # Requests made meanwhile are folded into this flush
+                self.stopping.wait(wait)
+                self.flush_requested.clear()
+            if not self.running:
+                break
+            self.flush()
+            last_flush = time.monotonic()
+
+    def close(self):
+        """Stop the writer thread and make a final flush attempt"""
+        self.running = False
+        self.stopping.set()
+        self.flush_requested.set()
+        self.flush()
+
+
+class UpdateLog(BatchWriter):
+    """Append-only log of every published row, in publish order.
+
+    add() is a pipeline subscriber and only buffers the row; the writer thread
+    appends the buffer in one go. If a write fails the batch is kept for the next
+    one. At most max_pending rows are buffered; beyond that the oldest are dropped.
+    """
+
+    def __init__(self, path, columns, flush_interval=1, max_pending=100000):
+        super().__init__(flush_interval)
+        self.path = path
+        self.columns = list(columns)
+        self.max_pending = max_pending
+        self.buffer = deque(maxlen=max_pending)
+        self.counters["dropped"] = 0
+        self.start()
+
+    def add(self, row):
+        values = [row.get(col) for col in self.columns]
+        with self.lock:
+            # A full deque drops its oldest row on append
+            if len(self.buffer) == self.max_pending:
+                self.counters["dropped"] += 1
+            self.buffer.append(values)
+
+    def pending(self):
+        with self.lock:
+            return len(self.buffer)
+
+    def _flush(self):
+        with self.lock:
+            batch = list(self.buffer)
+            self.buffer.clear()
+        if not batch:
+            return True
+        started = time.perf_counter()
+        try:
+            self._write(batch)
+        except Exception as e:
+            print(f"Error writing {self.path}: {e}")
+            with self.lock:
+                # Put the batch back ahead of rows added since, dropping the oldest if full
+                buffer = deque(batch, maxlen=self.max_pending)
+                buffer.extend(self.buffer)
+                self.counters["dropped"] += len(batch) + len(self.buffer) - len(buffer)
+                self.buffer = buffer
+            return False
+        self.record(len(batch), time.perf_counter() - started)
+        return True
+
+    def _write(self, batch):
+        raise NotImplementedError
+
+
+class CsvLog(UpdateLog):
+    """Appends every update to a CSV file, with a header line when the file is new"""
+
+    name = "csv"
+
+    def _write(self, batch):
+        new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if new:
+                writer.writerow(self.columns)
+            writer.writerows(batch)
+
+
+class ParquetLog(UpdateLog):
+    """Writes every batch of updates as a new Parquet file in a directory.
+
+    Parquet files cannot be appended to, so the directory is the log: pandas and
+    pyarrow read it as one dataset (pd.read_parquet(path)). Files appear
+    atomically under their final name. Needs pyarrow or fastparquet.
+    """
+
+    name = "parquet"
+
+    def __init__(self, path, columns, flush_interval=60, max_pending=100000):
+        import pandas as pd
+
+        # Fails here, not on the first write, when no Parquet engine is installed
+        pd.io.parquet.get_engine("auto")
+        os.makedirs(path, exist_ok=True)
+        self.sequence = 0
+        super().__init__(path, columns, flush_interval, max_pending)
+
+    def _write(self, batch):
+        import pandas as pd
+
+        self.sequence += 1
+        name = f"part-{time.time_ns()}-{self.sequence:06d}.parquet"
+        # Readers skip dot files, so a half-written file is never picked up
+        temp_path = os.path.join(self.path, "." + name)
+        try:
+            pd.DataFrame(batch, columns=self.columns).to_parquet(temp_path, index=False)
+            os.replace(temp_path, os.path.join(self.path, name))
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+class SqliteSink(BatchWriter):
+    """Keeps a SQLite table with one row per stock in step with a WatchlistModel.
+
+    Like ExcelStore it writes the rows changed in the model since its last
+    successful write, here as upserts keyed on stock in a single transaction. The
+    database is in WAL mode, so other programs can read it while it is written.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path, columns, model, flush_interval=1, table="watchlist"):
+        super().__init__(flush_interval)
+        self.path = path
+        self.columns = list(columns)
+        self.model = model
+        self.table = table
+        # Model version of the last successful write; 0 writes every row first
+        self.written_version = 0
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        definitions = ", ".join(f'"{col}" {self._type(col)}' for col in self.columns)
+        with self.connection:
+            self.connection.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({definitions})')
+        quoted = [f'"{col}"' for col in self.columns]
+        updates = ", ".join(f"{col} = excluded.{col}" for col in quoted if col != '"stock"')
+        self.upsert = (f'INSERT INTO "{table}" ({", ".join(quoted)}) VALUES ({", ".join("?" * len(quoted))}) '
+                       f'ON CONFLICT("stock") DO UPDATE SET {updates}')
+        self.start()
+
+    @staticmethod
+    def _type(col):
+        if col == "stock":
+            return "TEXT PRIMARY KEY"
+        if col in INTEGER_COLUMNS:
+            return "INTEGER"
+        if col in NUMERIC_COLUMNS:
+            return "REAL"
+        return "TEXT"
+
+    def pending(self):
+        return len(self.model.changed_since(self.written_version)[0])
+
+    def _flush(self):
+        slots, version = self.model.changed_since(self.written_version)
+        if not len(slots):
+            return True
+        rows = [tuple(row[col] for col in self.columns) for row in self.model.rows(slots, self.columns)]
+        started = time.perf_counter()
+        try:
+            with self.connection:
+                self.connection.executemany(self.upsert, rows)
+        except sqlite3.Error as e:
+            print(f"Error writing {self.path}: {e}")
+            return False
+        # Rows updated while this write ran have newer versions and stay pending
+        self.written_version = version
+        self.record(len(rows), time.perf_counter() - started)
+        return True
+
+    def close(self):
+        super().close()
+        # The writer thread may still be finishing a flush of its own
+        self.writer_thread.join()
+        self.connection.close()
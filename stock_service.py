@@ -0,0 +1,751 @@
+import argparse
+import os
+import threading
+import time
+import numpy as np
+from tvDatafeed import TvDatafeed, Interval
+from tradingview_ta import TA_Handler, Interval as TA_Interval, get_multiple_analysis
+from refresh import RateLimiter, RefreshEngine, CircuitBreaker, CircuitOpenError, CycleBudgetExceeded, PartialResult
+from excel_store import ExcelStore
+from sinks import CsvLog, ParquetLog, SqliteSink
+from bar_store import BarStore, BAR_DTYPE, INTERVAL_SECONDS, exchange_seconds
+from cache import TTLCache
+from indicators import LocalTA, WINDOW, compare_recommendations
+from feed import FeedServer, FEED_HOST, FEED_PORT
+from sharding import ShardedFetcher
+from tv_stream import QuoteStream, BarAggregator
+from metrics import METRICS, MetricsFileWriter, METRICS_FILE_INTERVAL
+from watchlist import EXCEL_FILE, COLUMNS, load_rows, load_watchlist, display_rows, updated_now
+from watchlist_model import WatchlistModel, NUMERIC_COLUMNS
+from market_hours import RefreshScheduler
+
+# TradingView API clients (no login needed for public data). TvDatafeed keeps its
+# websocket on the instance, so every worker thread gets its own connection, and
+# none is opened until the first fetch.
+_thread_local = threading.local()
+
+def get_datafeed():
+    """Return the TvDatafeed client owned by the calling thread"""
+    if not hasattr(_thread_local, "tv"):
+        _thread_local.tv = TvDatafeed()
+    return _thread_local.tv
+
+# Available time intervals (mapped to both libraries)
+INTERVALS = {
+    "1 Minute": (Interval.in_1_minute, TA_Interval.INTERVAL_1_MINUTE),
+    "15 Minute": (Interval.in_15_minute, TA_Interval.INTERVAL_15_MINUTES),
+    "1 Hour": (Interval.in_1_hour, TA_Interval.INTERVAL_1_HOUR),
+    "1 Day": (Interval.in_daily, TA_Interval.INTERVAL_1_DAY),
+}
+
+# How often dirty rows are flushed to the Excel file (seconds); the file name,
+# columns and default watchlist live in watchlist.py
+EXCEL_FLUSH_INTERVAL = 5
+
+# Where rows are written: "xlsx" (the workbook), "csv" and "parquet" (append-only
+# logs of every update) and "sqlite" (a table with one row per stock, upserted).
+# Their files sit next to the workbook, which still provides the watchlist. With
+# other outputs on, the workbook becomes a snapshot rewritten every
+# EXCEL_SNAPSHOT_INTERVAL seconds.
+SINKS = ["xlsx", "csv", "parquet", "sqlite"]
+OUTPUT_SINKS = ["xlsx"]
+EXCEL_SNAPSHOT_INTERVAL = 60
+SINK_FILES = {"csv": ".updates.csv", "parquet": ".updates", "sqlite": ".db"}
+# Seconds between batched writes per output
+SINK_FLUSH_INTERVALS = {"csv": 1, "parquet": 60, "sqlite": 1}
+
+# Refresh engine settings: during NSE sessions a cycle starts after every
+# REFRESH_PERIOD boundary (see market_hours.py for what each cycle fetches), with
+# MAX_WORKERS threads and a limit of (requests per second, max requests in flight)
+# per endpoint. Every stock costs one "hist" request per cycle, so its rate sets
+# the watchlist size: 500 stocks take about 25 s at 20/s, leaving half of
+# CYCLE_BUDGET for retries and hedges (the bench measures 49 s at 10/s). Up to
+# about 900 stocks fit the budget at this rate. TA is batched (TA_CHUNK_SIZE
+# symbols per request), so "ta" needs only a few requests per cycle.
+REFRESH_PERIOD = 60
+MAX_WORKERS = 16
+ENDPOINT_LIMITS = {
+    "hist": (20, 16),
+    "ta": (10, 8),
+}
+# Failure handling per endpoint: a breaker opens after BREAKER_FAILURES failures in
+# a row and lets a probe through after BREAKER_RESET seconds; failed calls are
+# retried FETCH_RETRIES times with jittered backoff (RETRY_BACKOFF doubling per
+# attempt, at most RETRY_BACKOFF_MAX seconds)
+BREAKER_FAILURES = 5
+BREAKER_RESET = 30
+FETCH_RETRIES = 2
+RETRY_BACKOFF = 0.5
+RETRY_BACKOFF_MAX = 5
+# Seconds a bar fetch runs before a duplicate is sent on another connection (the
+# endpoint's observed p95 latency takes over once known); None disables hedging
+HEDGE_AFTER = {"hist": 3}
+# A cycle stops waiting for fetches after this many seconds, keeping it inside the
+# refresh period; stocks still pending keep their previous values and age
+CYCLE_BUDGET = 50
+# Worker processes the watchlist is sharded across (0 fetches in this process only)
+FETCH_PROCESSES = 0
+# Stream live quotes over TradingView's websocket. Polling still refreshes TA, and
+# fetches bars for any stock whose stream is down.
+STREAM_QUOTES = False
+# Ticks are coalesced per stock and published at most once per this many seconds,
+# the interval the CSV and SQLite outputs write at
+QUOTE_PUBLISH_INTERVAL = 1
+
+# Batched TA: symbols per scanner request. Symbols a response leaves out are
+# retried by the refresh engine like failed requests (FETCH_RETRIES), through the
+# "ta" limiter and within the cycle budget.
+TA_CHUNK_SIZE = 100
+
+# Where interval recommendations come from: "remote" (TradingView scanner), "local"
+# (indicators.py over stored bars) or "verify" (remote, checked against local)
+TA_SOURCE = "remote"
+# Minimum seconds between bar tail fetches per interval when TA is computed locally
+LOCAL_TA_BAR_REFRESH = {"1 Minute": 60, "15 Minute": 300, "1 Hour": 900, "1 Day": 3600}
+# Bars downloaded the first time a symbol/interval is seen, enough to warm up SMA 200
+BAR_HISTORY = WINDOW + 1
+# Completed 1-minute bars averaged for each row's "Avg Volume" (screener volume conditions)
+AVG_VOLUME_BARS = 20
+
+# Shared response cache for manual fetches and the refresh cycle: size bound and
+# TTL in seconds per (source, interval)
+CACHE_MAX_ENTRIES = 20000
+CACHE_TTL = {
+    ("bars", "1 Minute"): 30,
+    ("ta", "1 Minute"): 30,
+    ("ta", "15 Minute"): 120,
+    ("ta", "1 Hour"): 300,
+    ("ta", "1 Day"): 900,
+}
+
+def chunked(items, size):
+    """Split a list into tuples of at most `size` items"""
+    return [tuple(items[i:i + size]) for i in range(0, len(items), size)]
+
+class StockPipeline:
+    """The watchlist refresh pipeline without any GUI: bars, TA and the outputs.
+
+    Every finished row is written to the configured outputs (the Excel sheet by
+    default) and handed to each subscriber, from whichever thread produced it. The
+    Tk dashboard and the streaming feed are both just subscribers. Rows live in a
+    WatchlistModel, which the dashboard can pass in to share. Without an
+    excel_file nothing is persisted, which is how the pipelines inside sharded
+    worker processes run.
+    """
+
+    def __init__(self, stock_list, excel_file=EXCEL_FILE, on_locked=None, processes=FETCH_PROCESSES,
+                 stream=STREAM_QUOTES, datafeed_factory=get_datafeed, model=None, sinks=OUTPUT_SINKS):
+        self.stock_list = list(stock_list)
+        self.excel_file = excel_file
+        # Returns the TvDatafeed-compatible client for the calling thread
+        self.datafeed_factory = datafeed_factory
+        self.subscribers = []
+        self.subscribers_lock = threading.Lock()
+        # Latest row of every stock (the sheet's rows until refreshed), which failed
+        # fetches fall back to
+        self.model = model if model is not None else WatchlistModel()
+
+        # Batched background writers of the rows to each output
+        self.excel_store = None
+        self.sinks = []
+        if excel_file:
+            self.open_sinks(sinks, on_locked or self.warn_excel_locked)
+
+        # Response cache shared by manual fetches and the refresh cycle
+        self.cache = TTLCache(max_entries=CACHE_MAX_ENTRIES)
+
+        # Local OHLCV history, extended with only the newest bars on each refresh
+        self.bar_store = BarStore()
+        self.local_ta = LocalTA(self.bar_store, self.stock_list)
+        self.tail_fetched = {}
+        # Seconds the latest 1-minute bar fetch took, per stock
+        self.fetch_latency = {}
+        # Seconds from a stock's first fetch starting to its row being published, last cycle
+        self.symbol_latency = {}
+        # Parts of each stock's last published row that were fetched rather than served stale
+        self.fresh_parts = {}
+
+        # Concurrent refresh engine shared by the auto-update cycle
+        self.engine = RefreshEngine(
+            {name: RateLimiter(rate, in_flight) for name, (rate, in_flight) in ENDPOINT_LIMITS.items()},
+            max_workers=MAX_WORKERS,
+            breakers={name: CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET) for name in ENDPOINT_LIMITS},
+            retries=FETCH_RETRIES, retry_backoff=RETRY_BACKOFF, retry_backoff_max=RETRY_BACKOFF_MAX,
+            hedge_after=HEDGE_AFTER,
+        )
+
+        # Refresh cycles run in worker processes instead when sharding is on
+        self.sharded = ShardedFetcher(processes) if processes else None
+
+        # Which stocks and intervals are due each cycle, from NSE hours and bar closes
+        self.scheduler = RefreshScheduler(period=REFRESH_PERIOD)
+
+        # Live quotes folded into forming 1-minute bars
+        self.aggregator = BarAggregator(INTERVAL_SECONDS[INTERVALS["1 Minute"][0].value])
+        self.stream = QuoteStream(self.stock_list, self.on_quote) if stream else None
+        # Newest streamed bar of each stock that ticked since the last publish
+        self.quote_bars = {}
+        self.quote_lock = threading.Lock()
+        self.quote_thread = None
+        # Avg Volume per stock, recomputed only after its 1-minute bars change
+        self.avg_volume = {}
+        self.avg_volume_lock = threading.Lock()
+
+        self.running = False
+        self.stop_event = threading.Event()
+        self.update_thread = None
+
+        # Stats the components keep themselves are exported with the metrics
+        METRICS.add_collector("cache", self.cache.stats)
+        METRICS.add_collector("breaker", self.engine.stats)
+        for sink in self.sinks:
+            METRICS.add_collector(sink.name, sink.stats)
+
+    def open_sinks(self, names, on_locked):
+        """Start the writers of the named outputs"""
+        base = os.path.splitext(self.excel_file)[0]
+        if "xlsx" in names:
+            interval = EXCEL_FLUSH_INTERVAL if set(names) == {"xlsx"} else EXCEL_SNAPSHOT_INTERVAL
+            self.excel_store = ExcelStore(self.excel_file, COLUMNS, self.model, flush_interval=interval,
+                                          on_locked=on_locked)
+            self.sinks.append(self.excel_store)
+        elif not len(self.model):
+            # Failed fetches still fall back to the workbook's last rows
+            self.model.load(load_rows(self.excel_file))
+        for name in names:
+            if name == "xlsx":
+                continue
+            path = base + SINK_FILES[name]
+            try:
+                if name == "sqlite":
+                    sink = SqliteSink(path, COLUMNS, self.model, flush_interval=SINK_FLUSH_INTERVALS[name])
+                else:
+                    log = CsvLog if name == "csv" else ParquetLog
+                    sink = log(path, COLUMNS, flush_interval=SINK_FLUSH_INTERVALS[name])
+                    # Logs take every published row, not just the latest per stock
+                    self.subscribe(sink.add)
+            except Exception as e:
+                print(f"Error opening the {name} output {path}: {e}")
+                continue
+            self.sinks.append(sink)
+
+    # Subscribers
+
+    def subscribe(self, callback):
+        """Call callback(row) for every published row"""
+        with self.subscribers_lock:
+            self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self.subscribers_lock:
+            if callback in self.subscribers:
+                self.subscribers.remove(callback)
+
+    def set_watchlist(self, stock_list):
+        """Replace the stocks refreshed from the next cycle on.
+
+        Local TA keeps its indicator state unless the set of stocks changed.
+        """
+        changed = set(stock_list) != set(self.stock_list)
+        self.stock_list = list(stock_list)
+        if changed:
+            self.local_ta = LocalTA(self.bar_store, self.stock_list)
+
+    def publish(self, row):
+        """Store a finished row and pass it on to every subscriber"""
+        self.model.update(row)
+        self.scheduler.observe(row)
+        METRICS.inc("rows_published_total")
+        with self.subscribers_lock:
+            subscribers = list(self.subscribers)
+        for callback in subscribers:
+            try:
+                callback(row)
+            except Exception as e:
+                print(f"Error publishing {row['stock']}: {e}")
+
+    def snapshot(self):
+        """Current row for every stock: the model's rows, then placeholders for stocks not in it yet"""
+        return display_rows(self.model.rows(columns=COLUMNS), self.stock_list)
+
+    def warn_excel_locked(self):
+        print(f"Cannot update {self.excel_file} because it is open in another program. "
+              f"Updates will be saved once it is closed.")
+
+    # Streaming
+
+    def on_quote(self, stock, quote):
+        """Fold a streamed quote into the stock's 1-minute bar; publish_quotes() publishes it"""
+        price, volume = quote.get("lp"), quote.get("volume")
+        if price is None or volume is None:
+            return
+        METRICS.inc("quotes_total")
+        # lp_time is a true epoch; bars are bucketed in the store's IST wall-clock times
+        ts = exchange_seconds(quote.get("lp_time") or time.time())
+        bar, closed = self.aggregator.update(stock, price, volume, ts)
+        if closed is not None:
+            if not self.bar_store.append(stock, "NSE", INTERVALS["1 Minute"][0], np.array([closed], dtype=BAR_DTYPE)):
+                METRICS.inc("stream_bars_rejected_total")
+            self.forget_average_volume(stock)
+        with self.quote_lock:
+            self.quote_bars[stock] = bar
+
+    def publish_quotes(self):
+        """Publish one row for every stock that ticked since the last call, with its newest bar"""
+        with self.quote_lock:
+            bars, self.quote_bars = self.quote_bars, {}
+        for stock, bar in bars.items():
+            previous = self.model.row(stock) or {}
+            ta_data = {name: previous.get(name) or "-" for name in INTERVALS}
+            # The TA is only as fresh as the last poll, so the row keeps that poll's time
+            self.publish(self.build_excel_data(stock, bar, ta_data, previous.get("Updated")))
+
+    def run_quote_publisher(self):
+        while not self.stop_event.wait(QUOTE_PUBLISH_INTERVAL):
+            self.publish_quotes()
+
+    def streamed_bar(self, stock):
+        """The forming 1-minute bar of a stock whose quote stream is up, or None"""
+        if self.stream is None or not self.stream.is_live(stock):
+            return None
+        return self.aggregator.current(stock)
+
+    # Fetching
+
+    def fetch_latest_bar(self, stock):
+        """Fetch the 1-minute bars missing from the local store and return the most recent one"""
+        return self.cache.get_or_load(("bars", stock, "1 Minute"), CACHE_TTL[("bars", "1 Minute")],
+                                      lambda: self.load_latest_bar(stock))
+
+    def cache_latest_bar(self, stock, bar):
+        """Keep a bar the refresh cycle fetched, so fetch_latest_bar reuses it like one it loaded"""
+        self.cache.put(("bars", stock, "1 Minute"), bar, CACHE_TTL[("bars", "1 Minute")])
+
+    def load_latest_bar(self, stock):
+        """fetch_latest_bar without the cache; safe to run twice at once, as hedged fetches do.
+
+        TvDatafeed logs failures and returns nothing, so an empty answer raises here
+        for the refresh engine to retry and count against the endpoint's breaker.
+        """
+        started = time.monotonic()
+        bars = self.fetch_bar_tail(stock, "1 Minute")
+        if not len(bars):
+            raise ValueError(f"No bars returned for {stock}")
+        self.fetch_latency[stock] = time.monotonic() - started
+        return bars[-1]
+
+    def fetch_bar_tail(self, stock, interval_name):
+        """Bring the local bar store for one stock and interval up to date"""
+        tv_interval, _ = INTERVALS[interval_name]
+        with METRICS.timer("stage_seconds", stage="get_hist", interval=interval_name):
+            bars = self.bar_store.fetch_tail(self.datafeed_factory(), stock, "NSE", tv_interval,
+                                             initial_bars=BAR_HISTORY)
+        if interval_name == "1 Minute" and len(bars):
+            self.forget_average_volume(stock)
+        return bars
+
+    def fetch_recommendation(self, stock, interval_name):
+        """Fetch the TradingView recommendation for a stock on one interval"""
+        def load():
+            _, ta_int = INTERVALS[interval_name]
+            stock_ta = TA_Handler(symbol=stock, screener="india", exchange="NSE", interval=ta_int)
+            with METRICS.timer("stage_seconds", stage="ta", interval=interval_name):
+                return stock_ta.get_analysis().summary["RECOMMENDATION"]
+        return self.cache.get_or_load(("ta", stock, interval_name), CACHE_TTL[("ta", interval_name)], load)
+
+    def average_volume(self, stock):
+        """Mean volume of the last AVG_VOLUME_BARS completed 1-minute bars, or None.
+
+        Cached until the stock's 1-minute bars change, so streamed ticks do not map the file.
+        """
+        with self.avg_volume_lock:
+            if stock not in self.avg_volume:
+                bars = self.bar_store.read(stock, "NSE", INTERVALS["1 Minute"][0])
+                recent = bars["volume"][-AVG_VOLUME_BARS - 1:-1]
+                self.avg_volume[stock] = float(recent.mean()) if len(recent) else None
+            return self.avg_volume[stock]
+
+    def forget_average_volume(self, stock):
+        with self.avg_volume_lock:
+            self.avg_volume.pop(stock, None)
+
+    def build_excel_data(self, stock, latest_row, ta_data, updated):
+        """Prepare a row for Excel and subscribers (Avg Volume is not saved to the sheet)"""
+        return {
+            "stock": stock,
+            "Open": latest_row["open"],
+            "High": latest_row["high"],
+            "Low": latest_row["low"],
+            "CMP": latest_row["close"],
+            "Volume": latest_row["volume"],
+            "1 Minute": ta_data["1 Minute"],
+            "15 Minute": ta_data["15 Minute"],
+            "1 Hour": ta_data["1 Hour"],
+            "1 Day": ta_data["1 Day"],
+            "Updated": updated,
+            "Avg Volume": self.average_volume(stock),
+        }
+
+    def update_stock(self, stock):
+        """Fetch and publish the row for a single stock; returns it, or None on failure"""
+        try:
+            latest_row = self.streamed_bar(stock)
+            if latest_row is None:
+                latest_row = self.fetch_latest_bar(stock)
+            if latest_row is None:
+                return None
+
+            # Fetch Technical Analysis for all intervals
+            if TA_SOURCE == "local":
+                for name in INTERVALS:
+                    if name != "1 Minute":
+                        self.fetch_bar_tail(stock, name)
+                ta_data = {name: recs[stock] for name, recs in self.local_recommendations().items()}
+            else:
+                ta_data = {name: self.fetch_recommendation(stock, name) for name in INTERVALS}
+
+            excel_data = self.build_excel_data(stock, latest_row, ta_data, updated_now())
+            self.publish(excel_data)
+            self.request_flush()
+            return excel_data
+
+        except Exception as e:
+            print(f"Error updating {stock}: {e}")
+            return None
+
+    def fetch_recommendations_batch(self, stocks, interval_name):
+        """Recommendations for a chunk of stocks; only those not cached are scanned.
+
+        Raises PartialResult (holding what was found) if the scan left stocks out.
+        The found ones are cached, so the engine's retry only scans the rest.
+        """
+        def load(keys):
+            results = self.scan_recommendations([stock for _, stock, _ in keys], interval_name)
+            return {("ta", stock, interval_name): rec for stock, rec in results.items()}
+        keys = [("ta", stock, interval_name) for stock in stocks]
+        results = self.cache.get_many_or_load(keys, CACHE_TTL[("ta", interval_name)], load)
+        results = {stock: rec for (_, stock, _), rec in results.items()}
+        missing = [stock for stock, rec in results.items() if rec is None]
+        if missing:
+            raise PartialResult(f"{len(missing)} of {len(stocks)} stocks missing from the {interval_name} scan",
+                                results)
+        return results
+
+    def scan_recommendations(self, stocks, interval_name):
+        """Fetch recommendations for a chunk of stocks with one scanner request; stocks
+        missing from the response map to None"""
+        _, ta_int = INTERVALS[interval_name]
+        with METRICS.timer("stage_seconds", stage="ta_scan", interval=interval_name):
+            analyses = get_multiple_analysis(screener="india", interval=ta_int,
+                                             symbols=[f"NSE:{stock}" for stock in stocks])
+        results = {}
+        for stock in stocks:
+            analysis = analyses.get(f"NSE:{stock}")
+            results[stock] = None if analysis is None else analysis.summary["RECOMMENDATION"]
+        return results
+
+    def local_recommendations(self):
+        """Recommendations computed from stored bars, as {interval name: {stock: recommendation}}"""
+        return {name: self.local_ta.recommendations(tv_interval) for name, (tv_interval, _) in INTERVALS.items()}
+
+    def due_tail_intervals(self):
+        """Intervals (other than 1 Minute, fetched every cycle) whose bar tails should be refreshed now"""
+        now = time.monotonic()
+        due = []
+        for name in INTERVALS:
+            if name == "1 Minute":
+                continue
+            if now - self.tail_fetched.get(name, float("-inf")) >= LOCAL_TA_BAR_REFRESH[name]:
+                self.tail_fetched[name] = now
+                due.append(name)
+        return due
+
+    def previous_part(self, stock, part):
+        """A part ("bar" or an interval name) of the stock's last row, or None if there is none"""
+        previous = self.model.row(stock)
+        if not previous:
+            return None
+        if part != "bar":
+            return previous[part]
+        bar = {field: previous[col] for field, col in
+               (("open", "Open"), ("high", "High"), ("low", "Low"), ("close", "CMP"), ("volume", "Volume"))}
+        return None if any(value is None for value in bar.values()) else bar
+
+    def request_flush(self):
+        for sink in self.sinks:
+            sink.request_flush()
+
+    def scheduled_parts(self):
+        """Intervals whose TA is fetched on bar close; local TA is recomputed every cycle instead"""
+        return [] if TA_SOURCE == "local" else list(INTERVALS)
+
+    def record_symbol_latency(self, stock, seconds):
+        """Record how long a stock's fetches took, from the first starting to its row being published"""
+        self.symbol_latency[stock] = seconds
+        METRICS.observe("symbol_latency_seconds", seconds)
+        METRICS.set("symbol_last_latency_seconds", seconds, stock=stock)
+
+    def plan_all(self):
+        """A cycle plan that fetches every part of every stock, ignoring the schedule"""
+        return {stock: ["bar"] + self.scheduled_parts() for stock in self.stock_list}
+
+    def merge_fresh_parts(self, row, fresh):
+        """A worker's row with only its fresh parts taken; the rest keep the value shown here.
+
+        Another refresh may have updated those parts since the worker was sent them.
+        """
+        current = self.model.row(row["stock"])
+        if current is None:
+            return row
+        merged = dict(row)
+        if "bar" not in fresh:
+            for col in NUMERIC_COLUMNS:
+                merged[col] = current[col]
+        for interval_name in INTERVALS:
+            if interval_name not in fresh:
+                merged[interval_name] = current[interval_name]
+        return merged
+
+    def refresh_cycle(self, due=None, budget=CYCLE_BUDGET):
+        """Fetch bars and batched TA concurrently for the stocks due this cycle, publishing each as soon as it completes.
+
+        due maps each stock to fetch to its parts ("bar" and interval names), highest
+        priority first; by default the scheduler decides. Intervals not due keep the
+        value already shown. A part that fails, or is still pending when budget
+        (seconds) runs out, is served from the stock's last row, which then keeps its
+        old "Updated" time and is fetched again next cycle.
+        """
+        cycle_started = time.monotonic()
+        deadline = cycle_started + budget
+        keys = None
+        if due is None:
+            keys, due = self.scheduler.plan(self.stock_list, self.scheduled_parts())
+            METRICS.set("market_open", int(self.scheduler.calendar.is_open()))
+        METRICS.inc("stocks_skipped_total", len(self.stock_list) - len(due))
+        if not due:
+            return
+
+        if self.sharded:
+            published = set()
+
+            def on_row(row, fresh):
+                stock = row["stock"]
+                published.add(stock)
+                self.publish(self.merge_fresh_parts(row, fresh))
+                if "bar" in fresh:
+                    self.cache_latest_bar(stock, self.previous_part(stock, "bar"))
+                for part in due[stock]:
+                    if part not in fresh:
+                        METRICS.inc("stale_parts_total", part=part)
+                self.scheduler.done(stock, fresh, keys)
+            # Workers start from the rows shown here, so their stale parts match ours
+            rows = [row for row in (self.model.row(stock) for stock in due) if row is not None]
+            # Workers time their own fetches; time spent waiting for a shard is not the symbol's
+            for stock, seconds in self.sharded.run_cycle(self.stock_list, due, rows, on_row, deadline).items():
+                self.record_symbol_latency(stock, seconds)
+            missing = len(due) - len(published)
+            if missing:
+                print(f"Refresh cycle: {missing} stocks not refreshed by the fetch workers; last values kept")
+            self.request_flush()
+            return
+
+        stocks = list(due)
+        pending = {stock: {} for stock in stocks}
+        # Parts served from the previous row, per stock
+        stale = {stock: set() for stock in stocks}
+        # Failures reported once per cycle rather than per stock: open breakers and the budget
+        skipped = {}
+        remote = {name: {} for name in INTERVALS}
+        for stock in stocks:
+            # Intervals not due keep their shown value; one with nothing to show is fetched anyway
+            previous = self.model.row(stock, self.scheduled_parts()) or {}
+            for interval_name in self.scheduled_parts():
+                if interval_name in due[stock]:
+                    continue
+                value = previous.get(interval_name)
+                if value is None:
+                    due[stock].append(interval_name)
+                else:
+                    pending[stock][interval_name] = value
+
+        # Streamed stocks already have a live bar; only the rest are polled
+        streamed = {stock: self.streamed_bar(stock) for stock in stocks}
+        streamed = {stock: bar for stock, bar in streamed.items() if bar is not None}
+        jobs = [("hist", ("bar", stock), self.load_latest_bar, (stock,))
+                for stock in stocks if stock not in streamed]
+        if TA_SOURCE in ("local", "verify"):
+            for interval_name in self.due_tail_intervals():
+                for stock in self.stock_list:
+                    jobs.append(("hist", ("tail", interval_name, stock), self.fetch_bar_tail, (stock, interval_name)))
+        if TA_SOURCE in ("remote", "verify"):
+            for interval_name in INTERVALS:
+                wanted = [stock for stock in stocks if interval_name in due[stock]]
+                for chunk in chunked(wanted, TA_CHUNK_SIZE):
+                    jobs.append(("ta", ("ta", interval_name, chunk), self.fetch_recommendations_batch, (chunk, interval_name)))
+
+        # A stock's latency runs from the first of its jobs starting, not from the
+        # cycle start, so time spent queued behind other stocks does not count
+        job_keys = {stock: [("bar", stock)] for stock in stocks}
+        for _, key, _, _ in jobs:
+            if key[0] == "ta":
+                for stock in key[2]:
+                    job_keys[stock].append(key)
+        job_started = {}
+
+        def timed(key, fn):
+            def run(*args):
+                job_started.setdefault(key, time.monotonic())
+                return fn(*args)
+            return run
+        jobs = [(endpoint, key, timed(key, fn), args) for endpoint, key, fn, args in jobs]
+
+        def add_part(stock, part, value, error=None):
+            parts = pending.get(stock)
+            if parts is None:
+                return  # Stock already failed earlier in this cycle
+            if error is not None or value is None:
+                if isinstance(error, (CircuitOpenError, CycleBudgetExceeded)):
+                    skipped[type(error).__name__] = skipped.get(type(error).__name__, 0) + 1
+                else:
+                    print(f"Error updating {stock}: {error or f'no {part} data'}")
+                METRICS.inc("errors_total", part=part)
+                value = self.previous_part(stock, part)
+                if value is None:
+                    del pending[stock]
+                    return
+                stale[stock].add(part)
+                METRICS.inc("stale_parts_total", part=part)
+            parts[part] = value
+            if len(parts) == len(INTERVALS) + 1:
+                del pending[stock]
+                updated = self.model.row(stock, ("Updated",))["Updated"] if stale[stock] else updated_now()
+                self.fresh_parts[stock] = [part for part in due[stock] if part not in stale[stock]]
+                self.publish(self.build_excel_data(stock, parts.pop("bar"), parts, updated))
+                self.scheduler.done(stock, self.fresh_parts[stock], keys)
+                started = [job_started[key] for key in job_keys[stock] if key in job_started]
+                if started:
+                    self.record_symbol_latency(stock, time.monotonic() - min(started))
+
+        def on_result(key, result, error):
+            if key[0] == "bar":
+                # Cycle jobs bypass the cache so hedges can run; a manual fetch still reuses them
+                if result is not None:
+                    self.cache_latest_bar(key[1], result)
+                add_part(key[1], "bar", result, error)
+            elif key[0] == "tail":
+                if error is not None:
+                    print(f"Error fetching {key[1]} bars for {key[2]}: {error}")
+                    METRICS.inc("errors_total", part="tail")
+            else:
+                _, interval_name, chunk = key
+                # Stocks the scan found still count; the rest fail with the error
+                if isinstance(error, PartialResult):
+                    result, error = error.result, None
+                for stock in chunk:
+                    value = (result or {}).get(stock)
+                    remote[interval_name][stock] = value
+                    add_part(stock, interval_name, value, error)
+
+        for stock, bar in streamed.items():
+            add_part(stock, "bar", bar)
+        self.engine.run_cycle(jobs, on_result, deadline=deadline)
+        for reason, count in skipped.items():
+            print(f"Refresh cycle: {count} fetches not made or abandoned ({reason}); last values kept")
+
+        if TA_SOURCE in ("local", "verify"):
+            local = self.local_recommendations()
+            if TA_SOURCE == "local":
+                for interval_name, recs in local.items():
+                    for stock in list(pending):
+                        add_part(stock, interval_name, recs.get(stock))
+            else:
+                for interval_name, recs in local.items():
+                    exact, direction, mismatches = compare_recommendations(recs, remote[interval_name])
+                    if exact is not None:
+                        print(f"Local TA {interval_name}: {exact:.0%} exact, {direction:.0%} same direction, "
+                              f"{len(mismatches)} mismatches")
+        self.request_flush()
+
+    # Lifecycle
+
+    def run(self):
+        """Run refresh cycles when the scheduler says until stopped"""
+        while self.running:
+            started = time.monotonic()
+            self.refresh_cycle()
+            elapsed = time.monotonic() - started
+            METRICS.observe("cycle_seconds", elapsed)
+            METRICS.set("last_cycle_seconds", elapsed)
+            METRICS.set("watchlist_size", len(self.stock_list))
+            if elapsed > REFRESH_PERIOD:
+                print(f"Refresh cycle took {elapsed:.1f}s, longer than {REFRESH_PERIOD}s")
+                METRICS.inc("cycle_overruns_total")
+                METRICS.inc("cycle_overrun_seconds_total", elapsed - REFRESH_PERIOD)
+            self.stop_event.wait(self.scheduler.next_run())
+
+    def start(self):
+        """Run the refresh loop on a background thread"""
+        self.running = True
+        self.stop_event.clear()
+        self.update_thread = threading.Thread(target=self.run, daemon=True)
+        self.update_thread.start()
+        if self.stream:
+            self.quote_thread = threading.Thread(target=self.run_quote_publisher, daemon=True)
+            self.quote_thread.start()
+            self.stream.start()
+
+    def stop(self):
+        """Stop refreshing and make a final flush of every output"""
+        self.running = False
+        self.stop_event.set()
+        if self.stream:
+            self.stream.stop()
+            self.publish_quotes()
+        self.engine.shutdown()
+        if self.sharded:
+            self.sharded.stop()
+        for sink in self.sinks:
+            sink.close()
+            METRICS.remove_collector(sink.name)
+        METRICS.remove_collector("cache")
+        METRICS.remove_collector("breaker")
+
+def main():
+    """Run the pipeline headless and stream its rows to dashboards over HTTP"""
+    parser = argparse.ArgumentParser(description="Headless stock data service with a streaming feed")
+    parser.add_argument("--host", default=FEED_HOST, help="address to serve the feed on")
+    parser.add_argument("--port", type=int, default=FEED_PORT, help="port to serve the feed on")
+    parser.add_argument("--excel", default=EXCEL_FILE, help="workbook holding the watchlist and results")
+    parser.add_argument("--processes", type=int, default=FETCH_PROCESSES,
+                        help="worker processes to shard the watchlist across (0 = fetch in this process)")
+    parser.add_argument("--stream", action="store_true", default=STREAM_QUOTES,
+                        help="stream live quotes over TradingView's websocket instead of polling bars")
+    parser.add_argument("--sinks", nargs="+", choices=SINKS, default=OUTPUT_SINKS,
+                        help="outputs to write rows to, next to the workbook (default: xlsx)")
+    parser.add_argument("--metrics-file", help="also write the metrics to this file every few seconds")
+    args = parser.parse_args()
+
+    pipeline = StockPipeline(load_watchlist(args.excel), excel_file=args.excel, processes=args.processes,
+                             stream=args.stream, sinks=args.sinks)
+    server = FeedServer(pipeline, args.host, args.port)
+    server.start()
+    metrics_writer = None
+    if args.metrics_file:
+        metrics_writer = MetricsFileWriter(path=args.metrics_file, interval=METRICS_FILE_INTERVAL)
+        metrics_writer.start()
+    pipeline.start()
+    print(f"Serving {len(pipeline.stock_list)} stocks on http://{args.host}:{server.port}/stream "
+          f"(metrics at /metrics)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        pipeline.stop()
+        if metrics_writer:
+            metrics_writer.stop()
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,35 @@
+import argparse
+import threading
 import tkinter as tk
 from tkinter import ttk, messagebox
-from tvDatafeed import TvDatafeed, Interval
-import pandas as pd
-from tradingview_ta import TA_Handler, Interval as TA_Interval, Exchange
-import os
-import threading
-import time
-import shutil
-import tempfile
-
-# Initialize TradingView API (no login needed for public data)
-tv = TvDatafeed()
-
-# Available time intervals (mapped to both libraries)
-INTERVALS = {
-    "1 Minute": (Interval.in_1_minute, TA_Interval.INTERVAL_1_MINUTE),
-    "15 Minute": (Interval.in_15_minute, TA_Interval.INTERVAL_15_MINUTES),
-    "1 Hour": (Interval.in_1_hour, TA_Interval.INTERVAL_1_HOUR),
-    "1 Day": (Interval.in_daily, TA_Interval.INTERVAL_1_DAY),
-}
-
-# Excel file name
-EXCEL_FILE = "stock_data.xlsx"
-TEMP_FILE = os.path.join(tempfile.gettempdir(), "stock_data_temp.xlsx")
+from ui_updates import TreeviewUpdater
+from feed import FeedClient
+from metrics import METRICS, MetricsFileWriter, MetricsServer, METRICS_FILE_INTERVAL
+from watchlist import EXCEL_FILE, COLUMNS, INTERVAL_NAMES, load_rows, load_watchlist, stocks_in, row_age
+from watchlist_model import WatchlistModel
+
+# stock_service (pandas, openpyxl, tvDatafeed, tradingview_ta) is imported on a
+# background thread once the window is up; see start_pipeline(). The screener is
+# imported when its window first opens.
+
+# How many times per second queued row updates are applied to the table
+TREE_UPDATE_FPS = 30
+# Watchlists at least this long use the virtualized table (sortable, filterable,
+# only the visible rows exist as widgets)
+VIRTUAL_TABLE_MIN_ROWS = 300
+# The table shows how old each row is instead of the sheet's "Updated" time; the
+# ages of the rows on screen tick along with the status line
+TABLE_COLUMNS = [col for col in COLUMNS if col != "Updated"] + ["Age (s)"]
+# Metrics tab: refresh period (ms) and how many of the slowest stocks it lists
+METRICS_REFRESH_MS = 1000
+METRICS_SLOWEST_STOCKS = 10
+# Screener window: example query, redraw period (ms) and most rows listed
+SCREENER_EXAMPLE = "15 Minute = STRONG_BUY and 1 Hour = STRONG_BUY and Volume Ratio > 2"
+SCREENER_REFRESH_MS = 1000
+SCREENER_LIMIT = 500
 
 class TradingViewApp:
-    def __init__(self, root):
+    def __init__(self, root, feed_url=None, processes=None, stream=None, show_metrics=False, sinks=None):
         self.root = root
         self.root.title("NSE Stock Data - TradingView")
         self.root.geometry("1000x600")
@@ -46,6 +50,32 @@ class TradingViewApp:
             "STRONG_SELL": "darkred"
         }
 
+        # Data source: a pipeline running in this process, or a feed served by
+        # a headless stock_service.py
+        self.feed_url = feed_url
+        # Every row lives in one model, shared with the pipeline, table and screener
+        self.model = WatchlistModel()
+        self.pipeline = None
+        self.pipeline_lock = threading.Lock()
+        if feed_url:
+            self.feed = FeedClient(feed_url, self.update_treeview_row)
+            try:
+                initial_rows = self.feed.snapshot()
+            except Exception as e:
+                print(f"Error loading snapshot from {feed_url}: {e}")
+                initial_rows = []
+            self.stock_list = [row["stock"] for row in initial_rows] or load_watchlist()
+            self.model.load(initial_rows)
+        else:
+            # The table starts from the rows saved with the workbook; the pipeline
+            # itself is started in the background
+            self.feed = None
+            rows = load_rows(EXCEL_FILE)
+            self.stock_list = stocks_in(rows)
+            self.model.load(rows)
+        # Stocks without a row yet still get one, shown as placeholders
+        self.model.load({"stock": stock} for stock in self.stock_list if stock not in self.model)
+
         # Title Label
         tk.Label(root, text="NSE Stock Data Dashboard", font=("Arial", 18, "bold"), bg="#f0f0f0", fg="#333333").pack(pady=10)
 
@@ -54,8 +84,6 @@ class TradingViewApp:
         input_frame.pack(pady=10)
 
         # Stock Selection (Fetched from Excel)
-        self.stock_list = self.load_stocks_from_excel() or ["RELIANCE", "TCS", "HDFCBANK", "INFY", "SBIN",
-                                                           "ICICIBANK", "HINDUNILVR", "KOTAKBANK", "LT", "BAJFINANCE"]
         self.stock_var = tk.StringVar(value=self.stock_list[0])
         ttk.Label(input_frame, text="Select Stock:").pack(side="left", padx=5)
         self.stock_menu = ttk.Combobox(input_frame, textvariable=self.stock_var, values=self.stock_list, state="readonly", width=20)
@@ -64,179 +92,384 @@ class TradingViewApp:
         # Interval Selection
         self.interval_var = tk.StringVar(value="1 Hour")
         ttk.Label(input_frame, text="Select Time Interval:").pack(side="left", padx=5)
-        self.interval_menu = ttk.Combobox(input_frame, textvariable=self.interval_var, values=list(INTERVALS.keys()), state="readonly", width=20)
+        self.interval_menu = ttk.Combobox(input_frame, textvariable=self.interval_var, values=INTERVAL_NAMES, state="readonly", width=20)
         self.interval_menu.pack(side="left", padx=5)
 
         # Fetch Data Button
         self.fetch_button = ttk.Button(input_frame, text="Fetch Data", command=self.fetch_data)
         self.fetch_button.pack(side="left", padx=5)
 
-        # Table Frame with Scrollbar
-        self.table_frame = tk.Frame(root, bg="#ffffff", bd=2, relief="groove")
-        self.table_frame.pack(expand=True, fill="both", padx=10, pady=10)
+        # Screener over the model's rows, built when its window first opens
+        self.screener = None
+        self.screener_window = None
+        ttk.Button(input_frame, text="Screener", command=self.open_screener).pack(side="left", padx=5)
+
+        # Status line (cache or feed statistics), kept at the bottom of the window
+        self.status_var = tk.StringVar()
+        tk.Label(root, textvariable=self.status_var, bg="#f0f0f0", fg="#555555", anchor="w").pack(side="bottom", fill="x", padx=10)
+
+        # Table Frame with Scrollbar, on a tab beside the metrics when those are shown
+        self.show_metrics = show_metrics
+        if show_metrics:
+            self.notebook = ttk.Notebook(root)
+            self.notebook.pack(expand=True, fill="both", padx=10, pady=10)
+            self.table_frame = tk.Frame(self.notebook, bg="#ffffff", bd=2, relief="groove")
+            self.notebook.add(self.table_frame, text="Watchlist")
+        else:
+            self.table_frame = tk.Frame(root, bg="#ffffff", bd=2, relief="groove")
+            self.table_frame.pack(expand=True, fill="both", padx=10, pady=10)
 
         # Treeview Table (Matching Excel Columns)
-        self.tree = ttk.Treeview(self.table_frame, columns=("stock", "Open", "High", "Low", "CMP", "Volume", 
-                                                            "1 Minute", "15 Minute", "1 Hour", "1 Day"), 
-                                 show="headings", height=15)
-        for col in self.tree["columns"]:
-            self.tree.heading(col, text=col)
-            self.tree.column(col, width=100, anchor="center")
-        
-        # Configure tags for color coding
-        for status, color in self.tree_tag_colors.items():
-            self.tree.tag_configure(status, background=color, foreground="white")
-
-        scrollbar = ttk.Scrollbar(self.table_frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
-        scrollbar.pack(side="right", fill="y")
-        self.tree.pack(side="left", expand=True, fill="both")
-
-        # Load initial data from Excel
-        self.load_initial_excel_data()
+        self.virtual = len(self.stock_list) >= VIRTUAL_TABLE_MIN_ROWS
+        if self.virtual:
+            self.build_virtual_table()
+        else:
+            self.table = None
+            self.tree = ttk.Treeview(self.table_frame, columns=TABLE_COLUMNS, show="headings", height=15)
+            for col in self.tree["columns"]:
+                self.tree.heading(col, text=col)
+                self.tree.column(col, width=100, anchor="center")
+
+            # Configure tags for color coding
+            for status, color in self.tree_tag_colors.items():
+                self.tree.tag_configure(status, background=color, foreground="white")
+
+            scrollbar = ttk.Scrollbar(self.table_frame, orient="vertical", command=self.tree.yview)
+            self.tree.configure(yscrollcommand=scrollbar.set)
+            scrollbar.pack(side="right", fill="y")
+            self.tree.pack(side="left", expand=True, fill="both")
+
+        # Load the current rows into the table
+        self.load_initial_rows()
+
+        # Row updates from worker threads are coalesced and applied on the Tk thread;
+        # the virtual table instead repaints from the model whenever it changed
+        if self.virtual:
+            self.tree_updater = None
+            self.table.start()
+        else:
+            self.tree_updater = TreeviewUpdater(self.root, self.tree, fps=TREE_UPDATE_FPS)
+            self.tree_updater.start()
+            METRICS.add_collector("treeview", self.tree_updater.stats)
+        if show_metrics:
+            self.build_metrics_tab()
 
-        # Start auto-update thread
+        # Start receiving updates
         self.running = True
-        self.update_thread = threading.Thread(target=self.auto_update_excel, daemon=True)
-        self.update_thread.start()
-
-    def load_stocks_from_excel(self):
-        """Load stock list from the first column of the Excel file"""
-        if os.path.exists(EXCEL_FILE):
-            try:
-                df = pd.read_excel(EXCEL_FILE)
-                if "stock" in df.columns:
-                    return list(df["stock"].dropna().unique())
-            except Exception as e:
-                print(f"Error loading stocks from Excel: {e}")
-        return None
+        if self.feed:
+            self.feed.start()
+        else:
+            threading.Thread(target=self.start_pipeline, args=(processes, stream, sinks), daemon=True).start()
+        self.refresh_status()
+        if show_metrics:
+            self.refresh_metrics()
 
-    def load_initial_excel_data(self):
-        """Load initial data from Excel into Treeview"""
+    def start_pipeline(self, processes, stream, sinks):
+        """Import and start the fetch pipeline; runs on a background thread so the window shows first"""
+        try:
+            import stock_service
+            pipeline = stock_service.StockPipeline(
+                self.stock_list, on_locked=self.warn_excel_locked, model=self.model,
+                processes=stock_service.FETCH_PROCESSES if processes is None else processes,
+                stream=stock_service.STREAM_QUOTES if stream is None else stream,
+                sinks=stock_service.OUTPUT_SINKS if sinks is None else sinks)
+        except Exception as e:
+            print(f"Error starting the data pipeline: {e}")
+            return
+        with self.pipeline_lock:
+            if not self.running:
+                pipeline.stop()
+                return
+            pipeline.subscribe(self.update_treeview_row)
+            pipeline.start()
+            self.pipeline = pipeline
+
+    def build_virtual_table(self):
+        """Create the virtualized table with a filter bar; column headings sort"""
+        # Imported here since only large watchlists use it
+        from virtual_table import VirtualTable
+
+        filter_frame = tk.Frame(self.table_frame, bg="#ffffff")
+        filter_frame.pack(fill="x", padx=5, pady=5)
+        ttk.Label(filter_frame, text="Filter:", background="#ffffff").pack(side="left", padx=5)
+        self.filter_column_var = tk.StringVar(value="stock")
+        ttk.Combobox(filter_frame, textvariable=self.filter_column_var, values=TABLE_COLUMNS,
+                     state="readonly", width=12).pack(side="left", padx=5)
+        self.filter_var = tk.StringVar()
+        filter_entry = ttk.Entry(filter_frame, textvariable=self.filter_var, width=25)
+        filter_entry.pack(side="left", padx=5)
+        ttk.Label(filter_frame, text="e.g. STRONG_BUY, > 1500", background="#ffffff").pack(side="left", padx=5)
+        apply_filter = lambda *_: self.table.set_filter(self.filter_column_var.get(), self.filter_var.get())
+        filter_entry.bind("<KeyRelease>", apply_filter)
+        self.filter_column_var.trace_add("write", apply_filter)
+
+        self.table = VirtualTable(self.table_frame, self.model, TABLE_COLUMNS, tag_colors=self.tree_tag_colors,
+                                  fps=TREE_UPDATE_FPS)
+        self.table.pack(expand=True, fill="both")
+        self.tree = self.table.tree
+
+    def row_tags(self, data):
+        return [data[col] for col in ["1 Minute", "15 Minute", "1 Hour", "1 Day"] if data[col] in self.tree_tag_colors]
+
+    def table_values(self, data):
+        """A row's cells in table column order"""
+        age = row_age(data)
+        cells = ["-" if data[col] is None else data[col] for col in TABLE_COLUMNS[:-1]]
+        return cells + ["-" if age is None else int(age)]
+
+    def push_row(self, stock):
+        """Queue the model's row of a stock for the (non-virtual) table"""
+        data = self.model.row(stock, COLUMNS)
+        if data is not None:
+            self.tree_updater.push(stock, self.table_values(data), self.row_tags(data))
+
+    def load_initial_rows(self):
+        """Fill the table with the rows known at startup"""
+        if self.virtual:
+            self.table.schedule_render()
+            return
         self.tree.delete(*self.tree.get_children())
-        if os.path.exists(EXCEL_FILE):
-            try:
-                df = pd.read_excel(EXCEL_FILE)
-                for _, row in df.iterrows():
-                    values = [row[col] for col in self.tree["columns"]]
-                    tags = [row[col] for col in ["1 Minute", "15 Minute", "1 Hour", "1 Day"] if row[col] in self.tree_tag_colors]
-                    self.tree.insert("", "end", iid=row["stock"], values=values, tags=tags)
-            except Exception as e:
-                print(f"Error loading initial Excel data into Treeview: {e}")
-        else:
-            # Populate with default stocks if no Excel file exists
-            for stock in self.stock_list:
-                self.tree.insert("", "end", iid=stock, values=(stock, "-", "-", "-", "-", "-", "-", "-", "-", "-"))
-
-    def update_treeview_row(self, stock, data):
-        """Update a single row in the Treeview"""
-        values = [data[col] for col in self.tree["columns"]]
-        tags = [data[col] for col in ["1 Minute", "15 Minute", "1 Hour", "1 Day"] if data[col] in self.tree_tag_colors]
-        if self.tree.exists(stock):
-            self.tree.item(stock, values=values, tags=tags)
-        else:
-            self.tree.insert("", "end", iid=stock, values=values, tags=tags)
+        for data in self.model.rows(columns=COLUMNS):
+            self.tree.insert("", "end", iid=data["stock"], values=self.table_values(data), tags=self.row_tags(data))
+
+    def update_treeview_row(self, data):
+        """Take in a published row; safe to call from worker threads, the table is updated on the Tk thread"""
+        # A local pipeline stores its rows in the shared model itself
+        if self.feed:
+            self.model.update(data)
+        screener = self.screener
+        if screener is not None:
+            screener.update(data["stock"])
+        if not self.virtual:
+            self.push_row(data["stock"])
+
+    def refresh_ages(self):
+        """Redraw the age of the rows on screen; only cells that changed are written"""
+        if self.virtual:
+            self.table.schedule_render()
+            return
+        for stock in self.visible_stocks():
+            self.push_row(stock)
 
     def fetch_data(self):
-        """Fetch stock data for the selected stock and update UI"""
-        interval_key = self.interval_var.get()
-        tv_interval, _ = INTERVALS[interval_key]
+        """Fetch stock data for the selected stock; the row reaches the table like any other update"""
         selected_stock = self.stock_var.get()
-        
+
         try:
-            # Fetch data and update Excel and Treeview
-            data = self.update_excel(selected_stock)
-            if data:
-                self.update_treeview_row(selected_stock, data)
+            if self.feed:
+                data = self.feed.fetch(selected_stock)
+            elif self.pipeline:
+                data = self.pipeline.update_stock(selected_stock)
             else:
+                messagebox.showinfo("Starting", "The data pipeline is still loading. Try again in a moment.")
+                return
+            if not data:
                 messagebox.showerror("Error", f"No data fetched for {selected_stock}.")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to fetch data for {selected_stock}: {e}")
 
-    def update_excel(self, stock):
-        """Fetch and update Excel data for a single stock, return data for Treeview"""
+    def open_screener(self):
+        """Window listing the stocks that match a query, kept current as rows refresh"""
+        from screener import Screener, NUMERIC_COLUMNS as SCREENER_NUMERIC_COLUMNS
+
+        if self.screener_window is not None:
+            self.screener_window.lift()
+            return
+        if self.screener is None:
+            # Rows published from here on are indexed as they arrive; index the rest now
+            self.screener = Screener(self.model)
+            for stock in self.model.stocks():
+                self.screener.update(stock)
+        window = self.screener_window = tk.Toplevel(self.root)
+        window.title("Screener")
+        window.geometry("900x500")
+        window.protocol("WM_DELETE_WINDOW", self.close_screener)
+
+        query_frame = tk.Frame(window)
+        query_frame.pack(fill="x", padx=10, pady=5)
+        ttk.Label(query_frame, text="Query:").pack(side="left", padx=5)
+        self.screener_query_var = tk.StringVar(value=SCREENER_EXAMPLE)
+        query_entry = ttk.Entry(query_frame, textvariable=self.screener_query_var, width=70)
+        query_entry.pack(side="left", padx=5, fill="x", expand=True)
+        query_entry.bind("<Return>", lambda e: self.apply_screen())
+        ttk.Label(query_frame, text="Rank by:").pack(side="left", padx=5)
+        self.screener_rank_var = tk.StringVar(value="Volume Ratio")
+        ttk.Combobox(query_frame, textvariable=self.screener_rank_var, values=["-"] + SCREENER_NUMERIC_COLUMNS,
+                     state="readonly", width=12).pack(side="left", padx=5)
+        ttk.Button(query_frame, text="Apply", command=self.apply_screen).pack(side="left", padx=5)
+
+        self.screener_status_var = tk.StringVar()
+        tk.Label(window, textvariable=self.screener_status_var, fg="#555555", anchor="w").pack(fill="x", padx=10)
+
+        columns = ["stock", "CMP", "Volume", "Volume Ratio"] + INTERVAL_NAMES
+        self.screener_tree = ttk.Treeview(window, columns=columns, show="headings")
+        for col in columns:
+            self.screener_tree.heading(col, text=col)
+            self.screener_tree.column(col, width=100, anchor="center")
+        for status, color in self.tree_tag_colors.items():
+            self.screener_tree.tag_configure(status, background=color, foreground="white")
+        self.screener_tree.pack(expand=True, fill="both", padx=10, pady=10)
+
+        self.screen_conditions = None
+        self.screener_drawn = None
+        self.apply_screen()
+        self.refresh_screener()
+
+    def apply_screen(self):
+        from screener import parse_query
+
         try:
-            # Fetch latest data (using 1-minute interval for the most recent data point)
-            data = tv.get_hist(symbol=stock, exchange="NSE", interval=Interval.in_1_minute, n_bars=1)
-            if data is None or data.empty:
-                return None
-
-            latest_row = data.iloc[-1]
-
-            # Fetch Technical Analysis for all intervals
-            ta_data = {}
-            for interval_name, (_, ta_int) in INTERVALS.items():
-                stock_ta = TA_Handler(symbol=stock, screener="india", exchange="NSE", interval=ta_int)
-                analysis = stock_ta.get_analysis().summary
-                ta_data[interval_name] = analysis["RECOMMENDATION"]
-
-            # Prepare data for Excel and Treeview
-            excel_data = {
-                "stock": stock,
-                "Open": latest_row["open"],
-                "High": latest_row["high"],
-                "Low": latest_row["low"],
-                "CMP": latest_row["close"],
-                "Volume": latest_row["volume"],
-                "1 Minute": ta_data["1 Minute"],
-                "15 Minute": ta_data["15 Minute"],
-                "1 Hour": ta_data["1 Hour"],
-                "1 Day": ta_data["1 Day"]
-            }
-
-            # Update Excel file with temp file approach
-            columns = ["stock", "Open", "High", "Low", "CMP", "Volume", "1 Minute", "15 Minute", "1 Hour", "1 Day"]
-            if os.path.exists(EXCEL_FILE):
-                df = pd.read_excel(EXCEL_FILE)
-                if stock in df["stock"].values:
-                    df.loc[df["stock"] == stock, columns] = [excel_data[col] for col in columns]
-                else:
-                    df = pd.concat([df, pd.DataFrame([excel_data])], ignore_index=True)
+            conditions = parse_query(self.screener_query_var.get())
+        except ValueError as e:
+            messagebox.showerror("Screener", f"Invalid query: {e}")
+            return
+        self.screen_conditions = conditions
+        self.screener.add_screen("window", conditions)
+        self.screener_drawn = None
+
+    def refresh_screener(self):
+        """Redraw the screener results when any row changed since the last draw"""
+        if self.screener_window is None:
+            return
+        state = (self.screener.version, self.screen_conditions, self.screener_rank_var.get())
+        if self.screen_conditions is not None and state != self.screener_drawn:
+            self.screener_drawn = state
+            rank_by = self.screener_rank_var.get()
+            stocks = self.screener.query(self.screen_conditions, rank_by=None if rank_by == "-" else rank_by,
+                                         limit=SCREENER_LIMIT)
+            matches = len(self.screener.screens["window"].matches)
+            self.screener_status_var.set(f"{matches} of {self.screener.size} stocks match")
+            self.screener_tree.delete(*self.screener_tree.get_children())
+            for stock in stocks:
+                row = self.screener.row(stock)
+                values = [stock] + ["-" if row[col] is None else row[col] for col in ("CMP", "Volume")]
+                ratio = row["Volume Ratio"]
+                values.append("-" if ratio is None else f"{ratio:.2f}")
+                values += [row[col] or "-" for col in INTERVAL_NAMES]
+                self.screener_tree.insert("", "end", values=values, tags=self.row_tags(row))
+        self.root.after(SCREENER_REFRESH_MS, self.refresh_screener)
+
+    def close_screener(self):
+        self.screener.remove_screen("window")
+        self.screener_window.destroy()
+        self.screener_window = None
+
+    def warn_excel_locked(self):
+        """Tell the user the workbook is locked; updates stay queued until it is closed"""
+        self.root.after(0, lambda: messagebox.showwarning(
+            "File Locked",
+            f"Cannot update {EXCEL_FILE} because it is open in another program. Updates will be saved once it is closed."
+        ))
+
+    def visible_stocks(self):
+        """Stocks whose rows are currently on screen"""
+        if self.virtual:
+            return self.table.visible_ids()
+        return [iid for iid in self.tree.get_children() if self.tree.bbox(iid)]
+
+    def refresh_status(self):
+        """Show cache hit/miss statistics (or the feed connection) in the status line and update row ages once a second"""
+        if self.feed:
+            state = "connected to" if self.feed.connected else "reconnecting to"
+            self.status_var.set(f"Feed: {state} {self.feed_url}, {self.feed.received} rows received")
+        elif self.pipeline:
+            # Rows on screen are refreshed every cycle, ahead of the rest
+            self.pipeline.scheduler.set_visible(self.visible_stocks())
+            stats = self.pipeline.cache.stats()
+            self.status_var.set(
+                f"Cache: {stats['hits']} hits, {stats['misses']} misses, {stats['deduplicated']} shared in-flight, "
+                f"{stats['hit_ratio']:.0%} hit ratio, {stats['size']} entries"
+            )
+        else:
+            self.status_var.set("Loading the data pipeline...")
+        self.refresh_ages()
+        if self.running:
+            self.root.after(1000, self.refresh_status)
+
+    def build_metrics_tab(self):
+        frame = tk.Frame(self.notebook, bg="#ffffff", bd=2, relief="groove")
+        self.notebook.add(frame, text="Metrics")
+        columns = ["Metric", "Labels", "Count", "Mean", "p50", "p99", "Max / Value"]
+        self.metrics_tree = ttk.Treeview(frame, columns=columns, show="headings")
+        for col in columns:
+            self.metrics_tree.heading(col, text=col)
+            self.metrics_tree.column(col, width=180 if col in ("Metric", "Labels") else 90,
+                                     anchor="w" if col in ("Metric", "Labels") else "e")
+        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=self.metrics_tree.yview)
+        self.metrics_tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        self.metrics_tree.pack(side="left", expand=True, fill="both")
+
+    def refresh_metrics(self):
+        """Redraw the metrics tab: stage latencies (ms), counters and gauges, and the slowest stocks"""
+        counters, gauges, histograms = METRICS.summary()
+        ms = lambda seconds: "-" if seconds is None else f"{seconds * 1000:.1f}"
+        labels = lambda key: ", ".join(f"{k}={v}" for k, v in key)
+        rows = []
+        for (name, key), h in sorted(histograms.items()):
+            rows.append((name + " (ms)", labels(key), h["count"], ms(h["mean"]), ms(h["p50"]), ms(h["p99"]), ms(h["max"])))
+        stocks = []
+        for (name, key), value in sorted(counters.items()) + sorted(gauges.items()):
+            if name == "symbol_last_latency_seconds":
+                stocks.append((value, (name + " (ms)", labels(key), "", "", "", "", ms(value))))
             else:
-                df = pd.DataFrame([excel_data], columns=columns)
-
-            # Write to a temporary file first
-            with pd.ExcelWriter(TEMP_FILE, engine='openpyxl') as writer:
-                df.to_excel(writer, index=False)
-
-            # Attempt to replace the original file
-            max_retries = 5
-            for attempt in range(max_retries):
-                try:
-                    shutil.move(TEMP_FILE, EXCEL_FILE)
-                    break
-                except PermissionError:
-                    if attempt == max_retries - 1:
-                        self.root.after(0, lambda: messagebox.showwarning(
-                            "File Locked",
-                            f"Cannot update {EXCEL_FILE} because it is open in another program. Please close it to allow updates."
-                        ))
-                    time.sleep(2)
-
-            return excel_data
+                rows.append((name, labels(key), "", "", "", "", f"{value:g}"))
+        stocks.sort(key=lambda item: item[0], reverse=True)
+        rows += [row for _, row in stocks[:METRICS_SLOWEST_STOCKS]]
 
-        except Exception as e:
-            print(f"Error updating {stock}: {e}")
-            return None
-
-    def auto_update_excel(self):
-        """Automatically update Excel and Treeview row by row every minute"""
-        while self.running:
-            for stock in self.stock_list:
-                data = self.update_excel(stock)
-                if data:
-                    self.update_treeview_row(stock, data)
-                time.sleep(1)  # Small delay between stocks to avoid overwhelming the API
-            time.sleep(60 - len(self.stock_list))  # Adjust sleep to total 60 seconds
+        self.metrics_tree.delete(*self.metrics_tree.get_children())
+        for row in rows:
+            self.metrics_tree.insert("", "end", values=row)
+        if self.running:
+            self.root.after(METRICS_REFRESH_MS, self.refresh_metrics)
 
     def on_closing(self):
         """Handle window close event"""
-        self.running = False
+        with self.pipeline_lock:
+            self.running = False
+        if self.virtual:
+            self.table.stop()
+        else:
+            self.tree_updater.stop()
+            METRICS.remove_collector("treeview")
+        if self.feed:
+            self.feed.stop()
+        elif self.pipeline:
+            self.pipeline.stop()
         self.root.destroy()
 
 # Run the Tkinter App
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NSE stock data dashboard")
+    parser.add_argument("--feed", help="URL of a running stock_service.py to view, e.g. http://127.0.0.1:8765; "
+                                       "without it the dashboard fetches data itself")
+    parser.add_argument("--processes", type=int,
+                        help="worker processes to shard the watchlist across (0 = fetch in this process; "
+                             "default FETCH_PROCESSES in stock_service.py)")
+    parser.add_argument("--stream", action="store_true", default=None,
+                        help="stream live quotes over TradingView's websocket instead of polling bars")
+    parser.add_argument("--sinks", nargs="+", choices=["xlsx", "csv", "parquet", "sqlite"],
+                        help="outputs to write rows to, next to the workbook (default OUTPUT_SINKS in stock_service.py)")
+    parser.add_argument("--metrics", action="store_true", help="show a live metrics tab next to the table")
+    parser.add_argument("--metrics-file", help="write the metrics to this file every few seconds")
+    parser.add_argument("--metrics-port", type=int,
+                        help="serve the metrics for Prometheus at http://127.0.0.1:PORT/metrics")
+    args = parser.parse_args()
+
+    metrics_writer = None
+    if args.metrics_file:
+        metrics_writer = MetricsFileWriter(path=args.metrics_file, interval=METRICS_FILE_INTERVAL)
+        metrics_writer.start()
+    metrics_server = None
+    if args.metrics_port:
+        metrics_server = MetricsServer(port=args.metrics_port)
+        metrics_server.start()
     root = tk.Tk()
-    app = TradingViewApp(root)
+    app = TradingViewApp(root, feed_url=args.feed, processes=args.processes, stream=args.stream,
+                         show_metrics=args.metrics, sinks=args.sinks)
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
-    root.mainloop()
\ No newline at end of file
+    root.mainloop()
+    if metrics_writer:
+        metrics_writer.stop()
+    if metrics_server:
+        metrics_server.stop()
\ No newline at end of file
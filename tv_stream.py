@@ -0,0 +1,216 @@
+import json
+import random
+import re
+import string
+import threading
+import time
+import numpy as np
+from websocket import create_connection
+from bar_store import BAR_DTYPE
+
+# Same endpoint and origin TvDatafeed uses
+TV_WS_URL = "wss://data.tradingview.com/socket.io/websocket"
+TV_WS_HEADERS = ["Origin: https://data.tradingview.com"]
+
+# Quote fields requested per symbol; updates only carry the fields that changed
+QUOTE_FIELDS = ["lp", "lp_time", "volume", "open_price", "high_price", "low_price", "prev_close_price", "ch", "chp"]
+
+# Symbols multiplexed over one websocket; larger watchlists open more connections
+SYMBOLS_PER_CONNECTION = 400
+# TradingView sends a heartbeat about every 10 seconds, so silence longer than
+# this means the connection is gone (seconds)
+STREAM_TIMEOUT = 30
+RECONNECT_DELAY = 1
+MAX_RECONNECT_DELAY = 60
+
+FRAME_SPLIT = re.compile(r"~m~\d+~m~")
+
+
+def encode_message(func, params):
+    """Frame a TradingView socket message"""
+    payload = json.dumps({"m": func, "p": params}, separators=(",", ":"))
+    return f"~m~{len(payload)}~m~{payload}"
+
+
+def _record(bar):
+    """Detached copy of a 0-d bar array as a single BAR_DTYPE record"""
+    return bar.copy()[()]
+
+
+def _session_id(prefix):
+    return prefix + "".join(random.choice(string.ascii_lowercase) for _ in range(12))
+
+
+class BarAggregator:
+    """Builds OHLCV bars from streamed quotes, one forming bar per symbol.
+
+    Quotes carry the session's cumulative volume, so a bar's volume is the growth
+    of that total since the bar opened.
+    """
+
+    def __init__(self, interval_seconds=60):
+        self.interval_seconds = interval_seconds
+        self.bars = {}
+        self.volume_base = {}
+        self.lock = threading.Lock()
+
+    def update(self, symbol, price, cumulative_volume, ts):
+        """Fold one trade into the symbol's bar; returns (forming bar, bar just closed or None).
+
+        ts is in the bar store's convention (see bar_store.exchange_seconds).
+        """
+        bucket = int(ts) - int(ts) % self.interval_seconds
+        with self.lock:
+            bar = self.bars.get(symbol)
+            base = self.volume_base.get(symbol)
+            closed = None
+            if bar is None or bucket > bar["ts"]:
+                if bar is not None:
+                    closed = _record(bar)
+                    # The new bar starts where the previous one's volume ended
+                    base += bar["volume"]
+                bar = np.zeros((), dtype=BAR_DTYPE)
+                bar["ts"] = bucket
+                bar["open"] = bar["high"] = bar["low"] = price
+            elif bucket < bar["ts"]:
+                return _record(bar), None  # Late quote for a bar already closed
+            if base is None or cumulative_volume < base:
+                # First quote, or the cumulative volume restarted with a new session
+                base = cumulative_volume
+            bar["high"] = max(bar["high"], price)
+            bar["low"] = min(bar["low"], price)
+            bar["close"] = price
+            bar["volume"] = cumulative_volume - base
+            self.bars[symbol] = bar
+            self.volume_base[symbol] = base
+            return _record(bar), closed
+
+    def current(self, symbol):
+        """The forming bar for a symbol, or None"""
+        with self.lock:
+            bar = self.bars.get(symbol)
+            return None if bar is None else _record(bar)
+
+
+class _QuoteConnection:
+    """One websocket carrying a quote session for a slice of the watchlist"""
+
+    def __init__(self, symbols, on_quote):
+        self.symbols = list(symbols)
+        self.on_quote = on_quote
+        self.connected = False
+        self.running = False
+        self.ws = None
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        ws = self.ws
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception:
+                pass
+
+    def _subscribe(self, ws):
+        session = _session_id("qs_")
+        ws.send(encode_message("set_auth_token", ["unauthorized_user_token"]))
+        ws.send(encode_message("quote_create_session", [session]))
+        ws.send(encode_message("quote_set_fields", [session] + QUOTE_FIELDS))
+        ws.send(encode_message("quote_add_symbols", [session] + self.symbols))
+
+    def _run(self):
+        delay = RECONNECT_DELAY
+        while self.running:
+            try:
+                self.ws = create_connection(TV_WS_URL, header=TV_WS_HEADERS, timeout=STREAM_TIMEOUT)
+                self._subscribe(self.ws)
+                self.connected = True
+                delay = RECONNECT_DELAY
+                while self.running:
+                    self._handle(self.ws, self.ws.recv())
+            except Exception as e:
+                if self.running:
+                    print(f"Quote stream for {len(self.symbols)} symbols dropped: {e}")
+            finally:
+                self.connected = False
+                if self.ws is not None:
+                    try:
+                        self.ws.close()
+                    except Exception:
+                        pass
+                    self.ws = None
+            if self.running:
+                time.sleep(delay + random.uniform(0, delay))
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    def _handle(self, ws, text):
+        for payload in FRAME_SPLIT.split(text):
+            if not payload:
+                continue
+            if payload.startswith("~h~"):
+                # Heartbeats must be echoed or the server closes the socket
+                ws.send(f"~m~{len(payload)}~m~{payload}")
+                continue
+            try:
+                message = json.loads(payload)
+            except ValueError:
+                continue
+            if not isinstance(message, dict) or message.get("m") != "qsd":
+                continue
+            data = message["p"][1]
+            if data.get("s") == "ok":
+                self.on_quote(data["n"], data.get("v", {}))
+
+
+class QuoteStream:
+    """Persistent TradingView quote subscription for a whole watchlist.
+
+    Symbols are multiplexed SYMBOLS_PER_CONNECTION to a websocket. Each connection
+    reconnects on its own with backoff; is_live() tells callers which symbols are
+    currently being streamed, so they can poll the others instead.
+    on_quote(symbol, fields) receives the merged latest fields of a symbol on
+    every update, from the connection's thread.
+    """
+
+    def __init__(self, symbols, on_quote, exchange="NSE"):
+        self.exchange = exchange
+        self.on_quote = on_quote
+        self.quotes = {}
+        self.lock = threading.Lock()
+        tickers = [f"{exchange}:{symbol}" for symbol in symbols]
+        self.connections = [
+            _QuoteConnection(tickers[i:i + SYMBOLS_PER_CONNECTION], self._on_quote)
+            for i in range(0, len(tickers), SYMBOLS_PER_CONNECTION)
+        ]
+        self.connection_of = {symbol: self.connections[i // SYMBOLS_PER_CONNECTION]
+                              for i, symbol in enumerate(symbols)}
+
+    def _on_quote(self, ticker, fields):
+        symbol = ticker.split(":", 1)[-1]
+        with self.lock:
+            quote = self.quotes.setdefault(symbol, {})
+            quote.update(fields)
+            quote = dict(quote)
+        self.on_quote(symbol, quote)
+
+    def start(self):
+        for connection in self.connections:
+            connection.start()
+
+    def stop(self):
+        for connection in self.connections:
+            connection.stop()
+
+    def is_live(self, symbol):
+        connection = self.connection_of.get(symbol)
+        return connection is not None and connection.connected
+
+    @property
+    def connected(self):
+        return bool(self.connections) and all(connection.connected for connection in self.connections)
@@ -0,0 +1,117 @@
+import queue
+import threading
+import time
+
+
+class TreeviewUpdater:
+    """Thread-safe row updates for a ttk.Treeview, applied on the Tk thread.
+
+    Any thread may call push(). A single root.after loop drains the queue once per
+    frame, keeps only the newest update for each row, and writes just the cells
+    and tags that differ from what is already shown. Work left over when a frame
+    runs past its budget carries over to the next frame.
+    """
+
+    def __init__(self, root, tree, fps=30, max_pending=10000):
+        self.root = root
+        self.tree = tree
+        self.columns = list(tree["columns"])
+        self.frame_ms = max(1, int(1000 / fps))
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.backlog = {}
+        self.shown = {}
+        self.lock = threading.Lock()
+        self.counters = {
+            "pushed": 0,
+            "dropped": 0,
+            "coalesced": 0,
+            "applied": 0,
+            "unchanged": 0,
+            "cells_written": 0,
+            "frames": 0,
+            "frame_time_total": 0.0,
+            "frame_time_max": 0.0,
+        }
+        self.running = False
+
+    def push(self, iid, values, tags=()):
+        """Queue a full row (values in column order); safe to call from any thread"""
+        with self.lock:
+            self.counters["pushed"] += 1
+        try:
+            self.queue.put_nowait((iid, tuple(values), tuple(tags)))
+        except queue.Full:
+            with self.lock:
+                self.counters["dropped"] += 1
+
+    def start(self):
+        self.running = True
+        self.root.after(self.frame_ms, self._drain)
+
+    def stop(self):
+        self.running = False
+
+    def stats(self):
+        """Snapshot of the counters, plus the average frame time in seconds"""
+        with self.lock:
+            stats = dict(self.counters)
+        stats["frame_time_avg"] = stats["frame_time_total"] / stats["frames"] if stats["frames"] else 0.0
+        stats["pending"] = self.queue.qsize() + len(self.backlog)
+        return stats
+
+    def _drain(self):
+        if not self.running:
+            return
+        started = time.perf_counter()
+        budget = self.frame_ms / 1000
+        coalesced = applied = unchanged = cells = 0
+
+        while True:
+            try:
+                iid, values, tags = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if iid in self.backlog:
+                coalesced += 1
+            self.backlog[iid] = (values, tags)
+
+        while self.backlog and time.perf_counter() - started < budget:
+            iid, (values, tags) = next(iter(self.backlog.items()))
+            del self.backlog[iid]
+            written = self._apply(iid, values, tags)
+            if written:
+                applied += 1
+                cells += written
+            else:
+                unchanged += 1
+
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            c = self.counters
+            c["coalesced"] += coalesced
+            c["applied"] += applied
+            c["unchanged"] += unchanged
+            c["cells_written"] += cells
+            c["frames"] += 1
+            c["frame_time_total"] += elapsed
+            c["frame_time_max"] = max(c["frame_time_max"], elapsed)
+        self.root.after(max(1, self.frame_ms - int(elapsed * 1000)), self._drain)
+
+    def _apply(self, iid, values, tags):
+        """Write the changed cells of one row; returns how many cells/tags were written"""
+        if not self.tree.exists(iid):
+            self.tree.insert("", "end", iid=iid, values=values, tags=tags)
+            self.shown[iid] = (values, tags)
+            return len(values)
+        shown_values, shown_tags = self.shown.get(iid) or (tuple(self.tree.item(iid, "values")), None)
+        written = 0
+        for col, old, new in zip(self.columns, shown_values, values):
+            # Cells loaded straight into the tree come back as strings
+            if old != new and str(old) != str(new):
+                self.tree.set(iid, col, new)
+                written += 1
+        if tags != shown_tags:
+            self.tree.item(iid, tags=tags)
+            written += 1
+        self.shown[iid] = (values, tags)
+        return written
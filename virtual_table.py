@@ -0,0 +1,225 @@
+import operator
+import time
+import tkinter as tk
+from tkinter import ttk
+import numpy as np
+
+
+# Filter expressions typed into the filter box, e.g. ">= 1500" or "STRONG_BUY"
+FILTER_OPERATORS = {
+    ">=": operator.ge, "<=": operator.le, "!=": operator.ne,
+    ">": operator.gt, "<": operator.lt, "=": operator.eq,
+}
+
+
+def filter_mask(values, expression, numeric=False):
+    """Boolean mask over a column's values for a simple filter expression"""
+    expression = expression.strip()
+    if not expression:
+        return np.ones(len(values), dtype=bool)
+    for symbol, op in FILTER_OPERATORS.items():
+        if expression.startswith(symbol):
+            operand = expression[len(symbol):].strip()
+            if numeric:
+                try:
+                    with np.errstate(invalid="ignore"):
+                        return op(values, float(operand))
+                except ValueError:
+                    return np.zeros(len(values), dtype=bool)
+            return np.array([op(str(v), operand) for v in values], dtype=bool)
+    if numeric:
+        return filter_mask(values, "=" + expression, numeric)
+    needle = expression.upper()
+    return np.array([needle in str(v).upper() for v in values], dtype=bool)
+
+
+class VirtualTable:
+    """A Treeview that only materializes the visible window of rows of a WatchlistModel.
+
+    The widget always holds as many items as fit on screen. Scrolling, sorting and
+    filtering only change which model slots those items show, so building and
+    scrolling cost the same for 20 or 20,000 rows. The table keeps no copy of the
+    data: it polls the model's version once per frame and repaints the visible
+    slots straight from the model's arrays when anything changed.
+    """
+
+    def __init__(self, parent, model, columns, tag_colors=None, column_width=100, height=15, fps=30):
+        self.model = model
+        self.columns = list(columns)
+        self.tag_colors = tag_colors or {}
+        self.frame = tk.Frame(parent, bg="#ffffff")
+        self.tree = ttk.Treeview(self.frame, columns=columns, show="headings", height=height)
+        for col in columns:
+            self.tree.heading(col, text=col, command=lambda c=col: self.sort_by(c))
+            self.tree.column(col, width=column_width, anchor="center")
+        for status, color in self.tag_colors.items():
+            self.tree.tag_configure(status, background=color, foreground="white")
+
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self._on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", expand=True, fill="both")
+
+        self.visible_rows = height
+        self.offset = 0
+        self.sort_column = None
+        self.sort_descending = False
+        self.filter = None
+        self.view = np.arange(0)
+        self.view_version = -1
+        self.drawn_version = -1
+        self.render_pending = False
+        self.frame_ms = max(1, int(1000 / fps))
+        self.running = False
+
+        self.tree.bind("<MouseWheel>", self._on_mousewheel)
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll(3))
+        self.tree.bind("<Configure>", self._on_resize)
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    # Model updates
+
+    def start(self):
+        """Repaint whenever the model changes, checked once per frame"""
+        self.running = True
+        self.tree.after(self.frame_ms, self._poll)
+
+    def stop(self):
+        self.running = False
+
+    def _poll(self):
+        if not self.running:
+            return
+        if self.model.version != self.drawn_version:
+            self.schedule_render()
+        self.tree.after(self.frame_ms, self._poll)
+
+    def schedule_render(self):
+        if not self.render_pending:
+            self.render_pending = True
+            self.tree.after_idle(self.render)
+
+    # Columns: "Age (s)" is derived from the model's "Updated" times
+
+    def _is_numeric(self, col):
+        return col == "Age (s)" or col in self.model.numbers
+
+    def _values(self, col):
+        """A column's live values; recommendation columns are codes, which sort by strength"""
+        if col == "Age (s)":
+            return time.time() - self.model.column("Updated")
+        return self.model.column(col)
+
+    def _cells(self, slot):
+        row = self.model.rows([slot], [col for col in self.columns if col != "Age (s)"])[0]
+        cells = []
+        for col in self.columns:
+            if col == "Age (s)":
+                updated = self.model.updated[slot]
+                value = None if np.isnan(updated) else max(0, int(time.time() - updated))
+            else:
+                value = row[col]
+            cells.append("-" if value is None else value)
+        tags = [row[col] for col in self.model.codes if row.get(col) in self.tag_colors]
+        return cells, tags
+
+    # View: filter, sort and window
+
+    def set_filter(self, col, expression):
+        self.filter = (col, expression) if expression.strip() else None
+        self.view_version = -1
+        self.offset = 0
+        self.schedule_render()
+
+    def sort_by(self, col):
+        """Sort by a column; clicking the same heading again reverses the order"""
+        if self.sort_column == col:
+            self.sort_descending = not self.sort_descending
+        else:
+            self.sort_column, self.sort_descending = col, False
+        self.view_version = -1
+        self.schedule_render()
+
+    def _rebuild_view(self):
+        model = self.model
+        version = model.version
+        size = len(model)
+        slots = np.arange(size)
+        if self.filter is not None:
+            col, expression = self.filter
+            values = model.decoded(col) if col in model.codes else self._values(col)
+            slots = slots[filter_mask(values[:size], expression, self._is_numeric(col))]
+        if self.sort_column is not None:
+            col = self.sort_column
+            values = self._values(col)[slots]
+            if self._is_numeric(col):
+                # NaNs sort last either way
+                keys = np.where(np.isnan(values), np.inf, -values if self.sort_descending else values)
+                order = np.argsort(keys, kind="stable")
+            else:
+                order = np.argsort(values if col in model.codes else values.astype(str), kind="stable")
+                if self.sort_descending:
+                    order = order[::-1]
+            slots = slots[order]
+        self.view = slots
+        self.view_version = version
+
+    def visible_ids(self):
+        """Stocks of the rows currently on screen"""
+        return [self.model.ids[slot] for slot in self.view[self.offset:self.offset + self.visible_rows]]
+
+    def scroll(self, rows):
+        self.offset += rows
+        self.schedule_render()
+
+    def render(self):
+        """Repaint the visible slots from the model"""
+        self.render_pending = False
+        self.drawn_version = self.model.version
+        ordered = self.sort_column is not None or self.filter is not None
+        if (self.view_version == -1
+                or (ordered and self.model.version != self.view_version)
+                or (not ordered and len(self.view) != len(self.model))):
+            self._rebuild_view()
+
+        total = len(self.view)
+        self.offset = max(0, min(self.offset, total - self.visible_rows))
+        window = self.view[self.offset:self.offset + self.visible_rows]
+
+        items = self.tree.get_children()
+        for i, slot in enumerate(window):
+            values, tags = self._cells(slot)
+            if i < len(items):
+                self.tree.item(items[i], values=values, tags=tags)
+            else:
+                self.tree.insert("", "end", values=values, tags=tags)
+        for item in items[len(window):]:
+            self.tree.delete(item)
+
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + self.visible_rows) / total))
+        else:
+            self.scrollbar.set(0, 1)
+
+    # Scrolling and resizing
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.offset = int(float(amount) * len(self.view))
+        elif action == "scroll":
+            step = self.visible_rows if unit == "pages" else 1
+            self.offset += int(amount) * step
+        self.schedule_render()
+
+    def _on_mousewheel(self, event):
+        self.scroll(-3 if event.delta > 0 else 3)
+        return "break"
+
+    def _on_resize(self, event):
+        row_height = ttk.Style().lookup("Treeview", "rowheight") or 20
+        rows = max(1, (event.height - 25) // int(row_height))
+        if rows != self.visible_rows:
+            self.visible_rows = rows
+            self.schedule_render()
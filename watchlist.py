@@ -0,0 +1,151 @@
+import json
+import os
+import tempfile
+from datetime import datetime
+from market_hours import IST
+
+# Excel file name and sheet columns
+EXCEL_FILE = "stock_data.xlsx"
+INTERVAL_NAMES = ["1 Minute", "15 Minute", "1 Hour", "1 Day"]
+# "Updated" is when every value in the row was last fetched successfully; a row
+# whose refresh failed keeps its old values and its old time
+COLUMNS = ["stock", "Open", "High", "Low", "CMP", "Volume"] + INTERVAL_NAMES + ["Updated"]
+
+# Watchlist used when the Excel file has none
+DEFAULT_STOCKS = ["RELIANCE", "TCS", "HDFCBANK", "INFY", "SBIN",
+                  "ICICIBANK", "HINDUNILVR", "KOTAKBANK", "LT", "BAJFINANCE"]
+
+
+def updated_now():
+    """Value for a freshly fetched row's "Updated" column"""
+    return datetime.now(IST).isoformat(timespec="seconds")
+
+
+def parse_updated(value):
+    """An "Updated" value as seconds since the epoch, or None if there is none"""
+    try:
+        updated = datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    if updated.tzinfo is None:
+        updated = updated.replace(tzinfo=IST)
+    return updated.timestamp()
+
+
+def format_updated(timestamp):
+    """Seconds since the epoch as an "Updated" value"""
+    return datetime.fromtimestamp(timestamp, IST).isoformat(timespec="seconds")
+
+
+def row_age(row, now=None):
+    """Seconds since the row was last fetched in full, or None if that is unknown"""
+    updated = parse_updated(row.get("Updated"))
+    if updated is None:
+        return None
+    return max(0.0, (now or datetime.now(IST)).timestamp() - updated)
+
+
+def sidecar_path(path):
+    """JSON copy of the workbook's rows, kept next to it"""
+    return os.path.splitext(path)[0] + ".rows.json"
+
+
+def _signature(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _json_default(value):
+    # NumPy scalars and the like
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def read_sidecar(path):
+    """Rows saved alongside the workbook, or None if there are none or the workbook changed since"""
+    try:
+        with open(sidecar_path(path), encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("signature") == _signature(path):
+            return data["rows"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def write_sidecar(path, rows):
+    """Save rows as the sidecar of the workbook as it is on disk right now"""
+    data = {"signature": _signature(path), "rows": rows}
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, default=_json_default, separators=(",", ":"))
+        os.replace(temp_path, sidecar_path(path))
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def read_workbook(path):
+    """Every row of the workbook's active sheet as a {header: value} dict"""
+    # openpyxl takes a while to import, so only load it when the sidecar is stale
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        return [dict(zip(header, values)) for values in rows]
+    finally:
+        wb.close()
+
+
+def load_rows(path=EXCEL_FILE):
+    """The workbook's rows, in sheet order.
+
+    Comes from the sidecar when it matches the workbook; otherwise the workbook is
+    parsed (once) and the sidecar rewritten for the next start.
+    """
+    if not os.path.exists(path):
+        return []
+    rows = read_sidecar(path)
+    if rows is not None:
+        return rows
+    try:
+        rows = [row for row in read_workbook(path) if row.get("stock") is not None]
+    except Exception as e:
+        print(f"Error loading {path}: {e}")
+        return []
+    try:
+        write_sidecar(path, rows)
+    except Exception as e:
+        print(f"Error writing {sidecar_path(path)}: {e}")
+    return rows
+
+
+def stocks_in(rows):
+    """Unique stocks of the rows in order, or the default list if there are none"""
+    stocks = list(dict.fromkeys(row["stock"] for row in rows if row.get("stock") is not None))
+    return stocks or list(DEFAULT_STOCKS)
+
+
+def load_watchlist(path=EXCEL_FILE):
+    """Load the stock list from the first column of the Excel file, or the default list"""
+    return stocks_in(load_rows(path))
+
+
+def display_rows(rows, stocks, columns=COLUMNS):
+    """Rows ready to show: one per stock (the latest given), then placeholders for stocks
+    without a row, with "-" for missing values"""
+    latest = {}
+    for row in rows:
+        latest[row["stock"]] = row
+    shown = [{col: row.get(col) for col in columns} for row in latest.values()]
+    shown += [dict({col: None for col in columns}, stock=stock) for stock in stocks if stock not in latest]
+    for row in shown:
+        for col, value in row.items():
+            if value is None:
+                row[col] = "-"
+    return shown
@@ -0,0 +1,199 @@
+import math
+import threading
+import numpy as np
+from watchlist import COLUMNS, INTERVAL_NAMES, parse_updated, format_updated
+
+# Row fields kept as float64 columns (NaN when missing). Avg Volume is not saved
+# to the sheet but travels with published rows.
+NUMERIC_COLUMNS = ["Open", "High", "Low", "CMP", "Volume", "Avg Volume"]
+# Numeric columns handed back as ints
+INTEGER_COLUMNS = ["Volume"]
+# Recommendation columns are stored as int8 codes into RECOMMENDATIONS. Code 0 is
+# a missing value and the rest run from most bearish to most bullish, so codes
+# sort and compare in a meaningful order. Other labels get codes as they appear.
+RECOMMENDATION_COLUMNS = list(INTERVAL_NAMES)
+RECOMMENDATIONS = ["-", "STRONG_SELL", "SELL", "NEUTRAL", "BUY", "STRONG_BUY"]
+# Every field of a row, in the order rows are rebuilt
+ROW_COLUMNS = COLUMNS + ["Avg Volume"]
+
+
+class WatchlistModel:
+    """The one in-memory copy of the watchlist: a NumPy array per column and a stock->slot index.
+
+    A stock keeps its slot (its sheet position) for its whole lifetime, so an
+    update is a handful of array writes. Every update stamps the slot with a new
+    version, which lets the Excel writer find the rows changed since it last
+    wrote. The pipeline, the Excel writer, the table and the screener all read
+    the same arrays; rows are only turned back into dicts at the edges (the
+    feed, the sidecar and subscribers).
+    """
+
+    def __init__(self, capacity=1024):
+        self.lock = threading.Lock()
+        self.size = 0
+        self.ids = np.empty(capacity, dtype=object)
+        self.index = {}
+        self.numbers = {col: np.full(capacity, np.nan) for col in NUMERIC_COLUMNS}
+        self.codes = {col: np.zeros(capacity, dtype=np.int8) for col in RECOMMENDATION_COLUMNS}
+        # Seconds since the epoch of the row's "Updated" time
+        self.updated = np.full(capacity, np.nan)
+        self.row_versions = np.zeros(capacity, dtype=np.int64)
+        self.labels = list(RECOMMENDATIONS)
+        self.label_codes = {label: code for code, label in enumerate(self.labels)}
+        self.label_array = np.array(self.labels, dtype=object)
+        self.version = 0
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, stock):
+        return stock in self.index
+
+    def _grow(self):
+        capacity = len(self.ids) * 2
+        grown = np.empty(capacity, dtype=object)
+        grown[:self.size] = self.ids[:self.size]
+        self.ids = grown
+        for col, values in self.numbers.items():
+            self.numbers[col] = np.concatenate([values, np.full(len(values), np.nan)])
+        for col, values in self.codes.items():
+            self.codes[col] = np.concatenate([values, np.zeros(len(values), dtype=np.int8)])
+        self.updated = np.concatenate([self.updated, np.full(len(self.updated), np.nan)])
+        self.row_versions = np.concatenate([self.row_versions, np.zeros(len(self.row_versions), dtype=np.int64)])
+
+    def _code(self, label):
+        if label is None:
+            return 0
+        code = self.label_codes.get(label)
+        if code is None:
+            code = self.label_codes[label] = len(self.labels)
+            self.labels.append(label)
+            self.label_array = np.array(self.labels, dtype=object)
+        return code
+
+    @staticmethod
+    def _number(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return math.nan
+
+    def _slot_for(self, stock):
+        slot = self.index.get(stock)
+        if slot is None:
+            if self.size == len(self.ids):
+                self._grow()
+            slot = self.index[stock] = self.size
+            self.ids[slot] = stock
+            self.size += 1
+        return slot
+
+    def update(self, row):
+        """Store a row (a dict with some or all of ROW_COLUMNS); fields it lacks keep their value.
+
+        Returns the stock's slot.
+        """
+        with self.lock:
+            slot = self._slot_for(row["stock"])
+            for col in NUMERIC_COLUMNS:
+                if col in row:
+                    self.numbers[col][slot] = self._number(row[col])
+            for col in RECOMMENDATION_COLUMNS:
+                if col in row:
+                    self.codes[col][slot] = self._code(row[col])
+            if "Updated" in row:
+                updated = parse_updated(row["Updated"]) if row["Updated"] is not None else None
+                self.updated[slot] = math.nan if updated is None else updated
+            self.version += 1
+            self.row_versions[slot] = self.version
+            return slot
+
+    def load(self, rows):
+        """Store many rows at once"""
+        for row in rows:
+            if row.get("stock") is not None:
+                self.update(row)
+
+    def slot(self, stock):
+        """The stock's slot, or None"""
+        return self.index.get(stock)
+
+    def stocks(self):
+        """Every stock, in slot order"""
+        return list(self.ids[:self.size])
+
+    def _row(self, slot, columns):
+        row = {}
+        for col in columns:
+            if col == "stock":
+                row[col] = self.ids[slot]
+            elif col == "Updated":
+                updated = self.updated[slot]
+                row[col] = None if np.isnan(updated) else format_updated(updated)
+            elif col in self.codes:
+                code = self.codes[col][slot]
+                row[col] = self.labels[code] if code else None
+            else:
+                value = self.numbers[col][slot]
+                if np.isnan(value):
+                    row[col] = None
+                else:
+                    row[col] = int(value) if col in INTEGER_COLUMNS else float(value)
+        return row
+
+    def row(self, stock, columns=ROW_COLUMNS):
+        """One stock's row as a dict (None for missing values), or None if the stock is unknown"""
+        with self.lock:
+            slot = self.index.get(stock)
+            return None if slot is None else self._row(slot, columns)
+
+    def rows(self, slots=None, columns=ROW_COLUMNS):
+        """Rows as dicts, for the given slots or every row in slot order"""
+        with self.lock:
+            if slots is None:
+                slots = range(self.size)
+            return [self._row(slot, columns) for slot in slots]
+
+    def changed_since(self, version):
+        """(slots updated after version, current version)"""
+        with self.lock:
+            return np.flatnonzero(self.row_versions[:self.size] > version), self.version
+
+    def column(self, col):
+        """Live view of a column: floats for numeric columns and "Updated" (epoch seconds),
+        int8 codes for recommendation columns, objects for "stock"."""
+        if col == "stock":
+            return self.ids[:self.size]
+        if col == "Updated":
+            return self.updated[:self.size]
+        if col in self.codes:
+            return self.codes[col][:self.size]
+        return self.numbers[col][:self.size]
+
+    def decoded(self, col):
+        """A recommendation column as labels ("-" where missing); a new array"""
+        return self.label_array[self.column(col)]
+
+    def code(self, label):
+        """The code of a recommendation label, or None if it never occurred"""
+        return self.label_codes.get(label)
+
+    def to_frame(self):
+        """Every row as a pandas DataFrame for export and analysis.
+
+        Numeric columns are handed over without copying where pandas allows it and
+        recommendations become Categoricals over the same codes.
+        """
+        import pandas as pd
+
+        size = self.size
+        data = {"stock": self.ids[:size]}
+        for col in COLUMNS[1:]:
+            if col in self.codes:
+                data[col] = pd.Categorical.from_codes(self.codes[col][:size].astype(np.int16) - 1, self.labels[1:])
+            elif col == "Updated":
+                data[col] = pd.to_datetime(self.updated[:size], unit="s", utc=True).tz_convert("Asia/Kolkata")
+            else:
+                data[col] = self.numbers[col][:size]
+        data["Avg Volume"] = self.numbers["Avg Volume"][:size]
+        return pd.DataFrame(data, copy=False)